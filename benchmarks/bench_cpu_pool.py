@@ -0,0 +1,122 @@
+"""
+CPU pool scaling benchmark: HTML extraction in threads vs worker processes.
+
+Extracts the text of the same set of pages with N threads (the search
+service without CPU_POOL_WORKERS) and with a CpuPool of N processes,
+for every N in --workers, and reports pages per second and the speedup
+over one thread. Threads stay flat under the GIL; processes should scale
+up to the number of cores.
+
+Pages are synthetic articles by default, or the scraped pages of a corpus
+saved by bench_search_replay.
+
+Usage (from project root):
+    python -m benchmarks.bench_cpu_pool
+    python -m benchmarks.bench_cpu_pool --workers 1,2,4,8 --pages 400
+    python -m benchmarks.bench_cpu_pool --corpus corpus.jsonl.gz
+"""
+
+import argparse
+import base64
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from benchmarks.bench_search_replay import load_corpus
+from config import Config
+from services.cpu_pool import CpuPool
+from services.search_service import SearchService
+from utils.html_extract import extract_page_text
+
+WORDS = (
+    'model server memory request latency token search result page query '
+    'cache thread process worker parser context answer history user'
+).split()
+
+
+def synthetic_page(rng: random.Random, paragraphs: int) -> bytes:
+    """Article page with navigation, scripts and a sidebar around the content"""
+    def sentence() -> str:
+        return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + '.'
+
+    body = ''.join(
+        f"<p>{' '.join(sentence() for _ in range(5))} <a href='/x{i}'>link</a></p>"
+        for i in range(paragraphs)
+    )
+    nav = ''.join(f"<li><a href='/n{i}'>{rng.choice(WORDS)}</a></li>" for i in range(50))
+    html = (
+        f"<html><head><script>var x = {rng.random()};</script><style>p {{}}</style></head>"
+        f"<body><header><ul>{nav}</ul></header>"
+        f"<main><article><h1>{sentence()}</h1>{body}</article></main>"
+        f"<aside>{sentence()}</aside><footer>{sentence()}</footer></body></html>"
+    )
+    return html.encode('utf-8')
+
+
+def load_pages(args) -> List[bytes]:
+    if args.corpus:
+        records = load_corpus(args.corpus)
+        # Scraped pages only: results pages are POSTs with a query
+        pages = [base64.b64decode(r['body']) for r in records.values() if not r['query'] and r['status'] < 400]
+        return (pages * (args.pages // max(1, len(pages)) + 1))[:args.pages] if pages else []
+    rng = random.Random(42)
+    return [synthetic_page(rng, args.paragraphs) for _ in range(args.pages)]
+
+
+def run_threads(pages: List[bytes], workers: int, parser: str, max_chars: int) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as executor:
+        list(executor.map(lambda page: extract_page_text(page, parser, max_chars), pages))
+    return time.perf_counter() - start
+
+
+def run_processes(pages: List[bytes], workers: int, parser: str, max_chars: int) -> float:
+    config = Config()
+    config.CPU_POOL_WORKERS = workers
+    pool = CpuPool(config)
+    try:
+        pool.start()
+        # Same pool for warm-up and timing: worker start-up is paid once per bot
+        pool.run(extract_page_text, pages[0], parser, max_chars)
+        start = time.perf_counter()
+        # Search threads are the callers in the bot, one per page in flight
+        with ThreadPoolExecutor(workers) as executor:
+            list(executor.map(lambda page: pool.run(extract_page_text, page, parser, max_chars), pages))
+        return time.perf_counter() - start
+    finally:
+        pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default='1,2,4', help='Comma-separated thread / process counts')
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--paragraphs', type=int, default=60, help='Paragraphs per synthetic page')
+    parser.add_argument('--corpus', help='Corpus saved by bench_search_replay instead of synthetic pages')
+    parser.add_argument('--parser', default='html.parser', help='BeautifulSoup parser')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    pages = load_pages(args)
+    if not pages:
+        print("No pages to parse")
+        return
+    max_chars = SearchService.PAGE_TEXT_CHARS
+    size = sum(len(p) for p in pages)
+    print(f"{len(pages)} pages, {size / 2**20:.1f} MiB HTML, parser={args.parser}, {os.cpu_count()} CPU(s)")
+
+    baseline = run_threads(pages, 1, args.parser, max_chars)
+    for workers in [int(w) for w in args.workers.split(',')]:
+        threads = run_threads(pages, workers, args.parser, max_chars)
+        processes = run_processes(pages, workers, args.parser, max_chars)
+        print(
+            f"{workers} worker(s): threads {len(pages) / threads:.1f} pages/s ({baseline / threads:.2f}x), "
+            f"processes {len(pages) / processes:.1f} pages/s ({baseline / processes:.2f}x)"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+History storage benchmark: disk footprint and read latency per codec.
+
+Fills message_history with synthetic chat turns (Zipf-distributed
+vocabulary, ~100 char questions and ~1200 char answers) and reports file
+size, stored bytes per turn (what has to sit in the page cache) and
+get_message_history latency.
+
+Usage (from project root):
+    python -m benchmarks.bench_history_storage --rows 1000000 --codecs none zlib zstd
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from database.db_manager import DatabaseManager
+from utils.compression import TextCompressor
+
+
+def make_vocabulary(rng: random.Random, size: int = 5000) -> list:
+    letters = 'абвгдеёжзийклмнопрстуфхцчшщыьэюяabcdefghijklmnopqrstuvwxyz'
+    return [''.join(rng.choice(letters) for _ in range(rng.randint(2, 10))) for _ in range(size)]
+
+
+def make_text(rng: random.Random, vocabulary: list, weights: list, length: int) -> str:
+    words = rng.choices(vocabulary, weights=weights, k=length // 6 + 1)
+    return ' '.join(words)[:length]
+
+
+async def fill(db: DatabaseManager, rows: int, users: int, rng: random.Random, vocabulary, weights):
+    conn = db._connection
+    batch = []
+    for i in range(rows):
+        batch.append((
+            i % users,
+            db._compressor.compress(make_text(rng, vocabulary, weights, rng.randint(20, 200))),
+            db._compressor.compress(make_text(rng, vocabulary, weights, rng.randint(300, 2500))),
+        ))
+        if len(batch) == 10000:
+            await conn.executemany(
+                "INSERT INTO message_history (user_id, user_message, bot_response) VALUES (?, ?, ?)",
+                batch
+            )
+            batch.clear()
+    if batch:
+        await conn.executemany(
+            "INSERT INTO message_history (user_id, user_message, bot_response) VALUES (?, ?, ?)",
+            batch
+        )
+    await conn.commit()
+
+
+async def run(codec: str, rows: int, users: int, reads: int, tmp: str):
+    rng = random.Random(42)
+    vocabulary = make_vocabulary(rng)
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+
+    path = os.path.join(tmp, f'history_{codec}.db')
+    db = DatabaseManager(path, compression=codec)
+    await db.init_db()
+
+    if db._compressor.enabled:
+        samples = [make_text(rng, vocabulary, weights, 1000) for _ in range(2000)]
+        data = TextCompressor.train_dictionary(db._compressor.codec, samples)
+        cursor = await db._connection.execute(
+            "INSERT INTO compression_dicts (codec, data) VALUES (?, ?)",
+            (db._compressor.codec, data)
+        )
+        await db._connection.commit()
+        db._compressor.add_dictionary(cursor.lastrowid, data, current=True)
+
+    start = time.perf_counter()
+    await fill(db, rows, users, rng, vocabulary, weights)
+    fill_time = time.perf_counter() - start
+
+    async with db._connection.execute(
+        "SELECT sum(length(user_message) + length(bot_response)) FROM message_history"
+    ) as cursor:
+        stored = (await cursor.fetchone())[0]
+
+    times = []
+    for _ in range(reads):
+        user_id = rng.randrange(users)
+        start = time.perf_counter()
+        await db.get_message_history(user_id, 20)
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+
+    await db.close()
+    size = os.path.getsize(path)
+    print(
+        f"{codec:>5}: file {size / 2**20:8.1f} MiB, {stored / rows:7.0f} B/turn stored, "
+        f"fill {fill_time:6.1f}s, get_message_history p50 {times[len(times) // 2]:.2f} ms, "
+        f"p95 {times[int(len(times) * 0.95)]:.2f} ms"
+    )
+    os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--reads', type=int, default=500)
+    parser.add_argument('--codecs', nargs='+', default=['none', 'zlib', 'zstd'])
+    parser.add_argument('--dir', default=None, help='Directory for temporary databases')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        for codec in args.codecs:
+            asyncio.run(run(codec, args.rows, args.users, args.reads, tmp))
+
+
+if __name__ == '__main__':
+    main()
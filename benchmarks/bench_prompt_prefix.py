@@ -0,0 +1,194 @@
+"""
+Prompt prefix reuse benchmark.
+
+Sends the same search-augmented questions to an Ollama server with the
+old layout (instructions wrapped around a timestamped context) and with
+the stable-prefix template, and compares prompt_eval_count and
+prompt_eval_duration reported by the server.
+
+With --fake the requests go to a stub server started by the benchmark
+instead: it keeps the tokens of the previous prompt like Ollama's KV
+cache of a single slot, evaluates only the tokens after the common
+prefix at a fixed rate and reports them the way Ollama does. No Ollama
+or GPU needed, so the layouts can be compared in CI.
+
+Usage (from project root):
+    python -m benchmarks.bench_prompt_prefix --fake
+    python -m benchmarks.bench_prompt_prefix --model qwen3:14b-q8_0 --rounds 5
+    python -m benchmarks.bench_prompt_prefix --fake --templates templates.json
+"""
+
+import argparse
+import json
+import re
+import statistics
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+import requests
+
+from config import Config
+from services.prompt_templates import get_template, load_templates
+
+QUESTIONS = [
+    "Какая погода в Москве сегодня?",
+    "Кто выиграл последний чемпионат мира по футболу?",
+    "Сколько стоит биткоин?",
+]
+
+RESULTS = (
+    "=== РЕЗУЛЬТАТЫ ПОИСКА: '{q}' ===\n\n"
+    "[Источник 1] Пример\nURL: https://example.com\nСОДЕРЖИМОЕ:\n"
+    + "Текст найденной страницы с фактами и числами. " * 40
+    + "\n=== КОНЕЦ РЕЗУЛЬТАТОВ ===\n\n"
+)
+
+
+def date_block(minute: int) -> str:
+    now = datetime.now() + timedelta(minutes=minute)
+    return f"=== ТЕКУЩАЯ ДАТА И ВРЕМЯ ===\nСегодня: {now:%d.%m.%Y}, время: {now:%H:%M}\n"
+
+
+def old_payload(model: str, question: str, minute: int) -> dict:
+    context = date_block(minute) + "\n" + RESULTS.format(q=question)
+    prompt = (
+        "Ты — универсальный и всезнающий ассистент, обладающий полной и точной информацией "
+        f"во всех областях знаний. Используй {context} как дополнительный источник, чтобы "
+        f"ответить на {question}.\n\nДай ясный, точный и максимально информативный ответ, "
+        "включая даты, числа и факты. Не добавляй неподтверждённые сведения и не рассуждай предположительно."
+    )
+    return {"model": model, "prompt": prompt}
+
+
+def new_payload(model: str, question: str, minute: int) -> dict:
+    template = get_template(model)
+    context = RESULTS.format(q=question) + date_block(minute)
+    return {
+        "model": model,
+        "system": template.search_system,
+        "prompt": template.build_search_prompt(question, context),
+    }
+
+
+class FakeOllama(ThreadingHTTPServer):
+    """Stub /api/generate with a one-slot prompt prefix cache"""
+
+    daemon_threads = True
+
+    def __init__(self, prefill_ms_per_token: float):
+        super().__init__(('127.0.0.1', 0), _FakeHandler)
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.cached: List[str] = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        return re.findall(r'\w+|[^\w\s]', text)
+
+    def evaluate(self, payload: dict) -> dict:
+        """Evaluate the prompt after the cached prefix, like a single Ollama slot"""
+        tokens = self.tokenize(payload.get('system', '') + '\n\n' + payload.get('prompt', ''))
+        with self.lock:
+            common = 0
+            for cached, token in zip(self.cached, tokens):
+                if cached != token:
+                    break
+                common += 1
+            # The last token is always evaluated, even on a full match
+            evaluated = max(1, len(tokens) - common)
+            seconds = evaluated * self.prefill_ms_per_token / 1000
+            time.sleep(seconds)
+            self.cached = tokens
+        return {
+            "model": payload.get('model', ''), "response": "", "done": True,
+            "prompt_eval_count": evaluated, "prompt_eval_duration": int(seconds * 1e9),
+            "eval_count": 1, "eval_duration": 0,
+        }
+
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        body = json.dumps(self.server.evaluate(payload)).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run(url: str, model: str, rounds: int, build, repeated: bool) -> list:
+    """
+    Send every question once per round, a minute apart.
+
+    repeated=False alternates questions (only the system text can be
+    shared); repeated=True asks each question `rounds` times in a row,
+    as regenerate and follow-ups on the same results do.
+    """
+    if repeated:
+        order = [(minute, question) for question in QUESTIONS for minute in range(rounds)]
+    else:
+        order = [(minute, question) for minute in range(rounds) for question in QUESTIONS]
+    stats = []
+    for minute, question in order:
+        payload = build(model, question, minute)
+        payload.update({"stream": False, "options": {"num_predict": 1, "num_ctx": 4096}})
+        data = requests.post(f"{url}/api/generate", json=payload, timeout=600).json()
+        stats.append((data.get('prompt_eval_count', 0), data.get('prompt_eval_duration', 0) / 1e6))
+    return stats
+
+
+def main():
+    config = Config()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=config.OLLAMA_URL)
+    parser.add_argument('--model', default=config.DEFAULT_MODEL)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--fake', action='store_true', help='Run against a stub server instead of Ollama')
+    parser.add_argument('--prefill-ms', type=float, default=0.5, help='Stub prompt eval time per token (ms)')
+    parser.add_argument('--templates', help='Prompt templates file, as PROMPT_TEMPLATES_FILE')
+    args = parser.parse_args()
+
+    if args.templates:
+        load_templates(args.templates)
+    print(f"Template: {get_template(args.model).version}")
+
+    fake = None
+    if args.fake:
+        fake = FakeOllama(args.prefill_ms)
+        threading.Thread(target=fake.serve_forever, daemon=True).start()
+        args.url = fake.url
+
+    try:
+        # Load model so the first measured request does not include loading
+        requests.post(f"{args.url}/api/generate", json={"model": args.model}, timeout=600)
+
+        for repeated in (False, True):
+            print("Same question repeated:" if repeated else "Different questions:")
+            for name, build in (('old layout', old_payload), ('stable prefix', new_payload)):
+                start = time.perf_counter()
+                stats = run(args.url, args.model, args.rounds, build, repeated)
+                tokens = [t for t, _ in stats]
+                millis = [ms for _, ms in stats]
+                print(f"  {name:>13}: evaluated tokens mean {statistics.mean(tokens):.0f}, "
+                      f"prompt eval mean {statistics.mean(millis):.1f} ms, "
+                      f"median {statistics.median(millis):.1f} ms, "
+                      f"wall {time.perf_counter() - start:.1f}s")
+    finally:
+        if fake is not None:
+            fake.shutdown()
+            fake.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Search context deduplication benchmark.
+
+Runs real searches (or loads results saved earlier) and compares the
+size of the LLM search context built with and without near-duplicate
+passage elimination.
+
+Usage (from project root):
+    python -m benchmarks.bench_search_dedup --queries queries.txt --save corpus.json
+    python -m benchmarks.bench_search_dedup --load corpus.json --threshold 0.7
+"""
+
+import argparse
+import asyncio
+import json
+
+from config import Config
+from services.search_service import SearchService
+from utils.helpers import estimate_tokens
+
+QUERIES = [
+    "Курс доллара на сегодня?",
+    "Что произошло на саммите G20?",
+    "Когда выйдет новый iPhone?",
+    "Результаты последнего матча Зенита?",
+    "Прогноз погоды в Санкт-Петербурге на выходные?",
+]
+
+
+async def collect(service: SearchService, queries: list) -> dict:
+    corpus = {}
+    for query in queries:
+        print(f"🔍 {query}")
+        corpus[query] = await service.search(query)
+    return corpus
+
+
+def context_tokens(service: SearchService, query: str, results: list, threshold: float) -> int:
+    service.dedup_threshold = threshold
+    return estimate_tokens(service.format_search_context_for_llm(query, results))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--queries', help="File with one query per line")
+    parser.add_argument('--load', help="JSON corpus saved with --save")
+    parser.add_argument('--save', help="Save search results to JSON")
+    parser.add_argument('--threshold', type=float, default=Config.SEARCH_DEDUP_THRESHOLD)
+    args = parser.parse_args()
+
+    service = SearchService(Config())
+
+    if args.load:
+        with open(args.load, encoding='utf-8') as f:
+            corpus = json.load(f)
+    else:
+        queries = QUERIES
+        if args.queries:
+            with open(args.queries, encoding='utf-8') as f:
+                queries = [line.strip() for line in f if line.strip()]
+        corpus = asyncio.run(collect(service, queries))
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(corpus, f, ensure_ascii=False, indent=1)
+
+    total_before = total_after = 0
+    print(f"\n{'query':50} {'tokens':>8} {'dedup':>8} {'saved':>7}")
+    for query, results in corpus.items():
+        before = context_tokens(service, query, results, 0)
+        after = context_tokens(service, query, results, args.threshold)
+        total_before += before
+        total_after += after
+        saved = (before - after) / before if before else 0
+        print(f"{query[:50]:50} {before:8d} {after:8d} {saved:7.1%}")
+
+    if total_before:
+        saved = (total_before - total_after) / total_before
+        print(f"{'TOTAL':50} {total_before:8d} {total_after:8d} {saved:7.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+"""
+Search pipeline replay benchmark: recorded corpus, no network.
+
+`record` runs real searches and stores every DuckDuckGo results page and
+scraped page (raw bytes) in a gzip-compressed JSON-lines corpus. `replay`
+serves that corpus to SearchService through its `http` client and times
+_search_duckduckgo, _scrape_page_content and format_search_context_for_llm
+for every recorded query, so parser and extraction changes can be
+compared on identical input.
+
+Reported per run: scraped pages per second (wall and CPU time per page),
+HTML bytes processed, extracted characters and their yield per HTML
+byte, results page parse time and LLM context size.
+
+Usage (from project root):
+    python -m benchmarks.bench_search_replay record --corpus corpus.jsonl.gz --pages 5
+    python -m benchmarks.bench_search_replay replay --corpus corpus.jsonl.gz --repeat 3
+    python -m benchmarks.bench_search_replay replay --corpus corpus.jsonl.gz --parser lxml
+    python -m benchmarks.bench_search_replay replay --corpus corpus.jsonl.gz --extractor mymodule:extract
+"""
+
+import argparse
+import asyncio
+import base64
+import gzip
+import importlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import requests
+
+from benchmarks.bench_search_dedup import QUERIES
+from config import Config
+from services.domain_health import DomainHealth
+from services.search_service import SearchService
+from utils.helpers import estimate_tokens
+
+
+def _key(method: str, url: str, data: Optional[Dict[str, Any]] = None) -> str:
+    # All DuckDuckGo searches POST to the same URL, the query tells them apart
+    query = (data or {}).get('q')
+    return f"{method} {url} {query}" if query else f"{method} {url}"
+
+
+class RecordingClient:
+    """requests-compatible client that stores every response it returns"""
+
+    def __init__(self):
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self._session = requests.Session()
+        self._lock = threading.Lock()
+
+    def _store(self, key: str, response: requests.Response, query: Optional[str] = None):
+        with self._lock:
+            self.records[key] = {
+                'key': key,
+                'query': query,
+                'url': response.url,
+                'status': response.status_code,
+                'encoding': response.encoding,
+                'body': base64.b64encode(response.content).decode('ascii'),
+            }
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        response = self._session.get(url, **kwargs)
+        self._store(_key('GET', url), response)
+        return response
+
+    def post(self, url: str, data: Optional[Dict[str, Any]] = None, **kwargs) -> requests.Response:
+        response = self._session.post(url, data=data, **kwargs)
+        self._store(_key('POST', url, data), response, (data or {}).get('q'))
+        return response
+
+
+class ReplayResponse:
+    """Recorded response with the parts of requests.Response the service uses"""
+
+    def __init__(self, record: Dict[str, Any]):
+        self.url = record['url']
+        self.status_code = record['status']
+        self.encoding = record['encoding'] or 'utf-8'
+        self.content = base64.b64decode(record['body'])
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding, errors='replace')
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} for {self.url}")
+
+
+class ReplayClient:
+    """Serves recorded responses; unrecorded requests fail like a dead host"""
+
+    def __init__(self, records: Dict[str, Dict[str, Any]]):
+        self.records = records
+        self.bytes_served = 0
+
+    def _serve(self, key: str) -> ReplayResponse:
+        record = self.records.get(key)
+        if record is None:
+            raise requests.ConnectionError(f"Not in corpus: {key}")
+        response = ReplayResponse(record)
+        self.bytes_served += len(response.content)
+        return response
+
+    def get(self, url: str, **kwargs) -> ReplayResponse:
+        return self._serve(_key('GET', url))
+
+    def post(self, url: str, data: Optional[Dict[str, Any]] = None, **kwargs) -> ReplayResponse:
+        return self._serve(_key('POST', url, data))
+
+
+def save_corpus(path: str, records: Dict[str, Dict[str, Any]]):
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for record in records.values():
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def load_corpus(path: str) -> Dict[str, Dict[str, Any]]:
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return {record['key']: record for record in records}
+
+
+def record(args):
+    queries = QUERIES
+    if args.queries:
+        with open(args.queries, encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    client = RecordingClient()
+    service = SearchService(Config(), http=client)
+    # Fetch every page instead of stopping at the first good ones
+    service.min_passages = args.pages + 1
+    service.scrape_deadline = 60
+
+    async def run():
+        for query in queries:
+            results = await service.search(query, args.pages)
+            print(f"🔍 {query}: {len(results)} result(s)")
+    asyncio.run(run())
+
+    save_corpus(args.corpus, client.records)
+    size = sum(len(r['body']) * 3 // 4 for r in client.records.values())
+    print(f"💾 {len(client.records)} response(s), {size / 2**20:.1f} MiB of HTML saved to {args.corpus}")
+
+
+def replay_once(service: SearchService, client: ReplayClient, records: Dict[str, Dict[str, Any]]) -> Dict[str, float]:
+    stats = {
+        'queries': 0, 'pages': 0, 'failed': 0, 'bytes': 0, 'chars': 0,
+        'scrape_wall': 0.0, 'scrape_cpu': 0.0, 'ddg_wall': 0.0,
+        'format_wall': 0.0, 'context_tokens': 0,
+    }
+    queries = [r['query'] for r in records.values() if r['query']]
+
+    for query in queries:
+        start = time.perf_counter()
+        results = service._search_duckduckgo(query)
+        stats['ddg_wall'] += time.perf_counter() - start
+
+        terms = service._query_terms(query)
+        for result in results:
+            key = _key('GET', result['link'])
+            if key not in records:
+                continue
+            served = client.bytes_served
+            wall, cpu = time.perf_counter(), time.process_time()
+            text = service._scrape_page_content(result['link'], result['title'])
+            stats['scrape_wall'] += time.perf_counter() - wall
+            stats['scrape_cpu'] += time.process_time() - cpu
+            stats['bytes'] += client.bytes_served - served
+            stats['pages'] += 1
+            if not text:
+                stats['failed'] += 1
+                continue
+            stats['chars'] += len(text)
+            result['passages'], result['score'] = service._rank_passages(text, terms)
+            result['body'] = ' '.join(result['passages'])[:service.PAGE_CONTEXT_CHARS]
+
+        start = time.perf_counter()
+        context = service.format_search_context_for_llm(query, results)
+        stats['format_wall'] += time.perf_counter() - start
+        stats['context_tokens'] += estimate_tokens(context)
+        stats['queries'] += 1
+    return stats
+
+
+def replay(args):
+    records = load_corpus(args.corpus)
+    client = ReplayClient(records)
+    # No circuit breaking: every run must scrape the same pages
+    service = SearchService(Config(), domain_health=DomainHealth(failure_threshold=10**9), http=client)
+    if args.parser:
+        service.html_parser = args.parser
+    if args.extractor:
+        module_name, function_name = args.extractor.split(':')
+        extract = getattr(importlib.import_module(module_name), function_name)
+        service._extract_text = lambda content: extract(content)[:service.PAGE_TEXT_CHARS]
+
+    label = f"parser={service.html_parser}" + (f" extractor={args.extractor}" if args.extractor else "")
+    print(f"{len(records)} recorded response(s), {label}")
+    for run in range(1, args.repeat + 1):
+        stats = replay_once(service, client, records)
+        pages = max(1, stats['pages'])
+        print(
+            f"run {run}: {stats['queries']} queries, {stats['pages']} pages ({stats['failed']} failed), "
+            f"{pages / max(stats['scrape_wall'], 1e-9):.1f} pages/s, "
+            f"{stats['scrape_cpu'] / pages * 1000:.1f} ms CPU/page, "
+            f"{stats['bytes'] / 2**20:.2f} MiB HTML -> {stats['chars'] / 1000:.0f}k chars "
+            f"({stats['chars'] / max(1, stats['bytes']):.2%} yield), "
+            f"results page {stats['ddg_wall'] / max(1, stats['queries']) * 1000:.1f} ms, "
+            f"context {stats['format_wall'] / max(1, stats['queries']) * 1000:.2f} ms / "
+            f"{stats['context_tokens'] // max(1, stats['queries'])} tokens per query"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help='Run real searches and save the corpus')
+    record_parser.add_argument('--corpus', required=True, help='Output file (.jsonl.gz)')
+    record_parser.add_argument('--queries', help='File with one query per line')
+    record_parser.add_argument('--pages', type=int, default=Config.SEARCH_MAX_RESULTS, help='Pages scraped per query')
+
+    replay_parser = commands.add_parser('replay', help='Benchmark the pipeline on a saved corpus')
+    replay_parser.add_argument('--corpus', required=True)
+    replay_parser.add_argument('--repeat', type=int, default=3)
+    replay_parser.add_argument('--parser', help='BeautifulSoup parser (html.parser, lxml, html5lib)')
+    replay_parser.add_argument('--extractor', help='module:function taking page bytes, returning text')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    if args.command == 'record':
+        record(args)
+    else:
+        replay(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Semantic cache lookup latency benchmark.
+
+Usage (from project root):
+    python -m benchmarks.bench_semantic_cache --entries 100000 --dim 768
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from config import Config
+from database.db_manager import DatabaseManager
+from services.semantic_cache import SemanticCache
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def run(entries: int, dim: int, queries: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        config = Config()
+        config.DATABASE_PATH = os.path.join(tmp, 'bench.db')
+        config.SEMANTIC_CACHE_MAX_ENTRIES = entries
+
+        db = DatabaseManager(config.DATABASE_PATH)
+        await db.init_db()
+        cache = SemanticCache(config)
+        await cache.load(db)
+
+        rng = np.random.default_rng(42)
+        vectors = rng.standard_normal((entries, dim), dtype=np.float32)
+
+        # Fill through add() once to create the file, then bulk-fill the matrix
+        await cache.add('q0', vectors[0].tolist(), 'a0', 'bench')
+        start = time.perf_counter()
+        cache._vectors[:] = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        cache._created[:] = time.time()
+        cache._model_ids[:] = cache._models['bench']
+        cache._size = entries
+        cache.flush()
+        print(f"Filled {entries} x {dim} in {time.perf_counter() - start:.2f}s "
+              f"({entries * dim * 4 / 2**20:.0f} MiB)")
+
+        miss_times, hit_times = [], []
+        for i in range(queries):
+            query = rng.standard_normal(dim, dtype=np.float32)
+            start = time.perf_counter()
+            await cache.lookup(query.tolist(), 'bench')
+            miss_times.append((time.perf_counter() - start) * 1000)
+
+            # Slightly perturbed copy of entry 0 is a guaranteed hit
+            query = vectors[0] + rng.standard_normal(dim, dtype=np.float32) * 0.01
+            start = time.perf_counter()
+            answer = await cache.lookup(query.tolist(), 'bench')
+            hit_times.append((time.perf_counter() - start) * 1000)
+            assert answer == 'a0'
+
+        for name, times in (('miss', miss_times), ('hit', hit_times)):
+            print(f"{name:>4}: mean {statistics.mean(times):.2f} ms, "
+                  f"p50 {percentile(times, 50):.2f} ms, p95 {percentile(times, 95):.2f} ms")
+
+        await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--queries', type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args.entries, args.dim, args.queries))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+Sharded history benchmark: concurrent write throughput per shard count.
+
+Starts several worker processes (like several bot instances sharing the
+database files); each runs a few coroutines calling add_message for
+random users as fast as it can. Reports turns written per second and
+add_message latency for every shard count.
+
+Usage (from project root):
+    python -m benchmarks.bench_sharded_writes --shards 1 4 8 --processes 8 --writes 2000
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from database.db_manager import DatabaseManager
+
+
+async def write_turns(path, shards, writes, concurrency, users, seed, ready, start_event) -> list:
+    db = DatabaseManager(path, shards=shards)
+    await db.init_db()
+    # Measure writes only, after every process has opened its connections
+    ready.put(seed)
+    await asyncio.to_thread(start_event.wait)
+    rng = random.Random(seed)
+    question = 'вопрос пользователя ' * 5
+    answer = 'ответ модели ' * 100
+    latencies = []
+
+    async def writer(count: int):
+        for _ in range(count):
+            start = time.perf_counter()
+            await db.add_message(rng.randrange(users), question, answer)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    per_writer = writes // concurrency
+    await asyncio.gather(*(writer(per_writer) for _ in range(concurrency)))
+    await db.close()
+    return latencies
+
+
+def worker(path, shards, writes, concurrency, users, seed, ready, start_event, results):
+    results.put(asyncio.run(
+        write_turns(path, shards, writes, concurrency, users, seed, ready, start_event)
+    ))
+
+
+def run(shards: int, processes: int, writes: int, concurrency: int, users: int, tmp: str):
+    path = os.path.join(tmp, f'bench_{shards}.db')
+
+    async def prepare():
+        # Creates shared file and shards before the workers open them
+        db = DatabaseManager(path, shards=shards)
+        await db.init_db()
+        await db.close()
+    asyncio.run(prepare())
+
+    ready = multiprocessing.Queue()
+    start_event = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(
+            target=worker,
+            args=(path, shards, writes, concurrency, users, seed, ready, start_event, results)
+        )
+        for seed in range(processes)
+    ]
+    for process in workers:
+        process.start()
+    for _ in workers:
+        ready.get()
+    start = time.perf_counter()
+    start_event.set()
+    latencies = []
+    for _ in workers:
+        latencies.extend(results.get())
+    elapsed = time.perf_counter() - start
+    for process in workers:
+        process.join()
+
+    latencies.sort()
+    print(
+        f"{shards:>2} shard(s): {len(latencies) / elapsed:8.0f} turns/s, "
+        f"add_message p50 {latencies[len(latencies) // 2]:.2f} ms, "
+        f"p95 {latencies[int(len(latencies) * 0.95)]:.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--processes', type=int, default=8, help='Writer processes')
+    parser.add_argument('--writes', type=int, default=2000, help='Turns written per process')
+    parser.add_argument('--concurrency', type=int, default=4, help='Writer coroutines per process')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--dir', default=None, help='Directory for temporary databases')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        for shards in args.shards:
+            run(shards, args.processes, args.writes, args.concurrency, args.users, tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,16 @@
 import asyncio
 import logging
-from aiogram import Bot, Dispatcher
-from aiogram.types import BotCommand
+
+from utils.startup_profile import StartupProfile
+
+startup_profile = StartupProfile()
+
+with startup_profile.measure("import aiogram"):
+    from aiogram import Bot, Dispatcher
+    from aiogram.types import BotCommand
 
 from config import Config
 from database.db_manager import DatabaseManager
-from handlers import user_handlers, photo_handlers
-from middlewares.db_middleware import DatabaseMiddleware
 
 logger = logging.getLogger(__name__)
 
@@ -14,9 +18,46 @@ logger = logging.getLogger(__name__)
 async def set_bot_commands(bot: Bot):
     """Set bot commands in menu"""
     commands = [
-        BotCommand(command="start", description="🚀 Запустить бота")
+        BotCommand(command="start", description="🚀 Запустить бота"),
+        BotCommand(command="stop", description="⏹ Остановить генерацию ответа")
     ]
-    await bot.set_my_commands(commands)
+    try:
+        await bot.set_my_commands(commands)
+    except Exception as e:
+        logger.error(f"Error setting bot commands: {e}")
+
+
+async def run_vacuum(db: DatabaseManager, interval: int, pages: int):
+    """Periodically return free database pages to the file system and train the compression dictionary"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            freed = await db.incremental_vacuum(pages)
+            if freed:
+                logger.info(f"🧹 Incremental vacuum: {freed} free page(s)")
+        except Exception as e:
+            logger.error(f"Incremental vacuum error: {e}")
+        try:
+            await db.ensure_compression_dict()
+        except Exception as e:
+            logger.error(f"Compression dictionary training error: {e}")
+
+
+async def run_domain_health_save(services, interval: int):
+    """Periodically persist scraper domain statistics"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await services.domain_health.save(services.db)
+        except Exception as e:
+            logger.error(f"Domain health save error: {e}")
+
+
+async def run_flush(services, interval: int):
+    """Periodically write rows buffered by services (daily usage, job costs, usage ledger)"""
+    while True:
+        await asyncio.sleep(interval)
+        await services.flush()
 
 
 async def main():
@@ -29,37 +70,93 @@ async def main():
     # Initialize config
     config = Config()
     
+    # Import bot modules (services themselves are built lazily by the container)
+    user_handlers = startup_profile.import_module('handlers.user_handlers')
+    photo_handlers = startup_profile.import_module('handlers.photo_handlers')
+    document_handlers = startup_profile.import_module('handlers.document_handlers')
+    db_middleware = startup_profile.import_module('middlewares.db_middleware')
+    services_middleware = startup_profile.import_module('middlewares.services_middleware')
+    throttling_middleware = startup_profile.import_module('middlewares.throttling_middleware')
+    container_module = startup_profile.import_module('services.container')
+    
     # Initialize database
-    db = DatabaseManager(config.DATABASE_PATH)
-    await db.init_db()
+    with startup_profile.measure("init database"):
+        db = DatabaseManager(
+            config.DATABASE_PATH,
+            compression=config.HISTORY_COMPRESSION,
+            active_window=config.HISTORY_ACTIVE_WINDOW,
+            archive=config.HISTORY_ARCHIVE_ENABLED,
+            shards=config.DATABASE_SHARDS,
+            vacuum_convert=config.VACUUM_CONVERT
+        )
+        await db.init_db()
+    vacuum_task = asyncio.create_task(
+        run_vacuum(db, config.VACUUM_INTERVAL, config.VACUUM_PAGES)
+    )
+    
+    # Initialize services container and quotas (needed by throttling before any update)
+    services = container_module.ServiceContainer(config, db)
+    with startup_profile.measure("load quotas"):
+        await services.quota_manager.load()
     
     # Initialize bot without parse_mode (sends plain text)
     bot = Bot(token=config.BOT_TOKEN)
     
     dp = Dispatcher()
     
-    # Register middleware
-    dp.message.middleware(DatabaseMiddleware(db))
-    dp.callback_query.middleware(DatabaseMiddleware(db))
+    # Register middleware (throttling runs first, before any filters)
+    throttling = throttling_middleware.ThrottlingMiddleware(
+        services.rate_limiter, services.quota_manager, config.SEARCH_ENABLED,
+        lambda: services.ollama_service.get_available_models()
+    )
+    dp.message.outer_middleware(throttling)
+    for observer in (dp.message, dp.callback_query):
+        observer.middleware(db_middleware.DatabaseMiddleware(db))
+        observer.middleware(services_middleware.ServicesMiddleware(services))
     
     # Include routers
     dp.include_router(user_handlers.router)
     dp.include_router(photo_handlers.router)
-    
-    # Set bot commands
-    await set_bot_commands(bot)
+    dp.include_router(document_handlers.router)
     
     # Delete webhook and start polling
-    await bot.delete_webhook(drop_pending_updates=True)
+    with startup_profile.measure("delete webhook"):
+        await bot.delete_webhook(drop_pending_updates=True)
+    
+    # Not needed before polling: set commands and build services in the background
+    background_tasks = [
+        asyncio.create_task(set_bot_commands(bot)),
+        asyncio.create_task(services.warm_up()),
+    ]
+    if config.SEARCH_ENABLED:
+        background_tasks.append(asyncio.create_task(
+            run_domain_health_save(services, config.DOMAIN_HEALTH_SAVE_INTERVAL)
+        ))
+    background_tasks.append(asyncio.create_task(
+        run_flush(services, config.USAGE_FLUSH_INTERVAL)
+    ))
+    
+    # Memory accounting also covers state kept outside the services
+    services.memory_monitor.track('throttling', throttling)
+    services.memory_monitor.track('fsm_storage', dp.fsm.storage)
+    if config.MEMORY_WATCHDOG_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(
+            services.memory_monitor.run_watchdog(config.MEMORY_WATCHDOG_INTERVAL)
+        ))
     
+    startup_profile.report(logger, detailed=config.STARTUP_PROFILE)
     logger.info("Bot started successfully")
     
     try:
         await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
+        vacuum_task.cancel()
+        for task in background_tasks:
+            task.cancel()
+        await services.close()
         await db.close()
         await bot.session.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
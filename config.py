@@ -4,6 +4,22 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+
+def _parse_ids(value: str) -> tuple:
+    """Parse comma-separated list of Telegram user IDs"""
+    return tuple(int(x) for x in value.split(',') if x.strip())
+
+
+def _parse_floats(value: str) -> tuple:
+    """Parse comma-separated list of numbers"""
+    return tuple(float(x) for x in value.split(',') if x.strip())
+
+
+def _parse_list(value: str) -> tuple:
+    """Parse comma-separated list of strings"""
+    return tuple(x.strip() for x in value.split(',') if x.strip())
+
+
 @dataclass
 class Config:
     """Bot configuration settings"""
@@ -13,10 +29,30 @@ class Config:
     
     # Database settings
     DATABASE_PATH: str = os.getenv('DATABASE_PATH', 'bot_data.db')
+    # History is split into this many files by user (each has its own writer);
+    # changing it reshards history at the next start (see database/sharding.py)
+    DATABASE_SHARDS: int = int(os.getenv('DATABASE_SHARDS', '1'))
     
     # Model settings
     OLLAMA_URL: str = os.getenv('OLLAMA_URL', 'http://localhost:11434')
+    # Several Ollama servers (comma-separated, replaces OLLAMA_URL): each
+    # request goes to the least busy one; a server refusing connections is
+    # skipped for OLLAMA_BACKEND_COOLDOWN seconds
+    OLLAMA_URLS: tuple = _parse_list(os.getenv('OLLAMA_URLS', ''))
+    OLLAMA_BACKEND_COOLDOWN: int = int(os.getenv('OLLAMA_BACKEND_COOLDOWN', '30'))
+    # Hedging (2+ servers): a generation with no first token after the given
+    # percentile of recent first-token times (within min/max delay, seconds)
+    # is also sent to another server and the faster answer is used; at most
+    # OLLAMA_HEDGE_BUDGET of requests are duplicated
+    OLLAMA_HEDGE_ENABLED: bool = os.getenv('OLLAMA_HEDGE_ENABLED', 'false').lower() == 'true'
+    OLLAMA_HEDGE_PERCENTILE: float = float(os.getenv('OLLAMA_HEDGE_PERCENTILE', '95'))
+    OLLAMA_HEDGE_MIN_DELAY: float = float(os.getenv('OLLAMA_HEDGE_MIN_DELAY', '2'))
+    OLLAMA_HEDGE_MAX_DELAY: float = float(os.getenv('OLLAMA_HEDGE_MAX_DELAY', '30'))
+    OLLAMA_HEDGE_BUDGET: float = float(os.getenv('OLLAMA_HEDGE_BUDGET', '0.1'))
     DEFAULT_MODEL: str = os.getenv('DEFAULT_MODEL', 'qwen3:14b-q8_0')
+    # JSON file with search prompt templates per model name prefix
+    # (empty = the built-in default template for every model)
+    PROMPT_TEMPLATES_FILE: str = os.getenv('PROMPT_TEMPLATES_FILE', '')
     
     # Google Search settings
     SEARCH_ENABLED: bool = os.getenv('SEARCH_ENABLED', 'true').lower() == 'true'
@@ -24,8 +60,147 @@ class Config:
     SEARCH_MAX_RESULTS: int = int(os.getenv('SEARCH_MAX_RESULTS', '10'))
     SEARCH_SLEEP_INTERVAL: int = int(os.getenv('SEARCH_SLEEP_INTERVAL', '2'))
     SEARCH_PAGES_TO_SCRAPE: int = int(os.getenv('SEARCH_PAGES_TO_SCRAPE', '5'))  # NEW
+    # Stop scraping once this many pages with relevant passages are in...
+    SEARCH_MIN_PASSAGES: int = int(os.getenv('SEARCH_MIN_PASSAGES', '3'))
+    # ...or this many seconds after the search started
+    SEARCH_SCRAPE_DEADLINE: float = float(os.getenv('SEARCH_SCRAPE_DEADLINE', '8'))
+    # Passage is dropped from search context when this share of its text
+    # already appears in a more relevant source (0 = keep duplicates)
+    SEARCH_DEDUP_THRESHOLD: float = float(os.getenv('SEARCH_DEDUP_THRESHOLD', '0.8'))
+    # Local full-text index of scraped pages (SQLite FTS5, <db name>.pages.db),
+    # searched before the web; pages older than PAGE_INDEX_MAX_AGE seconds are ignored
+    PAGE_INDEX_ENABLED: bool = os.getenv('PAGE_INDEX_ENABLED', 'true').lower() == 'true'
+    PAGE_INDEX_MAX_AGE: int = int(os.getenv('PAGE_INDEX_MAX_AGE', '86400'))
+    PAGE_INDEX_MAX_PAGES: int = int(os.getenv('PAGE_INDEX_MAX_PAGES', '20000'))
+    # Scraper circuit breaker: domain is skipped for the cooldown (seconds)
+    # after this many failed scrapes in a row; stats are saved periodically
+    SCRAPE_CIRCUIT_FAILURES: int = int(os.getenv('SCRAPE_CIRCUIT_FAILURES', '3'))
+    SCRAPE_CIRCUIT_COOLDOWN: int = int(os.getenv('SCRAPE_CIRCUIT_COOLDOWN', '1800'))
+    DOMAIN_HEALTH_SAVE_INTERVAL: int = int(os.getenv('DOMAIN_HEALTH_SAVE_INTERVAL', '300'))
     
     # Limits - INCREASED timeout for large models
     MAX_HISTORY_LENGTH: int = int(os.getenv('MAX_HISTORY_LENGTH', '20'))
     MAX_MESSAGE_LENGTH: int = int(os.getenv('MAX_MESSAGE_LENGTH', '4000'))
-    REQUEST_TIMEOUT: int = int(os.getenv('REQUEST_TIMEOUT', '300'))
\ No newline at end of file
+    REQUEST_TIMEOUT: int = int(os.getenv('REQUEST_TIMEOUT', '300'))
+    
+    # In-flight requests: what to do when a user sends a new message
+    # while the previous answer is still generating (supersede / queue / reject)
+    INFLIGHT_POLICY: str = os.getenv('INFLIGHT_POLICY', 'supersede').lower()
+    
+    # Message coalescing: messages sent within the window are merged into one
+    # question (0 disables). The window grows with load up to the max value
+    COALESCE_WINDOW_MS: int = int(os.getenv('COALESCE_WINDOW_MS', '0'))
+    COALESCE_MAX_WINDOW_MS: int = int(os.getenv('COALESCE_MAX_WINDOW_MS', '3000'))
+    
+    # User tiers: admins are not limited, premium users get multiplied limits
+    ADMIN_USER_IDS: tuple = _parse_ids(os.getenv('ADMIN_USER_IDS', ''))
+    PREMIUM_USER_IDS: tuple = _parse_ids(os.getenv('PREMIUM_USER_IDS', ''))
+    PREMIUM_LIMIT_MULTIPLIER: int = int(os.getenv('PREMIUM_LIMIT_MULTIPLIER', '5'))
+    
+    # Photos of one album arriving within this window (ms) are analyzed together
+    ALBUM_WINDOW_MS: int = int(os.getenv('ALBUM_WINDOW_MS', '800'))
+    
+    # Documents (.txt/.md, .pdf with pypdf): split into chunks of
+    # DOCUMENT_CHUNK_TOKENS processed in parallel, partial answers merged
+    # DOCUMENT_REDUCE_FAN_IN at a time; chunks above the limit are ignored
+    DOCUMENT_MAX_SIZE_MB: int = int(os.getenv('DOCUMENT_MAX_SIZE_MB', '20'))
+    DOCUMENT_CHUNK_TOKENS: int = int(os.getenv('DOCUMENT_CHUNK_TOKENS', '1500'))
+    DOCUMENT_MAX_CHUNKS: int = int(os.getenv('DOCUMENT_MAX_CHUNKS', '200'))
+    DOCUMENT_REDUCE_FAN_IN: int = int(os.getenv('DOCUMENT_REDUCE_FAN_IN', '8'))
+    
+    # Rate limits per user and action type, requests per minute (0 = unlimited)
+    RATE_LIMIT_TEXT_PER_MIN: int = int(os.getenv('RATE_LIMIT_TEXT_PER_MIN', '20'))
+    RATE_LIMIT_SEARCH_PER_MIN: int = int(os.getenv('RATE_LIMIT_SEARCH_PER_MIN', '5'))
+    RATE_LIMIT_PHOTO_PER_MIN: int = int(os.getenv('RATE_LIMIT_PHOTO_PER_MIN', '5'))
+    RATE_LIMIT_DOCUMENT_PER_MIN: int = int(os.getenv('RATE_LIMIT_DOCUMENT_PER_MIN', '2'))
+    
+    # Daily quotas per user (0 = unlimited)
+    DAILY_TOKEN_QUOTA: int = int(os.getenv('DAILY_TOKEN_QUOTA', '0'))
+    DAILY_GPU_SECONDS_QUOTA: float = float(os.getenv('DAILY_GPU_SECONDS_QUOTA', '0'))
+    
+    # Embeddings
+    EMBEDDING_MODEL: str = os.getenv('EMBEDDING_MODEL', 'nomic-embed-text')
+    EMBEDDING_TIMEOUT: int = int(os.getenv('EMBEDDING_TIMEOUT', '30'))
+    
+    # Semantic answer cache (requires numpy): similar questions asked without
+    # history get the stored answer instead of a new generation
+    SEMANTIC_CACHE_ENABLED: bool = os.getenv('SEMANTIC_CACHE_ENABLED', 'false').lower() == 'true'
+    SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.92'))
+    SEMANTIC_CACHE_TTL: int = int(os.getenv('SEMANTIC_CACHE_TTL', '86400'))
+    SEMANTIC_CACHE_MAX_ENTRIES: int = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', '100000'))
+    
+    # Long-term memory (requires numpy): with history on, send the last few
+    # turns plus the most relevant older ones within a token budget
+    MEMORY_ENABLED: bool = os.getenv('MEMORY_ENABLED', 'false').lower() == 'true'
+    MEMORY_RECENT_TURNS: int = int(os.getenv('MEMORY_RECENT_TURNS', '3'))
+    MEMORY_TOP_K: int = int(os.getenv('MEMORY_TOP_K', '4'))
+    MEMORY_TOKEN_BUDGET: int = int(os.getenv('MEMORY_TOKEN_BUDGET', '2000'))
+    
+    # Max concurrent generations sent to Ollama (match OLLAMA_NUM_PARALLEL)
+    OLLAMA_MAX_PARALLEL: int = int(os.getenv('OLLAMA_MAX_PARALLEL', '2'))
+    
+    # Queued generations are ordered shortest-estimated-job first; every
+    # second of waiting offsets this many seconds of estimated cost
+    SCHEDULER_AGING_RATE: float = float(os.getenv('SCHEDULER_AGING_RATE', '1.0'))
+    
+    # Overload control: estimated queue wait (seconds) at which each level
+    # starts - fewer search pages, smaller num_ctx, capped num_predict,
+    # FALLBACK_MODEL (skipped if empty), shedding new requests with an ETA
+    OVERLOAD_ENABLED: bool = os.getenv('OVERLOAD_ENABLED', 'true').lower() == 'true'
+    OVERLOAD_WAIT_THRESHOLDS: tuple = _parse_floats(os.getenv('OVERLOAD_WAIT_THRESHOLDS', '30,60,120,180,270'))
+    OVERLOAD_RECOVERY_RATIO: float = float(os.getenv('OVERLOAD_RECOVERY_RATIO', '0.7'))
+    OVERLOAD_SEARCH_PAGES: int = int(os.getenv('OVERLOAD_SEARCH_PAGES', '2'))
+    OVERLOAD_NUM_CTX: int = int(os.getenv('OVERLOAD_NUM_CTX', '2048'))
+    OVERLOAD_NUM_PREDICT: int = int(os.getenv('OVERLOAD_NUM_PREDICT', '512'))
+    FALLBACK_MODEL: str = os.getenv('FALLBACK_MODEL', '')
+    
+    # Memory watchdog: every interval (seconds, 0 disables) RSS is checked;
+    # above the threshold the largest caches and tracemalloc growth are
+    # logged. Admins get the same data with /memory
+    MEMORY_WATCHDOG_INTERVAL: int = int(os.getenv('MEMORY_WATCHDOG_INTERVAL', '300'))
+    MEMORY_RSS_THRESHOLD_MB: int = int(os.getenv('MEMORY_RSS_THRESHOLD_MB', '1024'))
+    MEMORY_TRACEMALLOC: bool = os.getenv('MEMORY_TRACEMALLOC', 'false').lower() == 'true'
+    MEMORY_TRACE_FRAMES: int = int(os.getenv('MEMORY_TRACE_FRAMES', '1'))
+    MEMORY_TOP_ALLOCATIONS: int = int(os.getenv('MEMORY_TOP_ALLOCATIONS', '10'))
+    
+    # Worker processes for HTML parsing of search results and scraped pages
+    # and for post-processing model output of at least CPU_POOL_MIN_CHARS
+    # (0 = parse in the search threads, as before)
+    CPU_POOL_WORKERS: int = int(os.getenv('CPU_POOL_WORKERS', '0'))
+    CPU_POOL_MIN_CHARS: int = int(os.getenv('CPU_POOL_MIN_CHARS', '50000'))
+    
+    # Answers kept for the regenerate / continue buttons: prompt inputs,
+    # search context, full output and Ollama context (seconds, max entries)
+    ANSWER_STORE_TTL: int = int(os.getenv('ANSWER_STORE_TTL', '3600'))
+    ANSWER_STORE_MAX_ENTRIES: int = int(os.getenv('ANSWER_STORE_MAX_ENTRIES', '1000'))
+    
+    # Usage ledger: one row per generation (tokens, durations, search pages,
+    # cache outcome), written every USAGE_FLUSH_INTERVAL seconds with hourly
+    # rollups; raw rows older than the retention (days, 0 = forever) are deleted.
+    # Daily quota usage and job costs of the cost estimator are written on the same interval
+    USAGE_LEDGER_ENABLED: bool = os.getenv('USAGE_LEDGER_ENABLED', 'true').lower() == 'true'
+    USAGE_FLUSH_INTERVAL: int = int(os.getenv('USAGE_FLUSH_INTERVAL', '60'))
+    USAGE_LEDGER_RETENTION_DAYS: int = int(os.getenv('USAGE_LEDGER_RETENTION_DAYS', '30'))
+    
+    # History compaction: when unsummarized history exceeds the threshold,
+    # older turns are summarized in the background (empty model = DEFAULT_MODEL)
+    COMPACTION_ENABLED: bool = os.getenv('COMPACTION_ENABLED', 'false').lower() == 'true'
+    SUMMARY_MODEL: str = os.getenv('SUMMARY_MODEL', '')
+    COMPACTION_TOKEN_THRESHOLD: int = int(os.getenv('COMPACTION_TOKEN_THRESHOLD', '3000'))
+    COMPACTION_KEEP_RECENT: int = int(os.getenv('COMPACTION_KEEP_RECENT', '4'))
+    
+    # History storage: compression of message bodies (none / zlib / zstd),
+    # turns kept per user, and whether older turns are archived or deleted
+    HISTORY_COMPRESSION: str = os.getenv('HISTORY_COMPRESSION', 'none').lower()
+    HISTORY_ACTIVE_WINDOW: int = int(os.getenv('HISTORY_ACTIVE_WINDOW', '100'))
+    HISTORY_ARCHIVE_ENABLED: bool = os.getenv('HISTORY_ARCHIVE_ENABLED', 'false').lower() == 'true'
+    
+    # Incremental vacuum: interval in seconds and max pages per run (0 = all)
+    VACUUM_INTERVAL: int = int(os.getenv('VACUUM_INTERVAL', '3600'))
+    VACUUM_PAGES: int = int(os.getenv('VACUUM_PAGES', '0'))
+    # Convert an existing database to incremental auto-vacuum with a one-time
+    # full VACUUM at startup (rewrites the file, startup waits for it)
+    VACUUM_CONVERT: bool = os.getenv('VACUUM_CONVERT', 'false').lower() == 'true'
+    
+    # Log import and initialization time of every startup step
+    STARTUP_PROFILE: bool = os.getenv('STARTUP_PROFILE', 'false').lower() == 'true'
\ No newline at end of file
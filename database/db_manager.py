@@ -1,21 +1,65 @@
 import aiosqlite
+import asyncio
+import os
+import time
 from typing import Optional, List, Dict, Any
 import logging
 
+from database.sharding import (
+    AUTO_VACUUM_INCREMENTAL, Resharder, configure_connection, create_history_tables, create_meta_table,
+    read_layout, shard_of, shard_paths, write_layout,
+)
+from utils.compression import TextCompressor
+
 logger = logging.getLogger(__name__)
 
+
 class DatabaseManager:
-    """Async SQLite database manager for bot data"""
+    """
+    Async SQLite database manager for bot data
+    
+    Users, settings and service tables live in db_path. Per-user history
+    (messages, archive, summaries, embeddings) lives in `shards` files,
+    each with its own connection and write lock (see database.sharding);
+    with one shard it stays in db_path.
+    """
+    
+    # Rows used to train the compression dictionary
+    DICT_TRAIN_SAMPLES = 2000
+    DICT_MIN_SAMPLES = 200
     
-    def __init__(self, db_path: str):
+    def __init__(
+        self,
+        db_path: str,
+        compression: str = 'none',
+        active_window: int = 100,
+        archive: bool = False,
+        shards: int = 1,
+        vacuum_convert: bool = False
+    ):
         self.db_path = db_path
+        self.active_window = active_window
+        self.archive = archive
+        self.shards = shards
+        self.vacuum_convert = vacuum_convert
+        self._compressor = TextCompressor(compression)
         self._connection: Optional[aiosqlite.Connection] = None
+        self._shards: List[aiosqlite.Connection] = []
     
     async def init_db(self):
         """Initialize database and create tables"""
         self._connection = await aiosqlite.connect(self.db_path)
         self._connection.row_factory = aiosqlite.Row
         
+        await self._enable_incremental_vacuum(self._connection)
+        await configure_connection(self._connection)
+        
+        await create_meta_table(self._connection)
+        layout_shards, _ = await read_layout(self._connection)
+        if layout_shards == 1:
+            # Original single-file layout (also where a reshard starts from)
+            await create_history_tables(self._connection)
+        
         await self._connection.execute("""
             CREATE TABLE IF NOT EXISTS users (
                 user_id INTEGER PRIMARY KEY,
@@ -36,24 +80,267 @@ class DatabaseManager:
         """)
         
         await self._connection.execute("""
-            CREATE TABLE IF NOT EXISTS message_history (
+            CREATE TABLE IF NOT EXISTS compression_dicts (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                codec TEXT NOT NULL,
+                data BLOB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        await self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS daily_usage (
                 user_id INTEGER,
-                user_message TEXT NOT NULL,
-                bot_response TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
+                day TEXT,
+                tokens INTEGER DEFAULT 0,
+                gpu_seconds REAL DEFAULT 0,
+                requests INTEGER DEFAULT 0,
+                PRIMARY KEY (user_id, day)
+            )
+        """)
+        
+        await self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS usage_ledger (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                user_id INTEGER NOT NULL,
+                model TEXT NOT NULL,
+                prompt_tokens INTEGER DEFAULT 0,
+                eval_tokens INTEGER DEFAULT 0,
+                prompt_eval_seconds REAL DEFAULT 0,
+                eval_seconds REAL DEFAULT 0,
+                total_seconds REAL DEFAULT 0,
+                search_pages INTEGER DEFAULT 0,
+                cache_hit INTEGER
+            )
+        """)
+        await self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_usage_ledger_created ON usage_ledger (created_at)"
+        )
+        
+        await self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS usage_hourly (
+                hour TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                model TEXT NOT NULL,
+                requests INTEGER DEFAULT 0,
+                prompt_tokens INTEGER DEFAULT 0,
+                eval_tokens INTEGER DEFAULT 0,
+                eval_seconds REAL DEFAULT 0,
+                total_seconds REAL DEFAULT 0,
+                search_pages INTEGER DEFAULT 0,
+                cache_hits INTEGER DEFAULT 0,
+                cache_misses INTEGER DEFAULT 0,
+                PRIMARY KEY (hour, user_id, model)
+            )
+        """)
+        
+        await self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS semantic_cache (
+                slot INTEGER PRIMARY KEY,
+                question TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                model TEXT NOT NULL,
+                created_at REAL NOT NULL
             )
         """)
         
         await self._connection.execute("""
-            CREATE INDEX IF NOT EXISTS idx_message_history_user_id
-            ON message_history(user_id, created_at DESC)
+            CREATE TABLE IF NOT EXISTS job_costs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                model TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                estimated_seconds REAL NOT NULL,
+                actual_seconds REAL NOT NULL,
+                prompt_eval_count INTEGER DEFAULT 0,
+                prompt_eval_duration INTEGER DEFAULT 0,
+                eval_count INTEGER DEFAULT 0,
+                eval_duration INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        await self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS domain_health (
+                domain TEXT PRIMARY KEY,
+                attempts INTEGER NOT NULL,
+                successes INTEGER NOT NULL,
+                consecutive_failures INTEGER NOT NULL,
+                avg_chars REAL NOT NULL,
+                fetch_times TEXT NOT NULL,
+                opened_until REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
         """)
         
         await self._connection.commit()
+        
+        await self._open_shards()
+        
+        await self._load_compression_dicts()
+        
         logger.info("Database initialized successfully")
     
+    async def _open_shards(self):
+        """Open history shards, resharding first if DATABASE_SHARDS has changed"""
+        resharder = Resharder(self.db_path, self.shards)
+        try:
+            await resharder.open(self._connection)
+            if resharder.needed:
+                logger.info(f"🔀 Resharding history from {resharder.old_shards} to {self.shards} shard(s)...")
+                await resharder.switch()
+        finally:
+            await resharder.close()
+        
+        layout_shards, generation = await read_layout(self._connection)
+        if layout_shards == 1 and self.shards == 1:
+            # Record the layout so later resharding knows where history is
+            await write_layout(self._connection, 1, generation)
+            await self._connection.commit()
+        
+        for index, path in enumerate(shard_paths(self.db_path, self.shards, generation)):
+            if path == self.db_path:
+                self._shards.append(self._connection)
+                continue
+            connection = await aiosqlite.connect(path)
+            connection.row_factory = aiosqlite.Row
+            await self._enable_incremental_vacuum(connection)
+            await configure_connection(connection)
+            await create_history_tables(connection, generation, index)
+            await connection.commit()
+            self._shards.append(connection)
+        if self.shards > 1:
+            logger.info(f"🗂 History in {self.shards} shard(s), generation {generation}")
+    
+    def _connections(self) -> List[aiosqlite.Connection]:
+        """Shared connection and every shard connection, each once"""
+        return [self._connection] + [c for c in self._shards if c is not self._connection]
+    
+    def _history(self, user_id: int) -> aiosqlite.Connection:
+        """Connection of the shard holding user's history"""
+        return self._shards[shard_of(user_id, self.shards)]
+    
+    async def _enable_incremental_vacuum(self, connection: aiosqlite.Connection):
+        """
+        Switch database to auto_vacuum=INCREMENTAL
+        
+        New databases get the mode before any table exists; existing ones
+        need a one-time full VACUUM to change it, which rewrites the whole
+        file and blocks startup, so it only runs with vacuum_convert.
+        """
+        async with connection.execute("PRAGMA auto_vacuum") as cursor:
+            mode = (await cursor.fetchone())[0]
+        if mode == AUTO_VACUUM_INCREMENTAL:
+            return
+        
+        await connection.execute(f"PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}")
+        async with connection.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'table'"
+        ) as cursor:
+            has_tables = (await cursor.fetchone())[0] > 0
+        if has_tables:
+            path = await self._database_file(connection)
+            size_mb = os.path.getsize(path) / 2**20 if path and os.path.exists(path) else 0
+            if not self.vacuum_convert:
+                logger.warning(
+                    f"⚠️ {path} ({size_mb:.0f} MB) is not in incremental auto-vacuum mode, "
+                    f"freed pages are not returned to the file system (set VACUUM_CONVERT=true "
+                    f"to convert it once at startup)"
+                )
+                return
+            logger.info(f"🧹 Converting {path} ({size_mb:.0f} MB) to incremental auto-vacuum (one-time VACUUM)...")
+            started = time.perf_counter()
+            await connection.execute("VACUUM")
+            logger.info(f"🧹 Converted {path} in {time.perf_counter() - started:.1f}s")
+    
+    @staticmethod
+    async def _database_file(connection: aiosqlite.Connection) -> str:
+        async with connection.execute("PRAGMA database_list") as cursor:
+            for row in await cursor.fetchall():
+                if row[1] == 'main':
+                    return row[2]
+        return ''
+    
+    async def _load_compression_dicts(self):
+        """Load compression dictionaries; train the first one once there is enough history"""
+        async with self._connection.execute(
+            "SELECT id, codec, data FROM compression_dicts ORDER BY id"
+        ) as cursor:
+            rows = await cursor.fetchall()
+        
+        current_id = None
+        for row in rows:
+            is_current = row['codec'] == self._compressor.codec
+            self._compressor.add_dictionary(row['id'], row['data'], current=is_current)
+            if is_current:
+                current_id = row['id']
+        
+        if self._compressor.enabled and current_id is None:
+            await self.train_compression_dict()
+    
+    async def train_compression_dict(self) -> bool:
+        """
+        Train new shared dictionary on recent messages and use it for new rows
+        
+        Returns:
+            True if a dictionary was trained
+        """
+        if not self._compressor.enabled:
+            return False
+        
+        # Sample every shard evenly
+        rows = []
+        for connection in self._shards:
+            async with connection.execute(
+                "SELECT user_message, bot_response FROM message_history ORDER BY id DESC LIMIT ?",
+                (self.DICT_TRAIN_SAMPLES // len(self._shards),)
+            ) as cursor:
+                rows.extend(await cursor.fetchall())
+        if len(rows) < self.DICT_MIN_SAMPLES:
+            return False
+        
+        samples = []
+        for row in rows:
+            samples.append(self._compressor.decompress(row['user_message']))
+            samples.append(self._compressor.decompress(row['bot_response']))
+        
+        try:
+            data = await asyncio.to_thread(TextCompressor.train_dictionary, self._compressor.codec, samples)
+        except Exception as e:
+            logger.error(f"Error training compression dictionary: {e}")
+            return False
+        
+        cursor = await self._connection.execute(
+            "INSERT INTO compression_dicts (codec, data) VALUES (?, ?)",
+            (self._compressor.codec, data)
+        )
+        await self._connection.commit()
+        self._compressor.add_dictionary(cursor.lastrowid, data, current=True)
+        logger.info(f"🗜 Trained {self._compressor.codec} dictionary #{cursor.lastrowid}: {len(data)} bytes")
+        return True
+    
+    async def ensure_compression_dict(self) -> bool:
+        """
+        Train the first dictionary once enough history is stored
+        
+        Called periodically: a fresh install has too few rows at startup.
+        
+        Returns:
+            True if a dictionary was trained
+        """
+        if not self._compressor.enabled or self._compressor.has_dictionary:
+            return False
+        return await self.train_compression_dict()
+    
+    def _message(self, row: aiosqlite.Row) -> Dict[str, Any]:
+        """Convert history row to message dict"""
+        return {
+            'id': row['id'],
+            'user': self._compressor.decompress(row['user_message']),
+            'bot': self._compressor.decompress(row['bot_response'])
+        }
+    
     async def get_user_settings(self, user_id: int) -> Dict[str, Any]:
         """Get user settings"""
         async with self._connection.execute(
@@ -98,59 +385,441 @@ class DatabaseManager:
         await self._connection.commit()
     
     async def get_message_history(self, user_id: int, limit: int = 20) -> List[Dict[str, str]]:
-        """Get user message history"""
-        async with self._connection.execute(
+        """
+        Get user message history
+        
+        If older turns were compacted, the first item is the summary of
+        them and up to `limit` newer turns follow.
+        """
+        summary_row = await self._get_summary_row(user_id)
+        last_summarized_id = summary_row['last_message_id'] if summary_row else 0
+        
+        async with self._history(user_id).execute(
             """
-            SELECT user_message, bot_response
+            SELECT id, user_message, bot_response
             FROM message_history
-            WHERE user_id = ?
-            ORDER BY created_at DESC
+            WHERE user_id = ? AND id > ?
+            ORDER BY created_at DESC, id DESC
             LIMIT ?
             """,
-            (user_id, limit)
+            (user_id, last_summarized_id, limit)
         ) as cursor:
             rows = await cursor.fetchall()
             # Reverse to get chronological order
-            messages = [
-                {'user': row['user_message'], 'bot': row['bot_response']}
-                for row in reversed(rows)
-            ]
-            return messages
-    
-    async def add_message(self, user_id: int, user_message: str, bot_response: str):
-        """Add message to history"""
-        await self._connection.execute(
+            messages = [self._message(row) for row in reversed(rows)]
+        
+        if summary_row:
+            messages.insert(0, {
+                'id': 0,
+                'user': 'Краткое содержание предыдущего диалога',
+                'bot': summary_row['summary'],
+                'summary': True
+            })
+        return messages
+    
+    async def get_unsummarized_messages(self, user_id: int) -> List[Dict[str, Any]]:
+        """Get all history turns not covered by the summary, chronologically"""
+        summary_row = await self._get_summary_row(user_id)
+        last_summarized_id = summary_row['last_message_id'] if summary_row else 0
+        
+        async with self._history(user_id).execute(
+            """
+            SELECT id, user_message, bot_response
+            FROM message_history
+            WHERE user_id = ? AND id > ?
+            ORDER BY id
+            """,
+            (user_id, last_summarized_id)
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [self._message(row) for row in rows]
+    
+    async def _get_summary_row(self, user_id: int) -> Optional[aiosqlite.Row]:
+        async with self._history(user_id).execute(
+            "SELECT summary, last_message_id FROM conversation_summaries WHERE user_id = ?",
+            (user_id,)
+        ) as cursor:
+            return await cursor.fetchone()
+    
+    async def get_summary(self, user_id: int) -> Optional[str]:
+        """Get summary of user's compacted history"""
+        row = await self._get_summary_row(user_id)
+        return row['summary'] if row else None
+    
+    async def save_summary(self, user_id: int, summary: str, last_message_id: int):
+        """
+        Save summary covering history up to last_message_id
+        
+        Ignored if that message no longer exists (history was cleared
+        while the summary was being generated).
+        """
+        connection = self._history(user_id)
+        await connection.execute(
+            """
+            INSERT OR REPLACE INTO conversation_summaries (user_id, summary, last_message_id, updated_at)
+            SELECT ?, ?, ?, CURRENT_TIMESTAMP
+            WHERE EXISTS (SELECT 1 FROM message_history WHERE id = ? AND user_id = ?)
+            """,
+            (user_id, summary, last_message_id, last_message_id, user_id)
+        )
+        await connection.commit()
+    
+    async def get_messages_by_ids(self, user_id: int, message_ids: List[int]) -> List[Dict[str, Any]]:
+        """Get user messages by IDs in chronological order"""
+        if not message_ids:
+            return []
+        placeholders = ','.join('?' * len(message_ids))
+        async with self._history(user_id).execute(
+            f"""
+            SELECT id, user_message, bot_response
+            FROM message_history
+            WHERE user_id = ? AND id IN ({placeholders})
+            ORDER BY id
+            """,
+            (user_id, *message_ids)
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [self._message(row) for row in rows]
+    
+    async def add_message(self, user_id: int, user_message: str, bot_response: str) -> int:
+        """
+        Add message to history
+        
+        Returns:
+            ID of the new message
+        """
+        connection = self._history(user_id)
+        cursor = await connection.execute(
             "INSERT INTO message_history (user_id, user_message, bot_response) VALUES (?, ?, ?)",
-            (user_id, user_message, bot_response)
+            (user_id, self._compressor.compress(user_message), self._compressor.compress(bot_response))
         )
-        await self._connection.commit()
+        message_id = cursor.lastrowid
+        await connection.commit()
         
-        # Keep only last N messages
-        await self._connection.execute(
-            """
-            DELETE FROM message_history
+        # Keep only last N messages (older ones go to archive if enabled)
+        outside_window = """
             WHERE user_id = ?
             AND id NOT IN (
                 SELECT id FROM message_history
                 WHERE user_id = ?
-                ORDER BY created_at DESC
+                ORDER BY created_at DESC, id DESC
                 LIMIT ?
             )
+        """
+        params = (user_id, user_id, self.active_window)
+        if self.archive:
+            await connection.execute(
+                f"""
+                INSERT OR IGNORE INTO message_archive (id, user_id, user_message, bot_response, created_at)
+                SELECT id, user_id, user_message, bot_response, created_at
+                FROM message_history
+                {outside_window}
+                """,
+                params
+            )
+        await connection.execute(
+            f"DELETE FROM message_history {outside_window}",
+            params
+        )
+        await connection.execute(
+            """
+            DELETE FROM message_embeddings
+            WHERE user_id = ?
+            AND message_id NOT IN (SELECT id FROM message_history WHERE user_id = ?)
             """,
-            (user_id, user_id, 100)
+            (user_id, user_id)
         )
-        await self._connection.commit()
+        await connection.commit()
+        return message_id
+    
+    async def update_response(self, user_id: int, message_id: int, bot_response: str) -> bool:
+        """
+        Replace bot response of a history message (regenerated or continued answer)
+        
+        Returns:
+            False if the message is no longer in active history
+        """
+        connection = self._history(user_id)
+        cursor = await connection.execute(
+            "UPDATE message_history SET bot_response = ? WHERE id = ? AND user_id = ?",
+            (self._compressor.compress(bot_response), message_id, user_id)
+        )
+        await connection.commit()
+        return cursor.rowcount > 0
     
     async def clear_history(self, user_id: int):
         """Clear user message history"""
-        await self._connection.execute(
+        connection = self._history(user_id)
+        await connection.execute(
             "DELETE FROM message_history WHERE user_id = ?",
             (user_id,)
         )
+        await connection.execute(
+            "DELETE FROM message_embeddings WHERE user_id = ?",
+            (user_id,)
+        )
+        await connection.execute(
+            "DELETE FROM conversation_summaries WHERE user_id = ?",
+            (user_id,)
+        )
+        await connection.execute(
+            "DELETE FROM message_archive WHERE user_id = ?",
+            (user_id,)
+        )
+        await connection.commit()
+    
+    async def get_archived_messages(self, user_id: int, limit: int = 100) -> List[Dict[str, Any]]:
+        """Get archived turns of user (outside the active window), chronologically"""
+        async with self._history(user_id).execute(
+            """
+            SELECT id, user_message, bot_response
+            FROM message_archive
+            WHERE user_id = ?
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+            """,
+            (user_id, limit)
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [self._message(row) for row in reversed(rows)]
+    
+    async def incremental_vacuum(self, pages: int = 0) -> int:
+        """
+        Return free pages to the file system
+        
+        Args:
+            pages: Max pages to free (0 = all)
+        
+        Returns:
+            Number of free pages before vacuum (all files)
+        """
+        total_free = 0
+        for connection in self._connections():
+            async with connection.execute("PRAGMA freelist_count") as cursor:
+                free_pages = (await cursor.fetchone())[0]
+            if free_pages:
+                pragma = f"PRAGMA incremental_vacuum({pages})" if pages > 0 else "PRAGMA incremental_vacuum"
+                async with connection.execute(pragma) as cursor:
+                    await cursor.fetchall()
+                await connection.commit()
+            total_free += free_pages
+        return total_free
+    
+    async def add_message_embedding(self, message_id: int, user_id: int, embedding: bytes):
+        """Store embedding of history message"""
+        connection = self._history(user_id)
+        await connection.execute(
+            "INSERT OR REPLACE INTO message_embeddings (message_id, user_id, embedding) VALUES (?, ?, ?)",
+            (message_id, user_id, embedding)
+        )
+        await connection.commit()
+    
+    async def get_message_embeddings(self, user_id: int) -> List[tuple]:
+        """Get (message_id, embedding) of all user history messages"""
+        async with self._history(user_id).execute(
+            "SELECT message_id, embedding FROM message_embeddings WHERE user_id = ?",
+            (user_id,)
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [(row['message_id'], row['embedding']) for row in rows]
+    
+    async def get_daily_usage(self, day: str) -> Dict[int, Dict[str, float]]:
+        """Get usage of all users for the given day (YYYY-MM-DD)"""
+        async with self._connection.execute(
+            "SELECT user_id, tokens, gpu_seconds FROM daily_usage WHERE day = ?",
+            (day,)
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return {
+                row['user_id']: {'tokens': row['tokens'], 'gpu_seconds': row['gpu_seconds']}
+                for row in rows
+            }
+    
+    async def add_daily_usage(self, rows: List[tuple]):
+        """
+        Add requests to users' daily usage (one commit)
+        
+        Args:
+            rows: (user_id, day, tokens, gpu_seconds, requests)
+        """
+        await self._connection.executemany(
+            """
+            INSERT INTO daily_usage (user_id, day, tokens, gpu_seconds, requests)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, day) DO UPDATE SET
+                tokens = tokens + excluded.tokens,
+                gpu_seconds = gpu_seconds + excluded.gpu_seconds,
+                requests = requests + excluded.requests
+            """,
+            rows
+        )
+        await self._connection.commit()
+    
+    async def add_usage_rows(self, rows: List[tuple], rollups: List[tuple], prune_before: float = 0):
+        """
+        Append usage ledger rows and add them to hourly rollups (one commit)
+        
+        Args:
+            rows: (created_at, user_id, model, prompt_tokens, eval_tokens,
+                   prompt_eval_seconds, eval_seconds, total_seconds,
+                   search_pages, cache_hit)
+            rollups: (hour, user_id, model, requests, prompt_tokens, eval_tokens,
+                      eval_seconds, total_seconds, search_pages, cache_hits, cache_misses)
+            prune_before: delete ledger rows older than this timestamp (0 = keep all)
+        """
+        await self._connection.executemany(
+            """
+            INSERT INTO usage_ledger (
+                created_at, user_id, model, prompt_tokens, eval_tokens,
+                prompt_eval_seconds, eval_seconds, total_seconds, search_pages, cache_hit
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows
+        )
+        await self._connection.executemany(
+            """
+            INSERT INTO usage_hourly (
+                hour, user_id, model, requests, prompt_tokens, eval_tokens,
+                eval_seconds, total_seconds, search_pages, cache_hits, cache_misses
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (hour, user_id, model) DO UPDATE SET
+                requests = requests + excluded.requests,
+                prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                eval_tokens = eval_tokens + excluded.eval_tokens,
+                eval_seconds = eval_seconds + excluded.eval_seconds,
+                total_seconds = total_seconds + excluded.total_seconds,
+                search_pages = search_pages + excluded.search_pages,
+                cache_hits = cache_hits + excluded.cache_hits,
+                cache_misses = cache_misses + excluded.cache_misses
+            """,
+            rollups
+        )
+        if prune_before > 0:
+            await self._connection.execute(
+                "DELETE FROM usage_ledger WHERE created_at < ?",
+                (prune_before,)
+            )
+        await self._connection.commit()
+    
+    async def get_usage_hourly(self, since_hour: str) -> List[Dict[str, Any]]:
+        """Get hourly usage rollups from since_hour ('YYYY-MM-DD HH:00') on"""
+        async with self._connection.execute(
+            "SELECT * FROM usage_hourly WHERE hour >= ?",
+            (since_hour,)
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+    
+    async def get_usage_latencies(self, since: float) -> Dict[str, List[float]]:
+        """Get total generation time (seconds) of ledger rows since timestamp, per model"""
+        latencies: Dict[str, List[float]] = {}
+        async with self._connection.execute(
+            "SELECT model, total_seconds FROM usage_ledger WHERE created_at >= ? AND total_seconds > 0",
+            (since,)
+        ) as cursor:
+            async for row in cursor:
+                latencies.setdefault(row['model'], []).append(row['total_seconds'])
+        return latencies
+    
+    async def get_semantic_cache_entries(self) -> List[tuple]:
+        """Get (slot, model, created_at) of all semantic cache entries"""
+        async with self._connection.execute(
+            "SELECT slot, model, created_at FROM semantic_cache"
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [(row['slot'], row['model'], row['created_at']) for row in rows]
+    
+    async def get_semantic_cache_answer(self, slot: int) -> Optional[str]:
+        """Get cached answer stored in slot"""
+        async with self._connection.execute(
+            "SELECT answer FROM semantic_cache WHERE slot = ?",
+            (slot,)
+        ) as cursor:
+            row = await cursor.fetchone()
+            return row['answer'] if row else None
+    
+    async def put_semantic_cache_entry(
+        self, slot: int, question: str, answer: str, model: str, created_at: float
+    ):
+        """Store semantic cache entry (replaces previous entry in slot)"""
+        await self._connection.execute(
+            """
+            INSERT OR REPLACE INTO semantic_cache (slot, question, answer, model, created_at)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (slot, question, answer, model, created_at)
+        )
+        await self._connection.commit()
+    
+    async def clear_semantic_cache(self):
+        """Delete all semantic cache entries"""
+        await self._connection.execute("DELETE FROM semantic_cache")
+        await self._connection.commit()
+    
+    async def add_job_costs(self, rows: List[tuple], keep: int = 10000):
+        """
+        Store estimated and actual costs of generations, keeping the last `keep` rows (one commit)
+        
+        Args:
+            rows: (model, kind, prompt_tokens, estimated_seconds, actual_seconds,
+                   prompt_eval_count, prompt_eval_duration, eval_count, eval_duration)
+        """
+        await self._connection.executemany(
+            """
+            INSERT INTO job_costs (
+                model, kind, prompt_tokens, estimated_seconds, actual_seconds,
+                prompt_eval_count, prompt_eval_duration, eval_count, eval_duration
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows
+        )
+        await self._connection.execute(
+            "DELETE FROM job_costs WHERE id <= (SELECT MAX(id) FROM job_costs) - ?",
+            (keep,)
+        )
+        await self._connection.commit()
+    
+    async def get_job_costs(self, limit: int = 2000) -> List[Dict[str, Any]]:
+        """Get the most recent job cost records, oldest first"""
+        async with self._connection.execute(
+            """
+            SELECT * FROM (
+                SELECT * FROM job_costs ORDER BY id DESC LIMIT ?
+            ) ORDER BY id
+            """,
+            (limit,)
+        ) as cursor:
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+    
+    async def get_domain_health(self) -> List[Dict[str, Any]]:
+        """Get saved scrape statistics of all domains"""
+        async with self._connection.execute("SELECT * FROM domain_health") as cursor:
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+    
+    async def save_domain_health(self, rows: List[tuple]):
+        """
+        Store scrape statistics of domains.
+        
+        Args:
+            rows: (domain, attempts, successes, consecutive_failures,
+                   avg_chars, fetch_times JSON, opened_until, updated_at)
+        """
+        await self._connection.executemany(
+            """
+            INSERT OR REPLACE INTO domain_health (
+                domain, attempts, successes, consecutive_failures,
+                avg_chars, fetch_times, opened_until, updated_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows
+        )
         await self._connection.commit()
     
     async def close(self):
-        """Close database connection"""
+        """Close database connections"""
         if self._connection:
-            await self._connection.close()
+            for connection in self._connections():
+                await connection.close()
             logger.info("Database connection closed")
\ No newline at end of file
@@ -0,0 +1,413 @@
+"""
+Layout of per-user history across shard files and resharding between layouts.
+
+The shared file (DATABASE_PATH) keeps users, settings and service tables
+plus the current layout (shard count and generation) in db_meta. With one
+shard, history lives in the shared file itself (the original single-file
+layout); with N shards it lives in N files next to it, and a user's rows
+are always in shard crc32(user_id) % N.
+
+Message IDs stay unique across shards and generations: every new shard
+file starts its message_history sequence at generation << 48 | index << 40,
+so rows from different shards never collide when they are merged by a
+later resharding, and a user's newer messages always have larger IDs.
+
+Usage (from project root):
+    # Copy history to the new layout while the bot keeps running
+    # (repeatable, each run only copies rows added since the previous one)
+    python -m database.sharding --shards 4
+    # Stop the bot, then copy the rest, drop rows deleted meanwhile and
+    # switch the layout (the bot also does this at startup if
+    # DATABASE_SHARDS differs from the stored layout)
+    python -m database.sharding --shards 4 --switch
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import zlib
+from typing import Dict, List, Optional, Set, Tuple
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+# Max shards (shard index has 8 bits in message IDs)
+MAX_SHARDS = 256
+
+# PRAGMA auto_vacuum value for INCREMENTAL mode
+AUTO_VACUUM_INCREMENTAL = 2
+
+HISTORY_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS message_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        user_message TEXT NOT NULL,
+        bot_response TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (user_id)
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_message_history_user_id
+    ON message_history(user_id, created_at DESC)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS message_archive (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        user_message TEXT NOT NULL,
+        bot_response TEXT NOT NULL,
+        created_at TIMESTAMP,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_message_archive_user_id
+    ON message_archive(user_id, created_at DESC)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS conversation_summaries (
+        user_id INTEGER PRIMARY KEY,
+        summary TEXT NOT NULL,
+        last_message_id INTEGER NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS message_embeddings (
+        message_id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        embedding BLOB NOT NULL
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_message_embeddings_user_id
+    ON message_embeddings(user_id)
+    """,
+)
+
+# History tables and their rowid column (conversation_summaries rows are
+# updated in place, so they are copied in full on every pass)
+HISTORY_TABLES: Dict[str, str] = {
+    'message_history': 'id',
+    'message_archive': 'id',
+    'message_embeddings': 'message_id',
+    'conversation_summaries': 'user_id',
+}
+
+
+def shard_of(user_id: int, shards: int) -> int:
+    """Shard index of a user (crc32 spreads sequential IDs evenly)"""
+    if shards == 1:
+        return 0
+    return zlib.crc32(str(user_id).encode()) % shards
+
+
+def shard_paths(db_path: str, shards: int, generation: int) -> List[str]:
+    """History files of a layout (the shared file itself for one shard)"""
+    if shards == 1:
+        return [db_path]
+    base = os.path.splitext(db_path)[0]
+    return [f"{base}.g{generation}.shard{index}of{shards}.db" for index in range(shards)]
+
+
+async def configure_connection(connection: aiosqlite.Connection):
+    """WAL and busy timeout, so several processes can share the files"""
+    await connection.execute("PRAGMA journal_mode=WAL")
+    await connection.execute("PRAGMA busy_timeout = 5000")
+
+
+async def create_history_tables(connection: aiosqlite.Connection, generation: int = 0, index: int = 0):
+    """Create history tables and start message IDs of this shard in its own range"""
+    for statement in HISTORY_SCHEMA:
+        await connection.execute(statement)
+    if generation == 0:
+        return
+    first_id = (generation << 48) | (index << 40)
+    async with connection.execute(
+        "SELECT seq FROM sqlite_sequence WHERE name = 'message_history'"
+    ) as cursor:
+        row = await cursor.fetchone()
+    if row is None:
+        await connection.execute(
+            "INSERT INTO sqlite_sequence (name, seq) VALUES ('message_history', ?)", (first_id,)
+        )
+    elif row[0] < first_id:
+        await connection.execute(
+            "UPDATE sqlite_sequence SET seq = ? WHERE name = 'message_history'", (first_id,)
+        )
+
+
+async def create_meta_table(connection: aiosqlite.Connection):
+    await connection.execute("""
+        CREATE TABLE IF NOT EXISTS db_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    """)
+    await connection.execute("""
+        CREATE TABLE IF NOT EXISTS reshard_progress (
+            shards INTEGER NOT NULL,
+            generation INTEGER NOT NULL,
+            source INTEGER NOT NULL,
+            tbl TEXT NOT NULL,
+            last_rowid INTEGER NOT NULL,
+            PRIMARY KEY (shards, generation, source, tbl)
+        )
+    """)
+
+
+async def read_layout(connection: aiosqlite.Connection) -> Tuple[int, int]:
+    """(shards, generation) stored in db_meta, (1, 0) for the original layout"""
+    async with connection.execute(
+        "SELECT key, value FROM db_meta WHERE key IN ('shards', 'generation')"
+    ) as cursor:
+        meta = {row[0]: int(row[1]) for row in await cursor.fetchall()}
+    return meta.get('shards', 1), meta.get('generation', 0)
+
+
+async def write_layout(connection: aiosqlite.Connection, shards: int, generation: int):
+    await connection.executemany(
+        "INSERT OR REPLACE INTO db_meta (key, value) VALUES (?, ?)",
+        (('shards', str(shards)), ('generation', str(generation)))
+    )
+
+
+class Resharder:
+    """
+    Moves history from the current layout to one with `shards` shards.
+
+    copy() can run any number of times while the bot is writing to the
+    current layout; switch() must run while nothing writes history. It
+    copies the rest, brings the targets in line with the sources (rows
+    archived, embedded or deleted in the meantime) and records the new
+    layout.
+    """
+
+    def __init__(self, db_path: str, shards: int, batch_size: int = 5000):
+        if not 1 <= shards <= MAX_SHARDS:
+            raise ValueError(f"Shard count must be between 1 and {MAX_SHARDS}")
+        self.db_path = db_path
+        self.shards = shards
+        self.batch_size = batch_size
+        self.old_shards = 1
+        self.generation = 0
+        self._shared: Optional[aiosqlite.Connection] = None
+        self._owns_shared = False
+        self._sources: List[aiosqlite.Connection] = []
+        self._targets: List[aiosqlite.Connection] = []
+
+    @property
+    def needed(self) -> bool:
+        return self.shards != self.old_shards
+
+    async def open(self, shared: Optional[aiosqlite.Connection] = None):
+        """Open current layout and create target files (shared connection may be reused)"""
+        self._owns_shared = shared is None
+        self._shared = shared or await aiosqlite.connect(self.db_path)
+        if self._owns_shared:
+            await configure_connection(self._shared)
+        await create_meta_table(self._shared)
+        self.old_shards, old_generation = await read_layout(self._shared)
+        if not self.needed:
+            return
+        self.generation = old_generation + 1
+
+        for path in shard_paths(self.db_path, self.old_shards, old_generation):
+            self._sources.append(await self._connect(path))
+        for index, path in enumerate(shard_paths(self.db_path, self.shards, self.generation)):
+            connection = await self._connect(path)
+            await create_history_tables(connection, self.generation, index)
+            await connection.commit()
+            self._targets.append(connection)
+
+    async def _connect(self, path: str) -> aiosqlite.Connection:
+        if path == self.db_path:
+            return self._shared
+        connection = await aiosqlite.connect(path)
+        # Takes effect only while the file has no tables, i.e. for new
+        # targets: they never need the startup VACUUM conversion
+        await connection.execute(f"PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}")
+        await configure_connection(connection)
+        return connection
+
+    async def _get_progress(self, source: int, table: str) -> int:
+        async with self._shared.execute(
+            """
+            SELECT last_rowid FROM reshard_progress
+            WHERE shards = ? AND generation = ? AND source = ? AND tbl = ?
+            """,
+            (self.shards, self.generation, source, table)
+        ) as cursor:
+            row = await cursor.fetchone()
+        return row[0] if row else 0
+
+    async def _set_progress(self, source: int, table: str, last_rowid: int):
+        await self._shared.execute(
+            "INSERT OR REPLACE INTO reshard_progress VALUES (?, ?, ?, ?, ?)",
+            (self.shards, self.generation, source, table, last_rowid)
+        )
+        await self._shared.commit()
+
+    async def _copy_table(self, source_index: int, table: str, key: str) -> int:
+        source = self._sources[source_index]
+        # Summaries change in place: copy all of them on every pass
+        last_rowid = 0 if table == 'conversation_summaries' else await self._get_progress(source_index, table)
+        copied = 0
+        while True:
+            async with source.execute(
+                f"SELECT * FROM {table} WHERE {key} > ? ORDER BY {key} LIMIT ?",
+                (last_rowid, self.batch_size)
+            ) as cursor:
+                rows = await cursor.fetchall()
+                columns = [column[0] for column in cursor.description]
+            if not rows:
+                break
+            await self._insert(table, columns, rows)
+            last_rowid = rows[-1][columns.index(key)]
+            copied += len(rows)
+            if table != 'conversation_summaries':
+                await self._set_progress(source_index, table, last_rowid)
+        return copied
+
+    async def copy(self) -> int:
+        """Copy rows added since the previous pass; returns number of rows copied"""
+        copied = 0
+        for source_index in range(len(self._sources)):
+            for table, key in HISTORY_TABLES.items():
+                copied += await self._copy_table(source_index, table, key)
+        logger.info(f"🔀 Copied {copied} history row(s) to {self.shards} shard(s)")
+        return copied
+
+    async def _keys(self, connection: aiosqlite.Connection, table: str, key: str) -> Set[int]:
+        async with connection.execute(f"SELECT {key} FROM {table}") as cursor:
+            return {row[0] for row in await cursor.fetchall()}
+
+    async def _insert(self, table: str, columns: List[str], rows: List[tuple]):
+        """Insert rows into the shards of their users"""
+        user_column = columns.index('user_id')
+        by_shard: Dict[int, List[tuple]] = {}
+        for row in rows:
+            by_shard.setdefault(shard_of(row[user_column], self.shards), []).append(tuple(row))
+        statement = (
+            f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})"
+        )
+        for index, shard_rows in by_shard.items():
+            await self._targets[index].executemany(statement, shard_rows)
+            await self._targets[index].commit()
+
+    async def _reconcile(self) -> Tuple[int, int]:
+        """
+        Make target keys equal to source keys.
+
+        Rows can be missed by copy() (archived and embedded rows get old
+        IDs) or deleted from the source after being copied.
+
+        Returns:
+            (rows copied, rows deleted)
+        """
+        copied = deleted = 0
+        for table, key in HISTORY_TABLES.items():
+            source_keys = [await self._keys(source, table, key) for source in self._sources]
+            existing: Set[int] = set().union(*source_keys)
+            present: Set[int] = set()
+            for target in self._targets:
+                target_keys = await self._keys(target, table, key)
+                removed = target_keys - existing
+                if removed:
+                    await target.executemany(
+                        f"DELETE FROM {table} WHERE {key} = ?", [(k,) for k in removed]
+                    )
+                    await target.commit()
+                    deleted += len(removed)
+                present |= target_keys - removed
+
+            for source, keys in zip(self._sources, source_keys):
+                missing = sorted(keys - present)
+                for start in range(0, len(missing), 500):
+                    batch = missing[start:start + 500]
+                    async with source.execute(
+                        f"SELECT * FROM {table} WHERE {key} IN ({','.join('?' * len(batch))})",
+                        batch
+                    ) as cursor:
+                        rows = await cursor.fetchall()
+                        columns = [column[0] for column in cursor.description]
+                    await self._insert(table, columns, rows)
+                    copied += len(rows)
+        return copied, deleted
+
+    async def switch(self):
+        """Finish copying and make the new layout current (history writes must be stopped)"""
+        if not self.needed:
+            return
+        await self.copy()
+        copied, deleted = await self._reconcile()
+        await write_layout(self._shared, self.shards, self.generation)
+        await self._shared.execute(
+            "DELETE FROM reshard_progress WHERE generation = ?", (self.generation,)
+        )
+        await self._shared.commit()
+
+        # History left in the shared file by the single-file layout is now stale
+        if self.old_shards == 1 and self.shards > 1:
+            for table in HISTORY_TABLES:
+                await self._shared.execute(f"DELETE FROM {table}")
+            await self._shared.commit()
+
+        logger.info(
+            f"🔀 History resharded from {self.old_shards} to {self.shards} shard(s) "
+            f"(generation {self.generation}, {copied} late row(s) copied, {deleted} removed row(s) dropped)"
+        )
+        old_files = [
+            path for path in shard_paths(self.db_path, self.old_shards, self.generation - 1)
+            if path != self.db_path
+        ]
+        if old_files:
+            logger.info(f"🔀 Old shard files can be deleted: {', '.join(old_files)}")
+
+    async def close(self):
+        for connection in self._sources + self._targets:
+            if connection is not self._shared:
+                await connection.close()
+        self._sources = []
+        self._targets = []
+        if self._owns_shared and self._shared is not None:
+            await self._shared.close()
+
+
+async def _run(db_path: str, shards: int, switch: bool):
+    resharder = Resharder(db_path, shards)
+    try:
+        await resharder.open()
+        if not resharder.needed:
+            print(f"History already uses {shards} shard(s)")
+            return
+        if switch:
+            await resharder.switch()
+            print(f"Switched to {shards} shard(s), set DATABASE_SHARDS={shards} before starting the bot")
+        else:
+            copied = await resharder.copy()
+            print(f"Copied {copied} row(s); run again with --switch after stopping the bot")
+    finally:
+        await resharder.close()
+
+
+def main():
+    from config import Config
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shards', type=int, required=True, help='Target number of history shards')
+    parser.add_argument('--switch', action='store_true', help='Finish and switch layout (bot must be stopped)')
+    parser.add_argument('--db', default=Config.DATABASE_PATH, help='Shared database file (DATABASE_PATH)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    asyncio.run(_run(args.db, args.shards, args.switch))
+
+
+if __name__ == '__main__':
+    main()
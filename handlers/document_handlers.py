@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from aiogram import Router, F
+from aiogram.types import Message
+
+from database.db_manager import DatabaseManager
+from keyboards.main_keyboard import get_main_keyboard, get_stop_keyboard
+from services.container import ServiceContainer
+from services.document_processor import PDF_EXTENSIONS, PYPDF_AVAILABLE, TEXT_EXTENSIONS
+from services.overload_controller import OverloadError
+from services.request_tracker import RequestRejectedError, RequestCancelledError
+from utils.helpers import format_eta
+from utils.message_splitter import MessageSplitter
+
+logger = logging.getLogger(__name__)
+router = Router(name='document_handlers')
+
+# Minimum interval between progress edits of the status message (seconds)
+PROGRESS_INTERVAL = 2.0
+
+
+@router.message(F.document)
+async def handle_document(message: Message, db: DatabaseManager, services: ServiceContainer):
+    """Handle uploaded documents - question in caption or summary"""
+    user_id = message.from_user.id
+    config = services.config
+    document = message.document
+    extension = os.path.splitext(document.file_name or '')[1].lower()
+
+    if not services.document_processor.is_supported(extension):
+        supported = TEXT_EXTENSIONS + (PDF_EXTENSIONS if PYPDF_AVAILABLE else ())
+        await message.answer(
+            f"📄 Поддерживаются документы: {', '.join(supported)}.",
+            reply_markup=get_main_keyboard()
+        )
+        return
+
+    if document.file_size and document.file_size > config.DOCUMENT_MAX_SIZE_MB * 1024 * 1024:
+        await message.answer(
+            f"📄 Документ слишком большой. Максимальный размер: {config.DOCUMENT_MAX_SIZE_MB} МБ.",
+            reply_markup=get_main_keyboard()
+        )
+        return
+
+    try:
+        await services.request_tracker.run(
+            user_id, _process_document(message, db, services, extension)
+        )
+    except RequestRejectedError:
+        await message.answer(
+            "⏳ Предыдущий запрос ещё обрабатывается. Дождитесь ответа или отправьте /stop.",
+            reply_markup=get_main_keyboard()
+        )
+    except RequestCancelledError:
+        logger.info(f"⏹ Document request of user {user_id} was cancelled")
+
+
+async def _process_document(message: Message, db: DatabaseManager, services: ServiceContainer, extension: str):
+    """Download document and answer it with map-reduce (runs as tracked request)"""
+    user_id = message.from_user.id
+    config = services.config
+
+    settings = await db.get_user_settings(user_id)
+    model = settings['selected_model'] or config.DEFAULT_MODEL
+
+    # Documents need the full context, so they are not degraded, only shed
+    try:
+        services.overload_controller.plan(model)
+    except OverloadError as e:
+        await message.answer(
+            f"⏳ Сервер сейчас перегружен. Ожидание ответа заняло бы {format_eta(e.eta)}. "
+            f"Попробуйте повторить запрос позже.",
+            reply_markup=get_main_keyboard()
+        )
+        return
+
+    question = message.caption.strip() if message.caption else None
+    status_msg = await message.answer("📄 Загружаю документ...", reply_markup=get_stop_keyboard())
+    last_edit = 0.0
+
+    async def on_progress(done: int, total: int, read_all: bool):
+        nonlocal last_edit
+        now = time.monotonic()
+        if now - last_edit < PROGRESS_INTERVAL and not (read_all and done == total):
+            return
+        last_edit = now
+        text = f"📄 Обработано фрагментов: {done} из {total}{'' if read_all else '+'}"
+        if read_all and done == total:
+            text = "📝 Объединяю результаты..."
+        try:
+            await status_msg.edit_text(text, reply_markup=get_stop_keyboard())
+        except Exception as edit_error:
+            logger.debug(f"Could not update status message: {edit_error}")
+
+    fd, path = tempfile.mkstemp(suffix=extension)
+    os.close(fd)
+    try:
+        await message.bot.download(message.document.file_id, destination=path)
+        await status_msg.edit_text("📄 Читаю документ...", reply_markup=get_stop_keyboard())
+
+        logger.info(
+            f"📄 Document from user {user_id}: {message.document.file_name} "
+            f"({message.document.file_size} bytes), question: {question!r}"
+        )
+        result = await services.document_processor.process(
+            services.document_processor.read_chunks(path, extension),
+            question, model, user_id=user_id, on_progress=on_progress
+        )
+
+        await status_msg.delete()
+        status_msg = None
+
+        if not result.text:
+            await message.answer(
+                "❌ Не удалось обработать документ: в нём нет текста или модель не ответила.",
+                reply_markup=get_main_keyboard()
+            )
+            return
+
+        text = result.text
+        if result.truncated:
+            text += f"\n\n⚠️ Документ слишком длинный, обработаны первые {result.chunks} фрагментов."
+        logger.info(f"📤 Document answer: {len(text)} chars from {result.chunks} chunk(s)")
+
+        message_chunks = MessageSplitter.split_message(text)
+        for idx, chunk in enumerate(message_chunks):
+            keyboard = get_main_keyboard() if idx == len(message_chunks) - 1 else None
+            await message.answer(chunk, reply_markup=keyboard)
+
+    except asyncio.CancelledError:
+        logger.info(f"⏹ Document processing for user {user_id} cancelled")
+        if status_msg:
+            try:
+                await status_msg.edit_text("⏹ Обработка документа остановлена.")
+            except Exception as edit_error:
+                logger.debug(f"Could not update status message: {edit_error}")
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error processing document: {e}", exc_info=True)
+        await message.answer(
+            "❌ Произошла ошибка при обработке документа.",
+            reply_markup=get_main_keyboard()
+        )
+    finally:
+        os.remove(path)
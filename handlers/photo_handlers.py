@@ -1,51 +1,97 @@
-import os
+import asyncio
+import io
 import logging
+from typing import List
 from aiogram import Router, F
 from aiogram.types import Message
-import ollama
 
 from database.db_manager import DatabaseManager
-from config import Config
 from keyboards.main_keyboard import get_main_keyboard
+from services.container import ServiceContainer
+from services.overload_controller import OverloadError
+from services.request_tracker import RequestRejectedError, RequestCancelledError
+from utils.helpers import format_eta
 
 logger = logging.getLogger(__name__)
 router = Router(name='photo_handlers')
 
-config = Config()
+
+async def _download_photo(message: Message) -> bytes:
+    """Download largest size of the photo into memory"""
+    buffer = io.BytesIO()
+    await message.bot.download(message.photo[-1].file_id, destination=buffer)
+    return buffer.getvalue()
 
 
 @router.message(F.photo)
-async def handle_photo(message: Message, db: DatabaseManager):
-    """Handle photo messages"""
+async def handle_photo(message: Message, db: DatabaseManager, services: ServiceContainer):
+    """Handle photo messages (all photos of an album are answered together)"""
+    # Photos of one album arrive as separate updates
+    album = await services.media_group_collector.collect(message)
+    if album is None:
+        return
+    
+    user_id = message.from_user.id
+    try:
+        await services.request_tracker.run(user_id, _answer_photos(message, album, db, services))
+    except RequestRejectedError:
+        await message.answer(
+            "⏳ Предыдущий запрос ещё обрабатывается. Дождитесь ответа или отправьте /stop.",
+            reply_markup=get_main_keyboard()
+        )
+    except RequestCancelledError:
+        logger.info(f"⏹ Photo request of user {user_id} was cancelled")
+
+
+async def _answer_photos(
+    message: Message, album: List[Message], db: DatabaseManager, services: ServiceContainer
+):
+    """Download photos and answer them with one vision request (runs as tracked request)"""
     user_id = message.from_user.id
+    config = services.config
     
-    # Download photo
-    photo = message.photo[-1]
-    file = await message.bot.get_file(photo.file_id)
-    photo_path = f"temp_photo_{user_id}_{photo.file_id}.jpg"
+    settings = await db.get_user_settings(user_id)
+    model = settings['selected_model'] or config.DEFAULT_MODEL
     
+    # Vision requests are not degraded (fallback model may lack vision), only shed
     try:
-        await message.bot.download_file(file.file_path, photo_path)
+        services.overload_controller.plan(model)
+    except OverloadError as e:
+        await message.answer(
+            f"⏳ Сервер сейчас перегружен. Ожидание ответа заняло бы {format_eta(e.eta)}. "
+            f"Попробуйте повторить запрос позже.",
+            reply_markup=get_main_keyboard()
+        )
+        return
+    
+    try:
+        # Download all photos concurrently
+        images = await asyncio.gather(*(_download_photo(m) for m in album))
         
-        # Get user settings
-        settings = await db.get_user_settings(user_id)
-        model = settings['selected_model'] or config.DEFAULT_MODEL
+        # Album caption is attached to one of its photos
+        caption = next((m.caption for m in album if m.caption), None)
+        if caption:
+            prompt = caption
+        elif len(images) > 1:
+            prompt = "Что изображено на этих фотографиях?"
+        else:
+            prompt = "Что изображено на этой фотографии?"
         
-        # Analyze image with Ollama
-        response = ollama.chat(
-            model=model,
-            messages=[{
-                'role': 'user',
-                'content': message.caption or "Что изображено на этой фотографии?",
-                'images': [photo_path]
-            }]
-        )
+        await message.bot.send_chat_action(message.chat.id, "typing")
         
-        await message.answer(response['message']['content'], reply_markup=get_main_keyboard())
+        # Analyze all images with one vision request
+        response = await services.ollama_service.analyze_images(
+            prompt, images, model, user_id=user_id
+        )
         
+        await message.answer(
+            response or "Модель не вернула ответ.",
+            reply_markup=get_main_keyboard()
+        )
+    
+    except asyncio.CancelledError:
+        logger.info(f"⏹ Image analysis for user {user_id} cancelled")
+        raise
     except Exception as e:
         logger.error(f"Error analyzing image: {e}")
         await message.answer("Произошла ошибка при анализе изображения.")
-    finally:
-        if os.path.exists(photo_path):
-            os.remove(photo_path)
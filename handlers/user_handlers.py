@@ -1,32 +1,31 @@
 from aiogram import Router, F
-from aiogram.filters import Command
-from aiogram.types import Message
+from aiogram.filters import Command, CommandObject
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup
+import asyncio
 import logging
-import re
+from typing import Optional
 
 from database.db_manager import DatabaseManager
-from keyboards.main_keyboard import get_main_keyboard, get_model_keyboard
+from keyboards.main_keyboard import get_answer_keyboard, get_main_keyboard, get_model_keyboard, get_stop_keyboard
+from services.answer_store import StoredAnswer
+from services.container import ServiceContainer
 from services.ollama_service import OllamaService
-from services.search_service import SearchService
+from services.overload_controller import OverloadError
+from services.request_tracker import RequestRejectedError, RequestCancelledError
+from utils.helpers import format_eta, strip_all_html_tags
 from utils.message_splitter import MessageSplitter
-from config import Config
+from utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
 router = Router(name='user_handlers')
-config = Config()
-ollama_service = OllamaService(config)
-search_service = SearchService(config) if config.SEARCH_ENABLED else None
-
-# Log initialization
-logger.info(f"Search service initialized: {search_service is not None}")
-logger.info(f"Config SEARCH_ENABLED: {config.SEARCH_ENABLED}")
 
 
 @router.message(Command("start"))
-async def cmd_start(message: Message, db: DatabaseManager):
+async def cmd_start(message: Message, db: DatabaseManager, services: ServiceContainer):
     """Handle /start command"""
     user_id = message.from_user.id
+    config = services.config
     
     await db.create_user(
         user_id=user_id,
@@ -47,6 +46,138 @@ async def cmd_start(message: Message, db: DatabaseManager):
     )
 
 
+@router.message(Command("stop"))
+async def cmd_stop(message: Message, services: ServiceContainer):
+    """Handle /stop command - cancel running generation"""
+    if services.request_tracker.cancel(message.from_user.id):
+        await message.answer("⏹ Генерация остановлена.", reply_markup=get_main_keyboard())
+    else:
+        await message.answer("Нет активных запросов.", reply_markup=get_main_keyboard())
+
+
+@router.callback_query(F.data == "stop_generation")
+async def stop_generation(callback: CallbackQuery, services: ServiceContainer):
+    """Handle inline stop button"""
+    if services.request_tracker.cancel(callback.from_user.id):
+        await callback.answer("⏹ Генерация остановлена")
+    else:
+        await callback.answer("Нет активных запросов")
+
+
+@router.callback_query(F.data.startswith("regen:") | F.data.startswith("cont:"))
+async def answer_action(callback: CallbackQuery, db: DatabaseManager, services: ServiceContainer):
+    """Handle regenerate / continue buttons under an answer"""
+    user_id = callback.from_user.id
+    action, key = callback.data.split(':', 1)
+    answer = services.answer_store.get(key, user_id)
+    if answer is None:
+        await callback.answer("Ответ устарел. Отправьте вопрос заново.", show_alert=True)
+        return
+    
+    regenerate = action == 'regen'
+    if not regenerate and answer.remaining:
+        # The cut-off part is already generated: just send it
+        await callback.answer()
+        await _remove_buttons(callback.message)
+        config = services.config
+        piece = answer.remaining[:config.MAX_MESSAGE_LENGTH]
+        answer.sent += len(piece)
+        if answer.message_id is not None:
+            await db.update_response(user_id, answer.message_id, answer.output[:answer.sent])
+        await _send_answer(callback.message, piece, get_answer_keyboard(key, answer.can_continue))
+        return
+    
+    if not regenerate and answer.context is None:
+        await callback.answer("Этот ответ нельзя продолжить.", show_alert=True)
+        return
+    
+    # Callbacks skip the throttling middleware; a new generation is charged like
+    # a text message (search is never repeated)
+    if services.quota_manager.is_exceeded(user_id):
+        await callback.answer("📊 Дневной лимит запросов исчерпан. Он обновится завтра.", show_alert=True)
+        return
+    retry_after = services.rate_limiter.check(user_id, 'text')
+    if retry_after > 0:
+        await callback.answer(f"⏳ Слишком много запросов. Попробуйте через {int(retry_after) + 1} сек.", show_alert=True)
+        return
+    
+    await callback.answer()
+    try:
+        await services.request_tracker.run(
+            user_id, _rework_answer(callback.message, db, services, key, answer, regenerate)
+        )
+    except RequestRejectedError:
+        await callback.message.answer(
+            "⏳ Предыдущий запрос ещё обрабатывается. Дождитесь ответа или отправьте /stop.",
+            reply_markup=get_main_keyboard()
+        )
+    except RequestCancelledError:
+        logger.info(f"⏹ Request of user {user_id} was cancelled")
+
+
+@router.message(Command("metrics"))
+async def cmd_metrics(message: Message, services: ServiceContainer):
+    """Handle /metrics command - show bot metrics (admins only)"""
+    if message.from_user.id not in services.config.ADMIN_USER_IDS:
+        return
+    services.overload_controller.evaluate()
+    await message.answer(metrics.format() or "Метрик пока нет.")
+
+
+@router.message(Command("stats"))
+async def cmd_stats(message: Message, command: CommandObject, services: ServiceContainer):
+    """
+    Handle /stats command - usage report (admins only).
+    
+    /stats [hours] - top users, per-model throughput and latency
+    percentiles over the last hours (default 24).
+    """
+    if message.from_user.id not in services.config.ADMIN_USER_IDS:
+        return
+    if services.usage_ledger is None:
+        await message.answer("Учёт использования выключен (USAGE_LEDGER_ENABLED=false).")
+        return
+    args = (command.args or '').strip()
+    hours = int(args) if args.isdigit() and int(args) > 0 else 24
+    
+    text = await services.usage_ledger.report(services.db, hours)
+    for chunk in MessageSplitter.split_message(text):
+        await message.answer(chunk)
+
+
+@router.message(Command("memory"))
+async def cmd_memory(message: Message, command: CommandObject, services: ServiceContainer):
+    """
+    Handle /memory command - memory report (admins only).
+    
+    /memory snapshot - take tracemalloc baseline, /memory diff - growth
+    since the previous snapshot, /memory stop - stop tracing.
+    """
+    if message.from_user.id not in services.config.ADMIN_USER_IDS:
+        return
+    monitor = services.memory_monitor
+    action = (command.args or '').strip().lower()
+    
+    if action == 'snapshot':
+        lines = await asyncio.to_thread(monitor.snapshot)
+        text = "🔬 Снимок сохранён. Крупнейшие места выделения памяти:\n" + "\n".join(lines)
+    elif action == 'diff':
+        lines = await asyncio.to_thread(monitor.diff)
+        if lines is None:
+            text = "Нет базового снимка. Сначала выполните /memory snapshot."
+        else:
+            text = "🔬 Изменения с прошлого снимка:\n" + "\n".join(lines)
+    elif action == 'stop':
+        monitor.stop_tracing()
+        text = "🔬 tracemalloc остановлен."
+    else:
+        # Task list must be read on the event loop, the object walk runs in a thread
+        text = await asyncio.to_thread(monitor.report, monitor.task_counts())
+    
+    for chunk in MessageSplitter.split_message(text):
+        await message.answer(chunk)
+
+
 # Button handlers
 @router.message(F.text == "История On/Off")
 async def toggle_history(message: Message, db: DatabaseManager):
@@ -70,9 +201,9 @@ async def clear_history(message: Message, db: DatabaseManager):
 
 
 @router.message(F.text == "Выбор модели")
-async def show_models(message: Message):
+async def show_models(message: Message, services: ServiceContainer):
     """Show available models via button"""
-    models = ollama_service.get_available_models()
+    models = services.ollama_service.get_available_models()
     if not models:
         await message.answer(
             "⚠️ Не удалось получить список моделей. Убедитесь, что Ollama запущена.",
@@ -93,13 +224,13 @@ async def back_to_main(message: Message):
 
 
 @router.message(F.text)
-async def handle_text(message: Message, db: DatabaseManager):
+async def handle_text(message: Message, db: DatabaseManager, services: ServiceContainer):
     """Handle text messages - questions and model selection"""
     user_id = message.from_user.id
     user_input = message.text
     
     # Check if it's a model selection
-    available_models = ollama_service.get_available_models()
+    available_models = services.ollama_service.get_available_models()
     if user_input in available_models:
         await db.update_setting(user_id, 'selected_model', user_input)
         await message.answer(
@@ -108,6 +239,34 @@ async def handle_text(message: Message, db: DatabaseManager):
         )
         return
     
+    # Merge messages sent in quick succession into one question
+    user_input = await services.message_coalescer.collect(user_id, user_input)
+    if user_input is None:
+        return
+    
+    try:
+        await services.request_tracker.run(user_id, _answer_text(message, db, services, user_input))
+    except RequestRejectedError:
+        await message.answer(
+            "⏳ Предыдущий запрос ещё обрабатывается. Дождитесь ответа или отправьте /stop.",
+            reply_markup=get_main_keyboard()
+        )
+    except RequestCancelledError:
+        logger.info(f"⏹ Request of user {user_id} was cancelled")
+
+
+async def _answer_text(message: Message, db: DatabaseManager, services: ServiceContainer, user_input: str):
+    """Generate and send answer to text message (runs as tracked request)"""
+    user_id = message.from_user.id
+    config = services.config
+    ollama_service = services.ollama_service
+    search_service = services.search_service
+    semantic_cache = services.semantic_cache
+    memory_store = services.memory_store
+    history_compactor = services.history_compactor
+    usage_ledger = services.usage_ledger
+    status_msg = None
+    
     # Show typing indicator
     await message.bot.send_chat_action(message.chat.id, "typing")
     
@@ -126,21 +285,58 @@ async def handle_text(message: Message, db: DatabaseManager):
     logger.info(f"   🤖 Model: {model}")
     logger.info("=" * 80)
     
+    with_history = settings['history_mode'] == 'with_history'
+    
+    # AUTOMATIC search detection: only by '?' at the end
+    should_search = (
+        search_service is not None and
+        config.SEARCH_ENABLED and
+        ends_with_question
+    )
+    # Answers from live search go stale quickly: never served from or stored in the cache
+    use_cache = semantic_cache is not None and not with_history and not should_search
+    
+    question_embedding = None
+    if (memory_store is not None and with_history) or use_cache:
+        question_embedding = await ollama_service.get_embedding(user_input)
+    
     # Get history if enabled
     messages = []
-    if settings['history_mode'] == 'with_history':
-        messages = await db.get_message_history(user_id, config.MAX_HISTORY_LENGTH)
+    if with_history:
+        if memory_store is not None:
+            messages = await memory_store.recall(db, user_id, question_embedding)
+        else:
+            messages = await db.get_message_history(user_id, config.MAX_HISTORY_LENGTH)
         logger.info(f"📚 Loaded {len(messages)} messages from history")
     
+    # Answer from semantic cache (only questions asked without history context or search)
+    if use_cache and question_embedding is not None:
+        cached_response = await semantic_cache.lookup(question_embedding, model)
+        if usage_ledger is not None:
+            if cached_response is not None:
+                usage_ledger.record(user_id, model, cache_hit=True)
+            else:
+                usage_ledger.note(cache_hit=False)
+        if cached_response is not None:
+            await _send_answer(message, cached_response)
+            return
+    
+    # Degrade or refuse under overload (cache hits above cost nothing)
+    try:
+        degradation = services.overload_controller.plan(model)
+    except OverloadError as e:
+        await _send_overloaded(message, e)
+        return
+    if degradation.model != model:
+        logger.info(f"🚦 Using fallback model {degradation.model} instead of {model}")
+        model = degradation.model
+    
     try:
         response = None
-        
-        # AUTOMATIC search detection: only by '?' at the end
-        should_search = (
-            search_service is not None and
-            config.SEARCH_ENABLED and
-            ends_with_question
-        )
+        # Filled by OllamaService with the uncut answer and Ollama context
+        details = {}
+        # Set only if the answer was generated from search results
+        used_search_context = None
         
         logger.info(f"🔍 SEARCH DECISION: {should_search}")
         
@@ -148,13 +344,24 @@ async def handle_text(message: Message, db: DatabaseManager):
             logger.info(f"🚀 STARTING GOOGLE SEARCH WORKFLOW for query: {user_input}")
             
             # Send search status
-            search_msg = await message.answer("🔍 Выполняю поиск в Google...")
+            status_msg = await message.answer(
+                "🔍 Выполняю поиск в Google...",
+                reply_markup=get_stop_keyboard()
+            )
+            
+            # Load the model while the search runs
+            warm_task = asyncio.create_task(ollama_service.warm_model(model))
             
             try:
                 # Perform Google search
                 logger.info("📡 Calling search_service.search()...")
-                search_results = await search_service.search(user_input)
+                search_details = {}
+                search_results = await search_service.search(
+                    user_input, degradation.search_pages, details=search_details
+                )
                 logger.info(f"📊 Google Search returned {len(search_results)} results")
+                if usage_ledger is not None:
+                    usage_ledger.note(search_pages=search_details.get('pages_fetched', 0))
                 
                 if search_results:
                     logger.info("✅ Search successful, formatting context for LLM...")
@@ -167,7 +374,10 @@ async def handle_text(message: Message, db: DatabaseManager):
                     logger.info(f"📝 Search context length: {len(search_context)} chars")
                     
                     # Update status
-                    await search_msg.edit_text("🤖 Анализирую результаты поиска...")
+                    await status_msg.edit_text(
+                        "🤖 Анализирую результаты поиска...",
+                        reply_markup=get_stop_keyboard()
+                    )
                     
                     # Get response with search context (NO history to reduce context size)
                     logger.info("🤖 Sending to LLM with search context...")
@@ -175,51 +385,214 @@ async def handle_text(message: Message, db: DatabaseManager):
                         user_input,
                         search_context,
                         [],  # Empty history for search requests
-                        model
+                        model,
+                        user_id=user_id,
+                        options=degradation.options,
+                        details=details
                     )
+                    used_search_context = search_context
                     logger.info(f"✅ LLM response received: {len(response)} chars")
-                    
-                    # Delete search status message
-                    await search_msg.delete()
                 else:
                     logger.warning("⚠️ Search returned no results, falling back")
-                    await search_msg.delete()
-                    await message.answer("⚠️ Не удалось найти результаты. Отвечаю без поиска...")
-                    response = await ollama_service.get_response(user_input, messages, model)
+                    await status_msg.edit_text(
+                        "⚠️ Не удалось найти результаты. Отвечаю без поиска...",
+                        reply_markup=get_stop_keyboard()
+                    )
+                    response = await ollama_service.get_response(
+                        user_input, messages, model, user_id=user_id,
+                        options=degradation.options, details=details
+                    )
                     
             except Exception as search_error:
                 logger.error(f"❌ Search workflow error: {search_error}", exc_info=True)
-                await search_msg.delete()
-                await message.answer("⚠️ Ошибка при поиске. Отвечаю без поиска...")
-                response = await ollama_service.get_response(user_input, messages, model)
+                await status_msg.edit_text(
+                    "⚠️ Ошибка при поиске. Отвечаю без поиска...",
+                    reply_markup=get_stop_keyboard()
+                )
+                response = await ollama_service.get_response(
+                    user_input, messages, model, user_id=user_id,
+                    options=degradation.options, details=details
+                )
+            finally:
+                warm_task.cancel()
         else:
             # Regular response without search
             logger.info("💬 Processing without search (regular response)")
-            response = await ollama_service.get_response(user_input, messages, model)
+            status_msg = await message.answer(
+                "🤖 Генерирую ответ...",
+                reply_markup=get_stop_keyboard()
+            )
+            response = await ollama_service.get_response(
+                user_input, messages, model, user_id=user_id,
+                options=degradation.options, details=details
+            )
+        
+        # Delete status message
+        if status_msg:
+            await status_msg.delete()
+            status_msg = None
         
-        # Remove HTML tags from response
-        cleaned_response = re.sub(r'<[^>]+>', '', response)
+        # Remove HTML tags from response (the uncut one, the rest is sent by "continue")
+        full_response = await services.cpu_pool.process_text(
+            strip_all_html_tags, details.get('text', response)
+        )
+        cleaned_response = full_response[:config.MAX_MESSAGE_LENGTH]
         logger.info(f"📤 Sending response: {len(cleaned_response)} chars")
         
         # Save to history if enabled
-        if settings['history_mode'] == 'with_history':
-            await db.add_message(user_id, user_input, cleaned_response)
+        message_id = None
+        if with_history:
+            message_id = await db.add_message(user_id, user_input, cleaned_response)
             logger.info("💾 Message saved to history")
+            if memory_store is not None:
+                memory_store.remember(db, message_id, user_id, user_input, cleaned_response)
+            if history_compactor is not None:
+                history_compactor.schedule(db, user_id)
+        
+        # Store answer in semantic cache
+        if (
+            use_cache and question_embedding is not None and
+            not OllamaService.is_error_response(cleaned_response)
+        ):
+            await semantic_cache.add(user_input, question_embedding, cleaned_response, model)
         
-        # Split and send response
-        message_chunks = MessageSplitter.split_message(cleaned_response)
-        logger.info(f"📨 Sending {len(message_chunks)} message chunk(s)")
+        # Keep what regenerate / continue need (search answers are rebuilt without history)
+        answer = StoredAnswer(
+            user_id, model, user_input,
+            [] if used_search_context is not None else messages,
+            used_search_context, message_id
+        )
+        if details:
+            answer.set_output(full_response, len(cleaned_response), details.get('context'))
+        key = services.answer_store.put(answer)
         
-        for idx, chunk in enumerate(message_chunks):
-            # Add keyboard only to last message
-            keyboard = get_main_keyboard() if idx == len(message_chunks) - 1 else None
-            await message.answer(chunk, reply_markup=keyboard)
+        await _send_answer(message, cleaned_response, get_answer_keyboard(key, answer.can_continue))
         
         logger.info("✅ Message handling complete")
         
+    except asyncio.CancelledError:
+        logger.info(f"⏹ Generation for user {user_id} cancelled")
+        if status_msg:
+            try:
+                await status_msg.edit_text("⏹ Генерация остановлена.")
+            except Exception as edit_error:
+                logger.debug(f"Could not update status message: {edit_error}")
+        raise
     except Exception as e:
         logger.error(f"❌ Error processing message: {e}", exc_info=True)
         await message.answer(
             f"❌ Произошла ошибка при обработке сообщения: {str(e)}",
             reply_markup=get_main_keyboard()
-        )
\ No newline at end of file
+        )
+
+
+async def _rework_answer(
+    message: Message,
+    db: DatabaseManager,
+    services: ServiceContainer,
+    key: str,
+    answer: StoredAnswer,
+    regenerate: bool
+):
+    """Regenerate or continue a stored answer (runs as tracked request)"""
+    config = services.config
+    ollama_service = services.ollama_service
+    status_msg = None
+    
+    try:
+        degradation = services.overload_controller.plan(answer.model)
+    except OverloadError as e:
+        await _send_overloaded(message, e)
+        return
+    
+    await _remove_buttons(message)
+    try:
+        details = {}
+        if regenerate:
+            # Same prompt as before: Ollama still has most of it cached
+            model = degradation.model
+            status_msg = await message.answer("🔄 Генерирую ответ заново...", reply_markup=get_stop_keyboard())
+            if answer.search_context is not None:
+                response = await ollama_service.get_response_with_search(
+                    answer.user_input, answer.search_context, [], model,
+                    user_id=answer.user_id, options=degradation.options, details=details
+                )
+            else:
+                response = await ollama_service.get_response(
+                    answer.user_input, answer.messages, model,
+                    user_id=answer.user_id, options=degradation.options, details=details
+                )
+        else:
+            # Context tokens belong to the model that produced them, no fallback model
+            model = answer.model
+            status_msg = await message.answer("➡️ Продолжаю ответ...", reply_markup=get_stop_keyboard())
+            response = await ollama_service.continue_response(
+                answer.context, model, user_id=answer.user_id,
+                options=degradation.options, details=details
+            )
+        
+        await status_msg.delete()
+        status_msg = None
+        
+        full_response = await services.cpu_pool.process_text(
+            strip_all_html_tags, details.get('text', response)
+        )
+        text = full_response[:config.MAX_MESSAGE_LENGTH]
+        if details:
+            if regenerate:
+                answer.model = model
+                answer.set_output(full_response, len(text), details.get('context'))
+            else:
+                # Continuation is appended; the new Ollama context ends after it
+                answer.set_output(answer.output + full_response, answer.sent + len(text), details.get('context'))
+            if answer.message_id is not None:
+                history_text = answer.output[:answer.sent]
+                if await db.update_response(answer.user_id, answer.message_id, history_text):
+                    if services.memory_store is not None:
+                        services.memory_store.remember(
+                            db, answer.message_id, answer.user_id, answer.user_input, history_text
+                        )
+        
+        await _send_answer(message, text, get_answer_keyboard(key, answer.can_continue))
+        
+    except asyncio.CancelledError:
+        logger.info(f"⏹ Generation for user {answer.user_id} cancelled")
+        if status_msg:
+            try:
+                await status_msg.edit_text("⏹ Генерация остановлена.")
+            except Exception as edit_error:
+                logger.debug(f"Could not update status message: {edit_error}")
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error reworking answer: {e}", exc_info=True)
+        await message.answer(
+            f"❌ Произошла ошибка при обработке сообщения: {str(e)}",
+            reply_markup=get_main_keyboard()
+        )
+
+
+async def _remove_buttons(message: Message):
+    """Remove regenerate / continue buttons, they move to the new last message"""
+    try:
+        await message.edit_reply_markup(reply_markup=None)
+    except Exception as e:
+        logger.debug(f"Could not remove answer buttons: {e}")
+
+
+async def _send_overloaded(message: Message, error: OverloadError):
+    await message.answer(
+        f"⏳ Сервер сейчас перегружен. Ожидание ответа заняло бы {format_eta(error.eta)}. "
+        f"Попробуйте повторить запрос позже.",
+        reply_markup=get_main_keyboard()
+    )
+
+
+async def _send_answer(message: Message, text: str, keyboard: Optional[InlineKeyboardMarkup] = None):
+    """Split and send answer; the last chunk gets `keyboard` (main keyboard by default)"""
+    message_chunks = MessageSplitter.split_message(text)
+    logger.info(f"📨 Sending {len(message_chunks)} message chunk(s)")
+    
+    for idx, chunk in enumerate(message_chunks):
+        # Add keyboard only to last message
+        markup = (keyboard or get_main_keyboard()) if idx == len(message_chunks) - 1 else None
+        await message.answer(chunk, reply_markup=markup)
@@ -1,4 +1,10 @@
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from aiogram.types import (
+    ReplyKeyboardMarkup, KeyboardButton,
+    InlineKeyboardMarkup, InlineKeyboardButton
+)
+
+# Texts of reply keyboard buttons (not questions to the model)
+MENU_BUTTONS = frozenset(("История On/Off", "Выбор модели", "Очистить историю", "◀️ Назад"))
 
 def get_main_keyboard() -> ReplyKeyboardMarkup:
     """Get main bot keyboard (without search toggle)"""
@@ -20,4 +26,19 @@ def get_model_keyboard(models: list[str]) -> ReplyKeyboardMarkup:
         keyboard=buttons,
         resize_keyboard=True
     )
-    return keyboard
\ No newline at end of file
+    return keyboard
+
+def get_answer_keyboard(key: str, can_continue: bool) -> InlineKeyboardMarkup:
+    """Get inline keyboard to regenerate or continue a stored answer"""
+    buttons = [InlineKeyboardButton(text="🔄 Заново", callback_data=f"regen:{key}")]
+    if can_continue:
+        buttons.append(InlineKeyboardButton(text="➡️ Продолжить", callback_data=f"cont:{key}"))
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
+
+def get_stop_keyboard() -> InlineKeyboardMarkup:
+    """Get inline keyboard with button to stop generation"""
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [InlineKeyboardButton(text="⏹ Остановить", callback_data="stop_generation")]
+        ]
+    )
\ No newline at end of file
@@ -0,0 +1,22 @@
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from services.container import ServiceContainer
+
+
+class ServicesMiddleware(BaseMiddleware):
+    """Middleware to pass service container to handlers"""
+    
+    def __init__(self, services: ServiceContainer):
+        self.services = services
+        super().__init__()
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        data['services'] = self.services
+        return await handler(event, data)
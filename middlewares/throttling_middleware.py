@@ -0,0 +1,131 @@
+import asyncio
+import time
+from typing import Callable, Dict, Any, Awaitable, FrozenSet, List, Optional, Tuple
+from aiogram import BaseMiddleware
+from aiogram.types import Message, TelegramObject
+
+from keyboards.main_keyboard import MENU_BUTTONS
+from services.rate_limiter import RateLimiter, QuotaManager
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Outer middleware rejecting requests over rate limit or daily quota.
+    
+    Runs before filters and handlers, so rejected updates cost no DB,
+    search or Ollama work. Keyboard buttons and model names (model
+    selection) are not requests and are never limited.
+    """
+    
+    # Minimum interval between "slow down" replies to the same user
+    NOTIFY_INTERVAL = 10
+    # How long the decision for the first photo of an album applies to the rest
+    ALBUM_TTL = 60
+    # How long the list of available models is reused
+    MODELS_TTL = 60
+    
+    def __init__(
+        self,
+        rate_limiter: RateLimiter,
+        quota_manager: QuotaManager,
+        search_enabled: bool = True,
+        list_models: Optional[Callable[[], List[str]]] = None
+    ):
+        self.rate_limiter = rate_limiter
+        self.quota_manager = quota_manager
+        self.search_enabled = search_enabled
+        self.list_models = list_models
+        self._models: FrozenSet[str] = frozenset()
+        self._models_at = float('-inf')
+        self._notified: Dict[int, float] = {}
+        # media_group_id -> (allowed, decided at)
+        self._albums: Dict[str, Tuple[bool, float]] = {}
+        super().__init__()
+    
+    async def _model_names(self) -> FrozenSet[str]:
+        """Available model names, refreshed at most every MODELS_TTL seconds"""
+        now = time.monotonic()
+        if self.list_models is not None and now - self._models_at >= self.MODELS_TTL:
+            self._models_at = now
+            self._models = frozenset(await asyncio.to_thread(self.list_models))
+        return self._models
+    
+    async def _classify(self, message: Message) -> Optional[str]:
+        """Get action type of message (None for commands, buttons and service messages)"""
+        if message.photo:
+            return 'photo'
+        if message.document:
+            return 'document'
+        text = message.text
+        if not text or text.startswith('/') or text in MENU_BUTTONS:
+            return None
+        if text in await self._model_names():
+            return None
+        if self.search_enabled and text.strip().endswith('?'):
+            return 'search'
+        return 'text'
+    
+    async def _reject(self, message: Message, text: str):
+        """Reply to rejected message, at most once per NOTIFY_INTERVAL"""
+        now = time.monotonic()
+        user_id = message.from_user.id
+        if now - self._notified.get(user_id, 0) < self.NOTIFY_INTERVAL:
+            return
+        if len(self._notified) > 10000:
+            self._notified.clear()
+        self._notified[user_id] = now
+        await message.answer(text)
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not isinstance(event, Message) or event.from_user is None:
+            return await handler(event, data)
+        
+        action = await self._classify(event)
+        if action is None:
+            return await handler(event, data)
+        
+        user_id = event.from_user.id
+        
+        # An album is one request: only its first photo is checked and charged
+        album_id = event.media_group_id
+        if album_id and album_id in self._albums:
+            allowed, _ = self._albums[album_id]
+            return await handler(event, data) if allowed else None
+        
+        rejection = self._check(user_id, action)
+        if album_id:
+            self._remember_album(album_id, rejection is None)
+        if rejection is not None:
+            await self._reject(event, rejection)
+            return None
+        
+        return await handler(event, data)
+    
+    def _check(self, user_id: int, action: str) -> Optional[str]:
+        """
+        Check quota and rate limit.
+        
+        Returns:
+            None if allowed, otherwise reply text for the user
+        """
+        if self.quota_manager.is_exceeded(user_id):
+            return "📊 Дневной лимит запросов исчерпан. Он обновится завтра."
+        
+        retry_after = self.rate_limiter.check(user_id, action)
+        if retry_after > 0:
+            return f"⏳ Слишком много запросов. Попробуйте через {int(retry_after) + 1} сек."
+        return None
+    
+    def _remember_album(self, album_id: str, allowed: bool):
+        now = time.monotonic()
+        if len(self._albums) > 1000:
+            self._albums = {
+                key: value for key, value in self._albums.items()
+                if now - value[1] < self.ALBUM_TTL
+            }
+        self._albums[album_id] = (allowed, now)
@@ -0,0 +1,109 @@
+"""Short-lived store of generated answers for the regenerate / continue buttons."""
+
+import itertools
+import logging
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class StoredAnswer:
+    """Inputs and output of one generation"""
+
+    __slots__ = (
+        'user_id', 'model', 'user_input', 'messages', 'search_context',
+        'output', 'sent', 'context', 'message_id', 'created'
+    )
+
+    def __init__(
+        self,
+        user_id: int,
+        model: str,
+        user_input: str,
+        messages: List[Dict[str, str]],
+        search_context: Optional[str] = None,
+        message_id: Optional[int] = None
+    ):
+        self.user_id = user_id
+        self.model = model
+        self.user_input = user_input
+        # History turns the prompt was built from (empty for search answers)
+        self.messages = messages
+        self.search_context = search_context
+        # Full model output; only `sent` characters of it were delivered
+        self.output = ''
+        self.sent = 0
+        # Ollama token context of prompt and output (array of int32: a
+        # list of Python ints would be ~7x larger)
+        self.context: Optional[array] = None
+        # History row holding the answer (None with history off)
+        self.message_id = message_id
+        self.created = time.monotonic()
+
+    def set_output(self, output: str, sent: int, context: Optional[List[int]]):
+        self.output = output
+        self.sent = sent
+        self.context = array('i', context) if context else None
+
+    @property
+    def remaining(self) -> str:
+        """Part of the output that did not fit into the sent messages"""
+        return self.output[self.sent:]
+
+    @property
+    def can_continue(self) -> bool:
+        return bool(self.remaining) or self.context is not None
+
+
+class AnswerStore:
+    """
+    Keeps the prompt inputs, search context and output of recent answers.
+
+    Regenerating reuses the stored history or search context (no new
+    search, and Ollama finds the identical prompt still cached), and
+    continuing first sends the part of the output that was cut off at
+    MAX_MESSAGE_LENGTH, then resumes generation from the stored Ollama
+    context. Entries expire after `ttl` seconds; beyond `max_entries`
+    the least recently used are dropped.
+    """
+
+    def __init__(self, config: Config):
+        self.ttl = config.ANSWER_STORE_TTL
+        self.max_entries = max(1, config.ANSWER_STORE_MAX_ENTRIES)
+        self._entries: 'OrderedDict[str, StoredAnswer]' = OrderedDict()
+        self._ids = itertools.count(1)
+
+    def _expire(self):
+        deadline = time.monotonic() - self.ttl
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.created > deadline and len(self._entries) <= self.max_entries:
+                break
+            del self._entries[key]
+
+    def put(self, entry: StoredAnswer) -> str:
+        """
+        Store answer.
+
+        Returns:
+            Key for callback data (short, button data is limited to 64 bytes)
+        """
+        key = format(next(self._ids), 'x')
+        self._entries[key] = entry
+        self._expire()
+        return key
+
+    def get(self, key: str, user_id: int) -> Optional[StoredAnswer]:
+        """Answer stored under key, if it has not expired and belongs to the user"""
+        self._expire()
+        entry = self._entries.get(key)
+        if entry is None or entry.user_id != user_id:
+            return None
+        entry.created = time.monotonic()
+        self._entries.move_to_end(key)
+        return entry
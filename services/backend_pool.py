@@ -0,0 +1,135 @@
+"""Ollama backend selection and hedging policy."""
+
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from config import Config
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Backend:
+    """One Ollama server"""
+
+    __slots__ = ('url', 'in_flight', 'down_until')
+
+    def __init__(self, url: str):
+        self.url = url.rstrip('/')
+        self.in_flight = 0
+        # Backend is skipped until this time after a connection failure
+        self.down_until = 0.0
+
+
+class BackendPool:
+    """
+    Ollama servers generations are spread over.
+
+    A request goes to the backend with the fewest requests in flight (ties
+    go to the one listed first); a backend that refused the connection is
+    skipped for `cooldown` seconds unless no other backend is left.
+
+    Hedging: first-output latency is kept per (model, job kind). When a
+    request has produced nothing after the `percentile` of that window
+    (within min/max delay; max delay until MIN_SAMPLES are in), it is sent
+    to a second backend as well and whichever answers first is used.
+    Every hedgeable request earns `budget` credit and a hedge spends a
+    whole one, so at most a `budget` share of requests is duplicated.
+    """
+
+    # Recent first-output latencies kept per (model, kind)
+    WINDOW = 100
+    # Latencies needed before the percentile is used
+    MIN_SAMPLES = 10
+    # Unused hedge credit is capped, so a quiet period cannot fund a burst
+    MAX_CREDIT = 5.0
+
+    def __init__(self, config: Config):
+        urls = config.OLLAMA_URLS or (config.OLLAMA_URL,)
+        self.backends = [Backend(url) for url in urls]
+        self.hedge_enabled = config.OLLAMA_HEDGE_ENABLED and len(self.backends) > 1
+        self.percentile = min(100.0, max(0.0, config.OLLAMA_HEDGE_PERCENTILE))
+        self.min_delay = config.OLLAMA_HEDGE_MIN_DELAY
+        self.max_delay = max(self.min_delay, config.OLLAMA_HEDGE_MAX_DELAY)
+        self.budget = max(0.0, config.OLLAMA_HEDGE_BUDGET)
+        self.cooldown = config.OLLAMA_BACKEND_COOLDOWN
+        self._credit = 1.0
+        self._latencies: Dict[Tuple[str, str], Deque[float]] = {}
+
+        if len(self.backends) > 1:
+            logger.info(
+                f"🖧 {len(self.backends)} Ollama backends, hedging "
+                f"{'on' if self.hedge_enabled else 'off'}"
+            )
+
+    def acquire(self, exclude: Optional[List[Backend]] = None) -> Optional[Backend]:
+        """
+        Pick the least busy backend and count the request as in flight.
+
+        Returns:
+            Backend, or None if every backend is excluded
+        """
+        now = time.monotonic()
+        candidates = [b for b in self.backends if not exclude or b not in exclude]
+        if not candidates:
+            return None
+        # Down backends are tried only when nothing else is left
+        backend = min(candidates, key=lambda b: (b.down_until > now, b.in_flight))
+        backend.in_flight += 1
+        return backend
+
+    def release(self, backend: Backend, connected: bool = True):
+        """Finish a request; connected=False marks the backend down"""
+        backend.in_flight -= 1
+        if not connected:
+            if backend.down_until <= time.monotonic():
+                logger.warning(f"⚠️ Ollama backend {backend.url} is unreachable")
+            backend.down_until = time.monotonic() + self.cooldown
+            metrics.inc('ollama_backend_failures_total')
+        else:
+            backend.down_until = 0.0
+
+    def hedge_delay(self, model: str, kind: str) -> float:
+        """Seconds without output after which a request is hedged"""
+        window = self._latencies.get((model, kind))
+        if window is None or len(window) < self.MIN_SAMPLES:
+            return self.max_delay
+        latencies = sorted(window)
+        value = latencies[min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))]
+        return min(self.max_delay, max(self.min_delay, value))
+
+    def record_latency(self, model: str, kind: str, seconds: float):
+        """
+        Record time to first output of one attempt.
+
+        Attempts cancelled before any output are recorded with the time
+        they had waited, so the slow tail stays in the window.
+        """
+        window = self._latencies.get((model, kind))
+        if window is None:
+            window = self._latencies[(model, kind)] = deque(maxlen=self.WINDOW)
+        window.append(seconds)
+
+    def earn(self):
+        """Add budget credit for a hedgeable request"""
+        self._credit = min(self.MAX_CREDIT, self._credit + self.budget)
+        metrics.inc('ollama_hedgeable_requests_total')
+        self._update_rate()
+
+    def try_hedge(self) -> bool:
+        """Spend credit for one hedge; False if the budget is exhausted"""
+        if self._credit < 1.0:
+            metrics.inc('ollama_hedge_budget_exhausted_total')
+            return False
+        self._credit -= 1.0
+        metrics.inc('ollama_hedges_total')
+        self._update_rate()
+        return True
+
+    @staticmethod
+    def _update_rate():
+        requests = metrics.get('ollama_hedgeable_requests_total')
+        if requests:
+            metrics.set('ollama_hedge_rate', metrics.get('ollama_hedges_total') / requests)
@@ -0,0 +1,237 @@
+"""Lazily constructed services shared by handlers."""
+
+import asyncio
+import logging
+from functools import cached_property
+from typing import TYPE_CHECKING, Optional
+
+from config import Config
+from database.db_manager import DatabaseManager
+
+if TYPE_CHECKING:
+    from services.answer_store import AnswerStore
+    from services.cost_estimator import CostEstimator
+    from services.cpu_pool import CpuPool
+    from services.document_processor import DocumentProcessor
+    from services.domain_health import DomainHealth
+    from services.history_compactor import HistoryCompactor
+    from services.media_group_collector import MediaGroupCollector
+    from services.memory_monitor import MemoryMonitor
+    from services.memory_store import MemoryStore
+    from services.message_coalescer import MessageCoalescer
+    from services.ollama_service import OllamaService
+    from services.overload_controller import OverloadController
+    from services.page_index import PageIndex
+    from services.rate_limiter import QuotaManager, RateLimiter
+    from services.request_tracker import RequestTracker
+    from services.search_service import SearchService
+    from services.semantic_cache import SemanticCache
+    from services.usage_ledger import UsageLedger
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """
+    Builds every service on first access.
+    
+    Service modules are imported inside the properties, so heavy
+    dependencies (requests, bs4, numpy) are only loaded when a feature
+    that needs them is first used or during warm_up() after polling
+    has started.
+    """
+
+    def __init__(self, config: Config, db: DatabaseManager):
+        self.config = config
+        self.db = db
+
+    @cached_property
+    def ollama_service(self) -> 'OllamaService':
+        from services.ollama_service import OllamaService
+        service = OllamaService(self.config, self.cost_estimator)
+        service.add_usage_listener(self.quota_manager.record_usage)
+        if self.usage_ledger is not None:
+            service.add_usage_listener(self.usage_ledger.record_usage)
+        return service
+
+    @cached_property
+    def cost_estimator(self) -> 'CostEstimator':
+        from services.cost_estimator import CostEstimator
+        return CostEstimator(self.db)
+
+    @cached_property
+    def overload_controller(self) -> 'OverloadController':
+        from services.overload_controller import OverloadController
+        controller = OverloadController(self.config, self.ollama_service.scheduler)
+        self.ollama_service.add_usage_listener(controller.observe)
+        return controller
+
+    @cached_property
+    def search_service(self) -> Optional['SearchService']:
+        if not self.config.SEARCH_ENABLED:
+            return None
+        from services.search_service import SearchService
+        return SearchService(
+            self.config, self.domain_health, self.page_index, cpu_pool=self.cpu_pool
+        )
+
+    @cached_property
+    def cpu_pool(self) -> 'CpuPool':
+        from services.cpu_pool import CpuPool
+        return CpuPool(self.config)
+
+    @cached_property
+    def page_index(self) -> Optional['PageIndex']:
+        if not self.config.PAGE_INDEX_ENABLED:
+            return None
+        import sqlite3
+        from services.page_index import PageIndex
+        try:
+            return PageIndex(self.config)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Page index disabled (SQLite without FTS5?): {e}")
+            return None
+
+    @cached_property
+    def domain_health(self) -> 'DomainHealth':
+        from services.domain_health import DomainHealth
+        from services.search_service import SearchService
+        return DomainHealth(
+            self.config.SCRAPE_CIRCUIT_FAILURES,
+            self.config.SCRAPE_CIRCUIT_COOLDOWN,
+            SearchService.PAGE_CONTEXT_CHARS
+        )
+
+    @cached_property
+    def semantic_cache(self) -> Optional['SemanticCache']:
+        if not self.config.SEMANTIC_CACHE_ENABLED:
+            return None
+        from services.semantic_cache import SemanticCache, NUMPY_AVAILABLE
+        if not NUMPY_AVAILABLE:
+            logger.warning("numpy is not installed, semantic cache disabled")
+            return None
+        return SemanticCache(self.config)
+
+    @cached_property
+    def memory_store(self) -> Optional['MemoryStore']:
+        if not self.config.MEMORY_ENABLED:
+            return None
+        from services.memory_store import MemoryStore, NUMPY_AVAILABLE
+        if not NUMPY_AVAILABLE:
+            logger.warning("numpy is not installed, memory store disabled")
+            return None
+        return MemoryStore(self.config, self.ollama_service)
+
+    @cached_property
+    def history_compactor(self) -> Optional['HistoryCompactor']:
+        if not self.config.COMPACTION_ENABLED:
+            return None
+        from services.history_compactor import HistoryCompactor
+        return HistoryCompactor(self.config, self.ollama_service)
+
+    @cached_property
+    def answer_store(self) -> 'AnswerStore':
+        from services.answer_store import AnswerStore
+        return AnswerStore(self.config)
+
+    @cached_property
+    def document_processor(self) -> 'DocumentProcessor':
+        from services.document_processor import DocumentProcessor
+        return DocumentProcessor(self.config, self.ollama_service)
+
+    @cached_property
+    def memory_monitor(self) -> 'MemoryMonitor':
+        from services.memory_monitor import MemoryMonitor
+        # Services already built are cached in the instance __dict__
+        return MemoryMonitor(
+            self.config,
+            lambda: {name: value for name, value in vars(self).items() if name not in ('config', 'db', 'memory_monitor')}
+        )
+
+    @cached_property
+    def request_tracker(self) -> 'RequestTracker':
+        from services.request_tracker import RequestTracker
+        return RequestTracker(self.config.INFLIGHT_POLICY)
+
+    @cached_property
+    def message_coalescer(self) -> 'MessageCoalescer':
+        from services.message_coalescer import MessageCoalescer
+        tracker = self.request_tracker
+        return MessageCoalescer(
+            self.config.COALESCE_WINDOW_MS,
+            self.config.COALESCE_MAX_WINDOW_MS,
+            load_fn=lambda: tracker.active_count
+        )
+
+    @cached_property
+    def media_group_collector(self) -> 'MediaGroupCollector':
+        from services.media_group_collector import MediaGroupCollector
+        return MediaGroupCollector(self.config.ALBUM_WINDOW_MS)
+
+    @cached_property
+    def usage_ledger(self) -> Optional['UsageLedger']:
+        if not self.config.USAGE_LEDGER_ENABLED:
+            return None
+        from services.usage_ledger import UsageLedger
+        return UsageLedger(self.config)
+
+    @cached_property
+    def rate_limiter(self) -> 'RateLimiter':
+        from services.rate_limiter import RateLimiter
+        return RateLimiter(self.config)
+
+    @cached_property
+    def quota_manager(self) -> 'QuotaManager':
+        from services.rate_limiter import QuotaManager
+        return QuotaManager(self.db, self.config)
+
+    async def warm_up(self):
+        """Build services and load their state (runs after polling has started)"""
+        try:
+            await self.cost_estimator.load()
+            if self.semantic_cache is not None:
+                await self.semantic_cache.load(self.db)
+            if self.search_service is not None:
+                await self.domain_health.load(self.db)
+                logger.info("Search service initialized")
+            if self.config.CPU_POOL_WORKERS > 0:
+                await asyncio.to_thread(self.cpu_pool.start)
+            self.overload_controller
+            self.memory_store
+            self.history_compactor
+            logger.info("✅ Services warmed up")
+        except Exception as e:
+            logger.error(f"Service warm-up error: {e}", exc_info=True)
+
+    async def flush(self):
+        """Write rows buffered by services that were built (periodically and on shutdown)"""
+        if 'quota_manager' in self.__dict__:
+            try:
+                await self.quota_manager.flush()
+            except Exception as e:
+                logger.error(f"Error saving daily usage: {e}")
+        if 'cost_estimator' in self.__dict__:
+            try:
+                await self.cost_estimator.flush()
+            except Exception as e:
+                logger.error(f"Error saving job costs: {e}")
+        if self.__dict__.get('usage_ledger') is not None:
+            try:
+                await self.usage_ledger.flush(self.db)
+            except Exception as e:
+                logger.error(f"Error saving usage ledger: {e}")
+
+    async def close(self):
+        """Release resources of services that were built"""
+        if self.__dict__.get('semantic_cache') is not None:
+            self.semantic_cache.flush()
+        if self.__dict__.get('page_index') is not None:
+            self.page_index.close()
+        if 'cpu_pool' in self.__dict__:
+            self.cpu_pool.close()
+        await self.flush()
+        if 'domain_health' in self.__dict__:
+            try:
+                await self.domain_health.save(self.db)
+            except Exception as e:
+                logger.error(f"Error saving domain health: {e}")
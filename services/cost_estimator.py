@@ -0,0 +1,172 @@
+"""Estimation of generation cost from observed per-model throughput."""
+
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from database.db_manager import DatabaseManager
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Request types
+JOB_PLAIN = 'plain'
+JOB_SEARCH = 'search'
+JOB_PHOTO = 'photo'
+JOB_BACKGROUND = 'background'
+JOB_DOCUMENT = 'document'
+
+# Used until a (model, kind) pair has been observed
+DEFAULT_PREFILL_RATE = 400.0  # prompt tokens per second
+DEFAULT_DECODE_RATE = 15.0  # generated tokens per second
+DEFAULT_OUTPUT_TOKENS = {
+    JOB_PLAIN: 300.0,
+    JOB_SEARCH: 700.0,
+    JOB_PHOTO: 250.0,
+    JOB_BACKGROUND: 400.0,
+    JOB_DOCUMENT: 350.0,
+}
+# Prompt tokens assumed per attached image
+IMAGE_PROMPT_TOKENS = 600
+
+
+class CostEstimate:
+    """Expected duration of one generation"""
+
+    __slots__ = ('model', 'kind', 'prompt_tokens', 'seconds')
+
+    def __init__(self, model: str, kind: str, prompt_tokens: int, seconds: float):
+        self.model = model
+        self.kind = kind
+        self.prompt_tokens = prompt_tokens
+        self.seconds = seconds
+
+
+class _Throughput:
+    """Moving averages observed for one (model, kind) pair"""
+
+    __slots__ = ('prefill_rate', 'decode_rate', 'output_tokens', 'prompt_overhead', 'samples')
+
+    def __init__(self, kind: str):
+        self.prefill_rate = DEFAULT_PREFILL_RATE
+        self.decode_rate = DEFAULT_DECODE_RATE
+        self.output_tokens = DEFAULT_OUTPUT_TOKENS.get(kind, DEFAULT_OUTPUT_TOKENS[JOB_PLAIN])
+        # Prompt tokens not visible in the text (chat template etc.)
+        self.prompt_overhead = 0.0
+        self.samples = 0
+
+
+class CostEstimator:
+    """
+    Predicts how many seconds a generation will hold a model slot.
+
+    Cost = (prompt tokens + overhead) / prefill rate + expected output
+    tokens / decode rate. All four values are exponential moving averages
+    of Ollama's prompt_eval_*/eval_* stats, kept per model and request
+    type. Every estimate is stored next to the actual duration, so the
+    averages are restored on restart and the error can be inspected.
+
+    record() updates the averages right away but only buffers the row;
+    flush() writes the buffer periodically and on shutdown, so answers
+    never wait for a commit.
+    """
+
+    # Weight of the newest observation in the moving averages
+    ALPHA = 0.2
+    # Rows kept in memory while the database is unavailable
+    MAX_BUFFER = 10000
+
+    def __init__(self, db: Optional[DatabaseManager] = None):
+        self.db = db
+        self._stats: Dict[Tuple[str, str], _Throughput] = {}
+        self._buffer: List[tuple] = []
+
+    def _get(self, model: str, kind: str) -> _Throughput:
+        key = (model, kind)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = _Throughput(kind)
+        return stats
+
+    def estimate(self, model: str, kind: str, prompt_tokens: int) -> CostEstimate:
+        """Estimate duration of a generation in seconds"""
+        stats = self._get(model, kind)
+        seconds = (
+            (prompt_tokens + stats.prompt_overhead) / stats.prefill_rate
+            + stats.output_tokens / stats.decode_rate
+        )
+        return CostEstimate(model, kind, prompt_tokens, seconds)
+
+    def _update(self, model: str, kind: str, prompt_tokens: int, stats: Dict[str, Any]):
+        throughput = self._get(model, kind)
+        # First observation replaces the defaults instead of being averaged with them
+        alpha = 1.0 if throughput.samples == 0 else self.ALPHA
+
+        def mix(old: float, new: float) -> float:
+            return old + alpha * (new - old)
+
+        prompt_eval_count = stats.get('prompt_eval_count', 0)
+        prompt_eval_duration = stats.get('prompt_eval_duration', 0)
+        eval_count = stats.get('eval_count', 0)
+        eval_duration = stats.get('eval_duration', 0)
+
+        # Prompt caching makes prompt_eval_count smaller than the prompt,
+        # which shows up as a lower overhead (clamped at zero)
+        throughput.prompt_overhead = mix(
+            throughput.prompt_overhead, max(0, prompt_eval_count - prompt_tokens)
+        )
+        if prompt_eval_count and prompt_eval_duration:
+            throughput.prefill_rate = mix(
+                throughput.prefill_rate, prompt_eval_count / (prompt_eval_duration / 1e9)
+            )
+        if eval_count and eval_duration:
+            throughput.decode_rate = mix(
+                throughput.decode_rate, eval_count / (eval_duration / 1e9)
+            )
+        throughput.output_tokens = mix(throughput.output_tokens, eval_count)
+        throughput.samples += 1
+
+    async def load(self, limit: int = 2000):
+        """Recalibrate from the most recent stored job costs"""
+        if self.db is None:
+            return
+        records = await self.db.get_job_costs(limit)
+        for record in records:
+            self._update(record['model'], record['kind'], record['prompt_tokens'], record)
+        if records:
+            logger.info(
+                f"📐 Cost estimator calibrated from {len(records)} job(s), "
+                f"{len(self._stats)} model/type pair(s)"
+            )
+
+    def record(self, estimate: CostEstimate, stats: Dict[str, Any]):
+        """Update averages with the actual outcome of an estimated generation"""
+        actual = stats.get('total_duration', 0) / 1e9
+        if not actual:
+            return
+        self._update(estimate.model, estimate.kind, estimate.prompt_tokens, stats)
+        logger.debug(
+            f"Job cost {estimate.model}/{estimate.kind}: "
+            f"estimated {estimate.seconds:.1f}s, actual {actual:.1f}s"
+        )
+        if self.db is None:
+            return
+        self._buffer.append((
+            estimate.model, estimate.kind, estimate.prompt_tokens, estimate.seconds, actual,
+            stats.get('prompt_eval_count', 0), stats.get('prompt_eval_duration', 0),
+            stats.get('eval_count', 0), stats.get('eval_duration', 0)
+        ))
+        if len(self._buffer) > self.MAX_BUFFER:
+            del self._buffer[:len(self._buffer) - self.MAX_BUFFER]
+            metrics.inc('job_costs_dropped_total')
+
+    async def flush(self):
+        """Write buffered job costs"""
+        rows, self._buffer = self._buffer, []
+        if not rows:
+            return
+        try:
+            await self.db.add_job_costs(rows)
+        except Exception:
+            self._buffer[:0] = rows
+            raise
+        logger.debug(f"Flushed {len(rows)} job cost(s)")
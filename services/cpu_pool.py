@@ -0,0 +1,114 @@
+"""Process pool for CPU-bound parsing and text processing."""
+
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional, TypeVar
+
+from config import Config
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+def _warm_worker():
+    """Import parsers once per worker instead of on the first task"""
+    importlib.import_module('utils.html_extract')
+
+
+class CpuPool:
+    """
+    Runs CPU-bound functions in worker processes, past the GIL.
+
+    Search threads parse HTML here (run) and handlers send large model
+    output through it (process_text). Functions must be module-level and
+    should take raw bytes or text and return compact results: arguments
+    and results are pickled across the process boundary.
+
+    With `workers` = 0 everything runs in the calling thread, as before.
+    If a worker dies the pool is rebuilt on the next call and the
+    failed call is repeated in-thread.
+    """
+
+    def __init__(self, config: Config):
+        self.workers = max(0, config.CPU_POOL_WORKERS)
+        self.min_chars = config.CPU_POOL_MIN_CHARS
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # forkserver: workers are not forked from a process running
+                # the event loop and executor threads
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=context, initializer=_warm_worker)
+                logger.info(f"⚙️ CPU pool started: {self.workers} worker process(es)")
+            return self._pool
+
+    def start(self):
+        """Start the workers now instead of on the first task"""
+        if self.enabled:
+            self._get_pool().submit(int)
+
+    def _broken(self, pool: ProcessPoolExecutor, error: Exception):
+        logger.error(f"CPU pool broken, running in-thread until it is rebuilt: {error}")
+        metrics.inc('cpu_pool_failures_total')
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, fn: Callable[..., T], *args: Any) -> T:
+        """Run fn in a worker and wait (call from threads, not the event loop)"""
+        if not self.enabled:
+            return fn(*args)
+        pool = self._get_pool()
+        try:
+            result = pool.submit(fn, *args).result()
+        except BrokenProcessPool as e:
+            self._broken(pool, e)
+            return fn(*args)
+        metrics.inc('cpu_pool_tasks_total')
+        return result
+
+    async def run_async(self, fn: Callable[..., T], *args: Any) -> T:
+        """Run fn in a worker, or in a thread without the pool"""
+        if not self.enabled:
+            return await asyncio.to_thread(fn, *args)
+        pool = self._get_pool()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+        except BrokenProcessPool as e:
+            self._broken(pool, e)
+            return await asyncio.to_thread(fn, *args)
+        metrics.inc('cpu_pool_tasks_total')
+        return result
+
+    async def process_text(self, fn: Callable[[str], T], text: str) -> T:
+        """
+        Apply fn to text off the event loop if the text is large.
+
+        Below CPU_POOL_MIN_CHARS shipping the text costs more than the
+        work, so fn runs inline.
+        """
+        if len(text) < self.min_chars:
+            return fn(text)
+        return await self.run_async(fn, text)
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,319 @@
+"""Chunked map-reduce processing of uploaded documents."""
+
+import asyncio
+import codecs
+import itertools
+import logging
+from typing import Awaitable, Callable, Iterable, Iterator, List, Optional
+
+from config import Config
+from services.cost_estimator import JOB_DOCUMENT
+from services.ollama_service import OllamaService
+from services.scheduler import PRIORITY_DOCUMENT
+
+try:
+    import pypdf
+    PYPDF_AVAILABLE = True
+except ImportError:
+    PYPDF_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+TEXT_EXTENSIONS = ('.txt', '.md')
+PDF_EXTENSIONS = ('.pdf',)
+
+# Bytes read from a text file at a time
+READ_BLOCK_SIZE = 64 * 1024
+
+# Answer of a map step when the fragment has nothing on the question
+NO_DATA = 'НЕТ ДАННЫХ'
+
+DOCUMENT_SYSTEM_PROMPT = (
+    "Ты работаешь с документом, который загрузил пользователь. "
+    "Опирайся только на его содержание, ничего не выдумывай. Пиши без вступлений."
+)
+
+ProgressCallback = Callable[[int, int, bool], Awaitable[None]]
+
+
+def iter_text_file(path: str) -> Iterator[str]:
+    """
+    Read text file block by block.
+
+    Encoding is UTF-8 unless the first block is not valid UTF-8, then
+    cp1251 (the usual encoding of Russian texts saved on Windows).
+    """
+    with open(path, 'rb') as file:
+        block = file.read(READ_BLOCK_SIZE)
+        try:
+            codecs.getincrementaldecoder('utf-8')().decode(block, final=False)
+            encoding = 'utf-8-sig'
+        except UnicodeDecodeError:
+            encoding = 'cp1251'
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        while block:
+            yield decoder.decode(block)
+            block = file.read(READ_BLOCK_SIZE)
+        yield decoder.decode(b'', final=True)
+
+
+def iter_pdf_text(path: str) -> Iterator[str]:
+    """Extract text of a PDF page by page (requires pypdf)"""
+    reader = pypdf.PdfReader(path)
+    for page in reader.pages:
+        text = page.extract_text() or ''
+        if text:
+            yield text + '\n\n'
+
+
+def _cut_position(text: str, limit: int) -> int:
+    """Position of the last paragraph, line, sentence or word break before limit"""
+    for separator in ('\n\n', '\n', '. ', ' '):
+        position = text.rfind(separator, limit // 2, limit)
+        if position != -1:
+            return position + len(separator)
+    return limit
+
+
+def iter_text_chunks(pieces: Iterable[str], chunk_chars: int) -> Iterator[str]:
+    """
+    Regroup text pieces into chunks of at most chunk_chars.
+
+    Chunks are cut at the nearest paragraph (or line, sentence, word)
+    boundary; only one chunk plus one piece is held in memory.
+    """
+    buffer = ''
+    for piece in pieces:
+        buffer += piece
+        while len(buffer) >= chunk_chars:
+            cut = _cut_position(buffer, chunk_chars)
+            chunk = buffer[:cut].strip()
+            buffer = buffer[cut:]
+            if chunk:
+                yield chunk
+    chunk = buffer.strip()
+    if chunk:
+        yield chunk
+
+
+class DocumentResult:
+    """Outcome of processing one document"""
+
+    __slots__ = ('text', 'chunks', 'truncated')
+
+    def __init__(self, text: Optional[str], chunks: int, truncated: bool):
+        self.text = text
+        self.chunks = chunks
+        self.truncated = truncated
+
+
+class DocumentProcessor:
+    """
+    Answers a question about (or summarises) a document of any size.
+
+    The file is read lazily and split into chunks of DOCUMENT_CHUNK_TOKENS.
+    Every chunk is summarised (map) as its own generation, so chunks run in
+    parallel on all scheduler slots. Partial results are merged (reduce)
+    as soon as DOCUMENT_REDUCE_FAN_IN of them are ready, hierarchically,
+    and the remaining partials are turned into the final answer. Partials
+    are limited to chunk_tokens / fan_in tokens, so a reduce prompt is
+    never larger than a map prompt.
+
+    Memory stays bounded: at most `window` chunks are in flight (reading
+    waits for a free place) and at most fan_in - 1 partials wait on each
+    reduce level.
+    """
+
+    def __init__(self, config: Config, ollama_service: OllamaService):
+        self.ollama_service = ollama_service
+        self.chunk_chars = config.DOCUMENT_CHUNK_TOKENS * 4
+        self.max_chunks = config.DOCUMENT_MAX_CHUNKS
+        self.fan_in = max(2, config.DOCUMENT_REDUCE_FAN_IN)
+        self.partial_tokens = max(128, config.DOCUMENT_CHUNK_TOKENS // self.fan_in)
+        # Keep the queue fed without reading the whole file ahead
+        self.window = max(1, config.OLLAMA_MAX_PARALLEL) * 2
+        self.options = {"num_ctx": max(4096, config.DOCUMENT_CHUNK_TOKENS + 2048)}
+
+    @staticmethod
+    def is_supported(extension: str) -> bool:
+        if extension in PDF_EXTENSIONS:
+            return PYPDF_AVAILABLE
+        return extension in TEXT_EXTENSIONS
+
+    def read_chunks(self, path: str, extension: str) -> Iterator[str]:
+        """Lazy chunk iterator over a downloaded file (blocking reads)"""
+        pieces = iter_pdf_text(path) if extension in PDF_EXTENSIONS else iter_text_file(path)
+        return iter_text_chunks(pieces, self.chunk_chars)
+
+    async def _generate(self, prompt: str, model: str, user_id: Optional[int], limit: bool = True) -> Optional[str]:
+        options = dict(self.options)
+        if limit:
+            options["num_predict"] = self.partial_tokens * 2
+        response = await self.ollama_service.generate(
+            prompt, model, system=DOCUMENT_SYSTEM_PROMPT, user_id=user_id,
+            kind=JOB_DOCUMENT, priority=PRIORITY_DOCUMENT, options=options
+        )
+        return response.strip() if response else None
+
+    def _word_limit(self) -> str:
+        # ~1.5 tokens per Russian word
+        return f"Не более {self.partial_tokens * 2 // 3} слов."
+
+    @staticmethod
+    def _task(question: Optional[str]) -> str:
+        return question or "Кратко перескажи основное содержание документа."
+
+    @staticmethod
+    def _join(parts: List[str]) -> str:
+        return "\n\n".join(f"[Часть {i}]\n{part}" for i, part in enumerate(parts, 1))
+
+    @staticmethod
+    def _is_useful(part: Optional[str]) -> bool:
+        return bool(part) and part.strip(' .!').upper() != NO_DATA
+
+    async def _map(
+        self,
+        chunk: str,
+        index: int,
+        question: Optional[str],
+        model: str,
+        user_id: Optional[int],
+        window: asyncio.Semaphore,
+        on_done: Callable[[], Awaitable[None]]
+    ) -> Optional[str]:
+        try:
+            prompt = f"Фрагмент {index} документа:\n{chunk}\n\n"
+            if question:
+                prompt += (
+                    f"Выпиши из фрагмента всё, что относится к вопросу: {question}\n"
+                    f"Если во фрагменте ничего об этом нет, ответь только: {NO_DATA}. "
+                )
+            else:
+                prompt += "Кратко перескажи фрагмент: главные факты, выводы, цифры. "
+            partial = await self._generate(prompt + self._word_limit(), model, user_id)
+        finally:
+            window.release()
+        await on_done()
+        return partial
+
+    async def _reduce(
+        self,
+        parts: List[Optional[str]],
+        question: Optional[str],
+        model: str,
+        user_id: Optional[int]
+    ) -> Optional[str]:
+        parts = [part for part in parts if self._is_useful(part)]
+        if len(parts) <= 1:
+            return parts[0] if parts else None
+        prompt = f"Заметки по последовательным частям документа:\n\n{self._join(parts)}\n\n"
+        if question:
+            prompt += f"Объедини заметки, относящиеся к вопросу: {question}\n"
+        else:
+            prompt += "Объедини заметки в одно краткое содержание, сохраняя порядок изложения. "
+        return await self._generate(prompt + self._word_limit(), model, user_id)
+
+    async def _reduce_tasks(self, tasks: List[asyncio.Task], question, model, user_id) -> Optional[str]:
+        return await self._reduce(await asyncio.gather(*tasks), question, model, user_id)
+
+    async def process(
+        self,
+        chunks: Iterator[str],
+        question: Optional[str],
+        model: str,
+        user_id: Optional[int] = None,
+        on_progress: Optional[ProgressCallback] = None
+    ) -> DocumentResult:
+        """
+        Map-reduce the document.
+
+        Args:
+            chunks: Iterator from read_chunks() (advanced in a worker thread)
+            question: User's question, None to summarise
+            on_progress: Called with (chunks done, chunks read, reading finished)
+        """
+        async def read() -> Optional[str]:
+            return await asyncio.to_thread(next, chunks, None)
+
+        # A document that fits one chunk is answered with a single request
+        first = await read()
+        if first is None:
+            return DocumentResult(None, 0, False)
+        second = await read()
+        if second is None:
+            prompt = f"Документ:\n{first}\n\nЗадание: {self._task(question)}"
+            return DocumentResult(await self._generate(prompt, model, user_id, limit=False), 1, False)
+        chunks = itertools.chain([first, second], chunks)
+
+        window = asyncio.Semaphore(self.window)
+        # levels[k] holds tasks merging fan_in ** k chunks, earliest first
+        levels: List[List[asyncio.Task]] = [[]]
+        tasks: List[asyncio.Task] = []
+        count = 0
+        done = 0
+        reading = True
+        truncated = False
+
+        async def on_done():
+            nonlocal done
+            done += 1
+            if on_progress is not None:
+                await on_progress(done, count, not reading)
+
+        try:
+            while True:
+                await window.acquire()
+                chunk = await read()
+                if chunk is None:
+                    window.release()
+                    break
+                if count == self.max_chunks:
+                    window.release()
+                    truncated = True
+                    break
+                count += 1
+                task = asyncio.create_task(
+                    self._map(chunk, count, question, model, user_id, window, on_done)
+                )
+                tasks.append(task)
+                levels[0].append(task)
+
+                # Merge every full level into one task of the next level
+                level = 0
+                while len(levels[level]) >= self.fan_in:
+                    group, levels[level] = levels[level], []
+                    if level + 1 == len(levels):
+                        levels.append([])
+                    task = asyncio.create_task(self._reduce_tasks(group, question, model, user_id))
+                    tasks.append(task)
+                    levels[level + 1].append(task)
+                    level += 1
+            reading = False
+            logger.info(f"📄 Document read: {count} chunk(s), {len(levels)} reduce level(s)")
+
+            # Higher levels cover earlier parts of the document
+            remaining = [task for level_tasks in reversed(levels) for task in level_tasks]
+            parts = [part for part in await asyncio.gather(*remaining) if self._is_useful(part)]
+            while len(parts) > self.fan_in:
+                groups = [parts[i:i + self.fan_in] for i in range(0, len(parts), self.fan_in)]
+                merged = await asyncio.gather(
+                    *(self._reduce(group, question, model, user_id) for group in groups)
+                )
+                parts = [part for part in merged if self._is_useful(part)]
+
+            if not parts:
+                text = None if question is None else (
+                    "В документе не нашлось информации по этому вопросу."
+                )
+                return DocumentResult(text, count, truncated)
+
+            prompt = (
+                f"Заметки по частям документа (по порядку):\n\n{self._join(parts)}\n\n"
+                f"Задание: {self._task(question)}\nОтветь на основе заметок."
+            )
+            text = await self._generate(prompt, model, user_id, limit=False)
+            return DocumentResult(text, count, truncated)
+
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,224 @@
+"""Per-domain scrape statistics and circuit breaker."""
+
+import json
+import logging
+import threading
+import time
+import urllib.parse
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set
+
+from database.db_manager import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+
+class _DomainStats:
+    """Scrape history of one domain"""
+
+    __slots__ = (
+        'attempts', 'successes', 'consecutive_failures', 'avg_chars',
+        'fetch_times', 'opened_until', 'updated_at'
+    )
+
+    def __init__(self, window: int):
+        self.attempts = 0
+        self.successes = 0
+        self.consecutive_failures = 0
+        # Moving average of extracted text length of successful scrapes
+        self.avg_chars = 0.0
+        self.fetch_times: Deque[float] = deque(maxlen=window)
+        # Circuit is open (domain skipped) until this time
+        self.opened_until = 0.0
+        self.updated_at = 0.0
+
+    @property
+    def success_rate(self) -> float:
+        # Laplace prior: unknown domains start at 0.5
+        return (self.successes + 1) / (self.attempts + 2)
+
+    @property
+    def p95(self) -> Optional[float]:
+        if not self.fetch_times:
+            return None
+        times = sorted(self.fetch_times)
+        return times[min(len(times) - 1, int(len(times) * 0.95))]
+
+
+class DomainHealth:
+    """
+    Tracks success rate, p95 fetch time and text yield of scraped domains.
+
+    A domain's circuit opens after `failure_threshold` failed scrapes in
+    a row (errors, timeouts, pages without text) and stays open for
+    `cooldown` seconds. After that one trial scrape is allowed (acquire()
+    hands it out and keeps the circuit open meanwhile): success closes the
+    circuit, another failure reopens it.
+
+    Scrapes run in executor threads, so all access goes through a lock.
+    Stats live in memory; save() persists changed domains and is called
+    periodically and on shutdown.
+    """
+
+    # Recent fetch times kept per domain for p95
+    WINDOW = 50
+    # Weight of the newest scrape in the yield average
+    ALPHA = 0.3
+    # Domains kept in memory (least recently used are dropped)
+    MAX_DOMAINS = 5000
+    # Fetch timeout bounds, seconds
+    MIN_TIMEOUT = 2.0
+    MAX_TIMEOUT = 5.0
+    # Scrapes needed before p95 is used for the timeout and preference
+    MIN_SAMPLES = 3
+    # Score below which a known domain waits for the rest of the results
+    # page instead of being scraped right away
+    DEGRADED_SCORE = 0.4
+    # Seconds the circuit stays shut for others while the trial scrape of
+    # a half-open domain runs (a trial that never reports is retried after)
+    TRIAL_TIMEOUT = 30
+
+    def __init__(self, failure_threshold: int = 3, cooldown: float = 1800, target_chars: int = 1500):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.target_chars = target_chars
+        self._lock = threading.Lock()
+        self._domains: Dict[str, _DomainStats] = {}
+        self._dirty: Set[str] = set()
+
+    @staticmethod
+    def domain_of(url: str) -> str:
+        host = urllib.parse.urlsplit(url).hostname or ''
+        return host[4:] if host.startswith('www.') else host
+
+    def _get(self, domain: str) -> _DomainStats:
+        stats = self._domains.get(domain)
+        if stats is None:
+            if len(self._domains) >= self.MAX_DOMAINS:
+                oldest = min(self._domains, key=lambda d: self._domains[d].updated_at)
+                del self._domains[oldest]
+                self._dirty.discard(oldest)
+            stats = self._domains[domain] = _DomainStats(self.WINDOW)
+        return stats
+
+    def is_open(self, url: str) -> bool:
+        """Check if domain of URL should be skipped"""
+        with self._lock:
+            stats = self._domains.get(self.domain_of(url))
+            return stats is not None and stats.opened_until > time.time()
+
+    def acquire(self, url: str) -> bool:
+        """
+        Check if URL may be scraped now.
+
+        For a half-open domain (cooldown over, still failing) only the
+        first caller gets True, as the trial scrape.
+        """
+        with self._lock:
+            stats = self._domains.get(self.domain_of(url))
+            if stats is None or stats.consecutive_failures < self.failure_threshold:
+                return True
+            now = time.time()
+            if stats.opened_until > now:
+                return False
+            stats.opened_until = now + self.TRIAL_TIMEOUT
+            logger.info(f"🔁 Trial scrape of {self.domain_of(url)}")
+            return True
+
+    def timeout_for(self, url: str) -> float:
+        """Fetch timeout: 1.5x the domain's p95, within MIN/MAX_TIMEOUT"""
+        with self._lock:
+            stats = self._domains.get(self.domain_of(url))
+            if stats is None or stats.attempts < self.MIN_SAMPLES:
+                return self.MAX_TIMEOUT
+            return min(self.MAX_TIMEOUT, max(self.MIN_TIMEOUT, stats.p95 * 1.5))
+
+    def _score(self, stats: Optional[_DomainStats]) -> float:
+        if stats is None or stats.attempts < self.MIN_SAMPLES:
+            # Unknown domain: prior success rate, full yield, 2 s fetch
+            return 0.5 / 2
+        yield_ratio = min(1.0, stats.avg_chars / self.target_chars)
+        return stats.success_rate * yield_ratio / (1 + stats.p95 / 2)
+
+    def score(self, url: str) -> float:
+        """Preference of domain for scraping: higher is faster and more useful"""
+        with self._lock:
+            return self._score(self._domains.get(self.domain_of(url)))
+
+    def is_degraded(self, url: str) -> bool:
+        """Domain that failed its last scrape or is known to be slow or low-yield"""
+        with self._lock:
+            stats = self._domains.get(self.domain_of(url))
+            if stats is None:
+                return False
+            return stats.consecutive_failures > 0 or (
+                stats.attempts >= self.MIN_SAMPLES and self._score(stats) < self.DEGRADED_SCORE
+            )
+
+    def record(self, url: str, seconds: float, chars: int):
+        """Record a finished scrape (chars=0 for failures)"""
+        domain = self.domain_of(url)
+        if not domain:
+            return
+        now = time.time()
+        with self._lock:
+            stats = self._get(domain)
+            stats.attempts += 1
+            stats.fetch_times.append(seconds)
+            stats.updated_at = now
+            if chars > 0:
+                stats.successes += 1
+                stats.consecutive_failures = 0
+                stats.opened_until = 0.0
+                if stats.successes == 1:
+                    stats.avg_chars = float(chars)
+                else:
+                    stats.avg_chars += self.ALPHA * (chars - stats.avg_chars)
+            else:
+                stats.consecutive_failures += 1
+                if stats.consecutive_failures >= self.failure_threshold:
+                    if stats.opened_until <= now:
+                        logger.info(
+                            f"🚫 Circuit opened for {domain} "
+                            f"({stats.consecutive_failures} failures in a row)"
+                        )
+                    stats.opened_until = now + self.cooldown
+            self._dirty.add(domain)
+
+    async def load(self, db: DatabaseManager):
+        """Restore stats saved by save()"""
+        rows = await db.get_domain_health()
+        with self._lock:
+            for row in rows:
+                stats = self._get(row['domain'])
+                stats.attempts = row['attempts']
+                stats.successes = row['successes']
+                stats.consecutive_failures = row['consecutive_failures']
+                stats.avg_chars = row['avg_chars']
+                stats.fetch_times.extend(json.loads(row['fetch_times']))
+                stats.opened_until = row['opened_until']
+                stats.updated_at = row['updated_at']
+        if rows:
+            logger.info(f"🌐 Loaded health of {len(rows)} domain(s)")
+
+    async def save(self, db: DatabaseManager):
+        """Persist domains changed since the last save"""
+        with self._lock:
+            rows: List[tuple] = []
+            for domain in self._dirty:
+                stats = self._domains[domain]
+                rows.append((
+                    domain, stats.attempts, stats.successes, stats.consecutive_failures,
+                    stats.avg_chars, json.dumps([round(t, 3) for t in stats.fetch_times]),
+                    stats.opened_until, stats.updated_at
+                ))
+            self._dirty.clear()
+        if not rows:
+            return
+        try:
+            await db.save_domain_health(rows)
+        except Exception:
+            with self._lock:
+                self._dirty.update(row[0] for row in rows if row[0] in self._domains)
+            raise
+        logger.debug(f"Saved health of {len(rows)} domain(s)")
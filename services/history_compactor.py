@@ -0,0 +1,80 @@
+"""Background compaction of long histories into rolling summaries."""
+
+import asyncio
+import logging
+from typing import Set
+
+from config import Config
+from database.db_manager import DatabaseManager
+from services.ollama_service import OllamaService
+from utils.helpers import estimate_tokens, format_messages_for_context
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SYSTEM_PROMPT = (
+    "Ты сжимаешь историю диалога пользователя с ассистентом. "
+    "Составь краткое содержание: факты о пользователе, его цели, "
+    "принятые решения и важные детали ответов. Пиши кратко, без вступлений."
+)
+
+
+class HistoryCompactor:
+    """
+    Replaces old history turns with a stored summary.
+    
+    After a turn is saved, the unsummarized part of the user's history is
+    checked against a token threshold. If it is exceeded, everything except
+    the most recent turns is merged with the previous summary by the
+    summarizer model. The job runs as a background task through the
+    generation scheduler at background priority, so it never delays
+    interactive requests.
+    """
+
+    def __init__(self, config: Config, ollama_service: OllamaService):
+        self.ollama_service = ollama_service
+        self.model = config.SUMMARY_MODEL or config.DEFAULT_MODEL
+        self.token_threshold = config.COMPACTION_TOKEN_THRESHOLD
+        self.keep_recent = max(1, config.COMPACTION_KEEP_RECENT)
+        self._in_progress: Set[int] = set()
+        self._background: Set[asyncio.Task] = set()
+
+    def schedule(self, db: DatabaseManager, user_id: int):
+        """Start compaction of user's history in the background if needed"""
+        if user_id in self._in_progress:
+            return
+        self._in_progress.add(user_id)
+        task = asyncio.create_task(self._compact(db, user_id))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _compact(self, db: DatabaseManager, user_id: int):
+        try:
+            turns = await db.get_unsummarized_messages(user_id)
+            tokens = sum(estimate_tokens(t['user']) + estimate_tokens(t['bot']) for t in turns)
+            if tokens <= self.token_threshold or len(turns) <= self.keep_recent:
+                return
+
+            old_turns = turns[:-self.keep_recent]
+            previous = await db.get_summary(user_id)
+
+            prompt = ""
+            if previous:
+                prompt += f"Предыдущее краткое содержание:\n{previous}\n\n"
+            prompt += f"Новые сообщения диалога:\n{format_messages_for_context(old_turns)}"
+
+            logger.info(
+                f"🗜 Compacting {len(old_turns)} turn(s) (~{tokens} tokens) of user {user_id}"
+            )
+            summary = await self.ollama_service.generate_background(
+                prompt, self.model, system=SUMMARY_SYSTEM_PROMPT, user_id=user_id
+            )
+            if not summary:
+                return
+
+            await db.save_summary(user_id, summary.strip(), old_turns[-1]['id'])
+            logger.info(f"🗜 Summary saved for user {user_id}: {len(summary)} chars")
+
+        except Exception as e:
+            logger.error(f"History compaction error: {e}", exc_info=True)
+        finally:
+            self._in_progress.discard(user_id)
@@ -0,0 +1,72 @@
+"""Collection of photo album (media group) updates into one batch."""
+
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingAlbum:
+    """Messages of one media group received while the window is open"""
+
+    __slots__ = ('messages', 'updated')
+
+    def __init__(self, message: Message):
+        self.messages: List[Message] = [message]
+        self.updated = asyncio.Event()
+
+
+class MediaGroupCollector:
+    """
+    Buffers messages that share a media_group_id.
+
+    Telegram delivers every photo of an album as a separate update. The
+    first one opens a window; every photo of the same album arriving
+    before the window expires is appended and restarts the window. Only
+    the first call gets the album back, the others get None and should
+    stop processing.
+    """
+
+    # Telegram albums hold at most 10 items
+    MAX_ITEMS = 10
+
+    def __init__(self, window_ms: int):
+        self.window = window_ms / 1000
+        self._pending: Dict[str, _PendingAlbum] = {}
+
+    async def collect(self, message: Message) -> Optional[List[Message]]:
+        """
+        Add message to its album.
+
+        Returns:
+            All messages of the album (in message order) if this call owns
+            it, None if the message was appended to an album owned by an
+            earlier call
+        """
+        group_id = message.media_group_id
+        if not group_id:
+            return [message]
+
+        album = self._pending.get(group_id)
+        if album is not None:
+            album.messages.append(message)
+            album.updated.set()
+            return None
+
+        album = _PendingAlbum(message)
+        self._pending[group_id] = album
+        try:
+            while len(album.messages) < self.MAX_ITEMS:
+                album.updated.clear()
+                try:
+                    await asyncio.wait_for(album.updated.wait(), timeout=self.window)
+                except asyncio.TimeoutError:
+                    break
+        finally:
+            self._pending.pop(group_id, None)
+
+        logger.info(f"🖼 Collected album {group_id}: {len(album.messages)} item(s)")
+        return sorted(album.messages, key=lambda m: m.message_id)
@@ -0,0 +1,271 @@
+"""Memory accounting and tracemalloc profiling of the bot process."""
+
+import asyncio
+import collections
+import gc
+import logging
+import os
+import sys
+import threading
+import tracemalloc
+import types
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import Config
+from utils.metrics import metrics
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Containers whose entries are counted and measured
+_CONTAINER_TYPES = (dict, list, set, frozenset, tuple, collections.deque)
+# Shared by everything, never counted as part of a cache
+_SKIPPED_TYPES = (
+    type, types.ModuleType, types.FunctionType, types.MethodType,
+    types.BuiltinFunctionType, types.CodeType, types.FrameType,
+)
+
+
+def current_rss() -> Optional[int]:
+    """Resident set size in bytes (None where /proc is not available)"""
+    try:
+        with open('/proc/self/statm') as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss() -> Optional[int]:
+    """Peak resident set size in bytes"""
+    if not RESOURCE_AVAILABLE:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def deep_sizeof(obj: Any, limit: int = 20000) -> Tuple[int, bool]:
+    """
+    Approximate size of an object graph in bytes.
+
+    Follows containers, instance __dict__ and __slots__; modules, classes
+    and functions are not followed. Stops after `limit` objects, so the
+    size of a large cache is a lower bound rather than an exact figure.
+
+    Returns:
+        (bytes, complete) - complete is False if the limit was reached
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        if len(seen) >= limit:
+            return total, False
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, _SKIPPED_TYPES):
+            continue
+        seen.add(id(item))
+        try:
+            total += sys.getsizeof(item)
+            if isinstance(item, dict):
+                stack.extend(item.keys())
+                stack.extend(item.values())
+            elif isinstance(item, _CONTAINER_TYPES):
+                stack.extend(item)
+            else:
+                if hasattr(item, '__dict__'):
+                    stack.append(vars(item))
+                for slot in getattr(type(item), '__slots__', ()):
+                    if hasattr(item, slot):
+                        stack.append(getattr(item, slot))
+        except RuntimeError:
+            # Container changed size while being walked
+            continue
+    return total, True
+
+
+def format_bytes(size: Optional[float]) -> str:
+    if size is None:
+        return "н/д"
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.2f} GB"
+
+
+class MemoryMonitor:
+    """
+    Reports where the memory of the long-running process goes.
+
+    report() lists RSS, every container attribute (dict, list, set, ...)
+    of the tracked objects with its entry count and approximate size,
+    asyncio tasks grouped by coroutine and thread counts. Tracked objects
+    are the services built so far plus anything passed to track().
+
+    Allocation sites come from tracemalloc: snapshot() starts tracing on
+    first use and diff() compares against the previous snapshot. The
+    watchdog (run_watchdog) logs the largest caches and the fastest
+    growing allocation sites whenever RSS is above MEMORY_RSS_THRESHOLD_MB.
+
+    Object walks and snapshots are slow on a large heap, so the watchdog
+    and /memory run check() and report() in a worker thread; only the
+    asyncio task list is collected on the event loop.
+    """
+
+    def __init__(self, config: Config, sources: Optional[Callable[[], Dict[str, Any]]] = None):
+        self.threshold = config.MEMORY_RSS_THRESHOLD_MB * 1024 * 1024
+        self.top = config.MEMORY_TOP_ALLOCATIONS
+        self.frames = config.MEMORY_TRACE_FRAMES
+        self._sources = sources
+        self._tracked: Dict[str, Any] = {}
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        # Watchdog and /memory may replace the baseline from different threads
+        self._snapshot_lock = threading.Lock()
+        if config.MEMORY_TRACEMALLOC:
+            self.start_tracing()
+
+    def track(self, name: str, obj: Any):
+        """Include an object that is not a service (middleware, FSM storage)"""
+        self._tracked[name] = obj
+
+    def _objects(self) -> Dict[str, Any]:
+        objects = dict(self._sources()) if self._sources else {}
+        objects.update(self._tracked)
+        return objects
+
+    def cache_usage(self) -> List[Tuple[str, int, int, bool]]:
+        """(name, entries, bytes, complete) per container attribute, largest first"""
+        usage = []
+        for name, obj in self._objects().items():
+            if obj is None:
+                continue
+            for attribute, value in list(vars(obj).items()) if hasattr(obj, '__dict__') else ():
+                if not isinstance(value, _CONTAINER_TYPES):
+                    continue
+                size, complete = deep_sizeof(value)
+                usage.append((f"{name}.{attribute}", len(value), size, complete))
+        usage.sort(key=lambda row: row[2], reverse=True)
+        return usage
+
+    @staticmethod
+    def task_counts() -> List[Tuple[str, int]]:
+        """Running asyncio tasks grouped by coroutine name, most frequent first"""
+        counter = collections.Counter(
+            getattr(task.get_coro(), '__qualname__', type(task.get_coro()).__name__)
+            for task in asyncio.all_tasks()
+        )
+        return counter.most_common()
+
+    def report(self, tasks: Optional[List[Tuple[str, int]]] = None) -> str:
+        """
+        Human-readable memory report.
+
+        Args:
+            tasks: task_counts() collected on the event loop, required when
+                called from a worker thread
+        """
+        if tasks is None:
+            tasks = self.task_counts()
+        rss = current_rss()
+        lines = [
+            f"💾 RSS: {format_bytes(rss)} (пик {format_bytes(peak_rss())})",
+            f"🧵 Потоков: {threading.active_count()}, объектов GC: {len(gc.get_objects())}",
+        ]
+        if tracemalloc.is_tracing():
+            traced, peak = tracemalloc.get_traced_memory()
+            lines.append(f"🔬 tracemalloc: {format_bytes(traced)} (пик {format_bytes(peak)})")
+
+        lines.append(f"\n⚙️ Задач asyncio: {sum(count for _, count in tasks)}")
+        lines.extend(f"  {name}: {count}" for name, count in tasks[:10])
+
+        lines.append("\n📦 Кэши и буферы:")
+        for name, entries, size, complete in self.cache_usage():
+            lines.append(f"  {name}: {entries} шт., {'' if complete else '≥'}{format_bytes(size)}")
+
+        if rss is not None:
+            metrics.set('memory.rss_mb', rss / 1024 / 1024)
+        return "\n".join(lines)
+
+    def start_tracing(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            logger.info(f"🔬 tracemalloc started ({self.frames} frame(s))")
+
+    def stop_tracing(self):
+        with self._snapshot_lock:
+            self._snapshot = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            logger.info("🔬 tracemalloc stopped")
+
+    def _take_snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+    def snapshot(self) -> List[str]:
+        """Take a new baseline snapshot and list the largest allocation sites"""
+        self.start_tracing()
+        with self._snapshot_lock:
+            self._snapshot = self._take_snapshot()
+            stats = self._snapshot.statistics('lineno')[:self.top]
+        return [
+            f"{format_bytes(stat.size)} in {stat.count} block(s): {stat.traceback}"
+            for stat in stats
+        ]
+
+    def diff(self) -> Optional[List[str]]:
+        """
+        Compare with the previous snapshot, which is replaced by the current one.
+
+        Returns:
+            Allocation sites that grew most, None if there is no baseline yet
+        """
+        with self._snapshot_lock:
+            if self._snapshot is None or not tracemalloc.is_tracing():
+                return None
+            current = self._take_snapshot()
+            stats = current.compare_to(self._snapshot, 'lineno')[:self.top]
+            self._snapshot = current
+        return [
+            f"{'+' if stat.size_diff >= 0 else '-'}{format_bytes(abs(stat.size_diff))} "
+            f"(total {format_bytes(stat.size)}): {stat.traceback}"
+            for stat in stats
+        ]
+
+    def check(self):
+        """Log top caches and allocation growth if RSS is above the threshold (blocking)"""
+        rss = current_rss()
+        if rss is None:
+            return
+        metrics.set('memory.rss_mb', rss / 1024 / 1024)
+        if rss < self.threshold:
+            return
+        logger.warning(f"⚠️ RSS {format_bytes(rss)} is above threshold {format_bytes(self.threshold)}")
+        for name, entries, size, complete in self.cache_usage()[:5]:
+            logger.warning(f"   📦 {name}: {entries} entries, {'' if complete else '≥'}{format_bytes(size)}")
+        # First crossing takes the baseline; later checks show what grew since
+        growth = self.diff()
+        if growth is None:
+            self.snapshot()
+            logger.warning("🔬 tracemalloc baseline taken, growth is logged on the next check")
+            return
+        for line in growth:
+            logger.warning(f"   🔬 {line}")
+
+    async def run_watchdog(self, interval: int):
+        """Periodically check RSS against the threshold off the event loop"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.check)
+            except Exception as e:
+                logger.error(f"Memory check error: {e}")
@@ -0,0 +1,132 @@
+"""Long-term conversation memory based on turn embeddings."""
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Set
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+from config import Config
+from database.db_manager import DatabaseManager
+from services.ollama_service import OllamaService
+from utils.helpers import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryStore:
+    """
+    Builds history context from relevant turns instead of the last N.
+    
+    Every stored question/answer pair is embedded in the background and
+    saved to message_embeddings. For a new question the context is the
+    last few turns plus the top-k most similar older turns, trimmed to a
+    fixed token budget.
+    """
+
+    # Max characters of a turn passed to the embedding model
+    MAX_EMBED_CHARS = 2000
+
+    def __init__(self, config: Config, ollama_service: OllamaService):
+        if not NUMPY_AVAILABLE:
+            raise ImportError(
+                "numpy is required for memory store. "
+                "Install with: pip install numpy"
+            )
+
+        self.ollama_service = ollama_service
+        self.top_k = config.MEMORY_TOP_K
+        self.recent_turns = config.MEMORY_RECENT_TURNS
+        self.token_budget = config.MEMORY_TOKEN_BUDGET
+        self._background: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def _turn_tokens(turn: Dict[str, Any]) -> int:
+        return estimate_tokens(turn['user']) + estimate_tokens(turn['bot'])
+
+    async def _embed_and_store(
+        self, db: DatabaseManager, message_id: int, user_id: int, user_message: str, bot_response: str
+    ):
+        text = f"{user_message}\n{bot_response}"[:self.MAX_EMBED_CHARS]
+        embedding = await self.ollama_service.get_embedding(text)
+        if embedding is None:
+            return
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector /= max(float(np.linalg.norm(vector)), 1e-12)
+        await db.add_message_embedding(message_id, user_id, vector.tobytes())
+
+    def remember(
+        self, db: DatabaseManager, message_id: int, user_id: int, user_message: str, bot_response: str
+    ):
+        """Embed stored turn in the background (off the response path)"""
+        task = asyncio.create_task(
+            self._embed_and_store(db, message_id, user_id, user_message, bot_response)
+        )
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def recall(
+        self,
+        db: DatabaseManager,
+        user_id: int,
+        question_embedding: Optional[List[float]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Get history context for a question.
+        
+        Returns:
+            Recent and relevant turns in chronological order
+        """
+        recent = await db.get_message_history(user_id, self.recent_turns)
+
+        # Recent turns first, newest has priority if budget is tight
+        selected: Dict[int, Dict[str, Any]] = {}
+        budget = self.token_budget
+        for turn in reversed(recent):
+            tokens = self._turn_tokens(turn)
+            if selected and tokens > budget:
+                break
+            selected[turn['id']] = turn
+            budget -= tokens
+
+        if question_embedding is not None and budget > 0 and self.top_k > 0:
+            for turn in await self._relevant_turns(db, user_id, question_embedding, set(selected)):
+                tokens = self._turn_tokens(turn)
+                if tokens <= budget:
+                    selected[turn['id']] = turn
+                    budget -= tokens
+
+        messages = [selected[message_id] for message_id in sorted(selected)]
+        logger.info(
+            f"🧠 Memory context: {len(messages)} turn(s), "
+            f"~{self.token_budget - budget} tokens"
+        )
+        return messages
+
+    async def _relevant_turns(
+        self, db: DatabaseManager, user_id: int, question_embedding: List[float], exclude: Set[int]
+    ) -> List[Dict[str, Any]]:
+        """Get top-k most similar turns ordered by similarity"""
+        rows = [(mid, blob) for mid, blob in await db.get_message_embeddings(user_id) if mid not in exclude]
+        if not rows:
+            return []
+
+        query = np.asarray(question_embedding, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        try:
+            matrix = np.frombuffer(b''.join(blob for _, blob in rows), dtype=np.float32)
+            matrix = matrix.reshape(len(rows), query.shape[0])
+        except ValueError:
+            logger.warning("Embedding dimension changed, skipping memory lookup")
+            return []
+
+        scores = matrix @ query
+        top = np.argsort(-scores)[:self.top_k]
+        ids = [rows[i][0] for i in top]
+
+        turns = {turn['id']: turn for turn in await db.get_messages_by_ids(user_id, ids)}
+        return [turns[mid] for mid in ids if mid in turns]
@@ -0,0 +1,89 @@
+"""Merging of quick message bursts from one user into a single request."""
+
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingBatch:
+    """Messages collected for one user while the window is open"""
+
+    __slots__ = ('parts', 'updated')
+
+    def __init__(self, text: str):
+        self.parts: List[str] = [text]
+        self.updated = asyncio.Event()
+
+
+class MessageCoalescer:
+    """
+    Debounces text messages per user.
+    
+    The first message opens a window; every message arriving before the
+    window expires is appended to the batch and restarts the window. Only
+    the first call gets the merged text back, the others get None and
+    should stop processing. The window grows with the number of requests
+    already in flight, since under load waiting a bit longer costs nothing.
+    """
+
+    def __init__(
+        self,
+        window_ms: int,
+        max_window_ms: int,
+        load_fn: Optional[Callable[[], int]] = None
+    ):
+        self.window_ms = window_ms
+        self.max_window_ms = max(max_window_ms, window_ms)
+        self._load_fn = load_fn
+        self._pending: Dict[int, _PendingBatch] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_ms > 0
+
+    def current_window(self) -> float:
+        """Get debounce window in seconds adapted to current load"""
+        load = self._load_fn() if self._load_fn else 0
+        window_ms = min(self.window_ms * (1 + load), self.max_window_ms)
+        return window_ms / 1000
+
+    async def collect(self, user_id: int, text: str) -> Optional[str]:
+        """
+        Add message to the user's batch.
+        
+        Returns:
+            Merged text if this call owns the batch, None if the message
+            was appended to a batch owned by an earlier call
+        """
+        if not self.enabled:
+            return text
+
+        batch = self._pending.get(user_id)
+        if batch is not None:
+            batch.parts.append(text)
+            batch.updated.set()
+            return None
+
+        batch = _PendingBatch(text)
+        self._pending[user_id] = batch
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_window_ms / 1000
+
+        try:
+            while True:
+                batch.updated.clear()
+                timeout = min(self.current_window(), deadline - loop.time())
+                if timeout <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(batch.updated.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+        finally:
+            self._pending.pop(user_id, None)
+
+        if len(batch.parts) > 1:
+            logger.info(f"🧩 Merged {len(batch.parts)} messages from user {user_id}")
+        return "\n".join(batch.parts)
@@ -1,26 +1,344 @@
 import asyncio
+import base64
 import json
 import logging
-from typing import List, Dict, Optional
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Dict, Optional, Tuple
 import subprocess
 from config import Config
+from services.backend_pool import Backend, BackendPool
+from services.cost_estimator import (
+    CostEstimate, CostEstimator, IMAGE_PROMPT_TOKENS,
+    JOB_BACKGROUND, JOB_PHOTO, JOB_PLAIN, JOB_SEARCH
+)
+from services.prompt_templates import get_template, load_templates
+from services.scheduler import GenerationScheduler, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from utils.helpers import estimate_tokens
+from utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+# Called after every generation with (user_id, model, stats)
+UsageListener = Callable[[Optional[int], str, Dict[str, Any]], Awaitable[None]]
+
+
 class OllamaService:
     """Service for interacting with Ollama API"""
     
-    def __init__(self, config: Config):
+    # All error messages returned instead of an answer start with one of these
+    ERROR_PREFIXES = ('⏱️', 'Ошибка', 'Модель не')
+    
+    # curl exit code when the connection to the server failed
+    CURL_CONNECT_FAILED = 7
+    
+    # Prompt appended to the stored context by continue_response()
+    CONTINUE_PROMPT = "Продолжи свой предыдущий ответ с того места, где он оборвался. Не повторяй уже написанное."
+    
+    def __init__(self, config: Config, cost_estimator: Optional[CostEstimator] = None):
         self.config = config
-        self.base_url = config.OLLAMA_URL
+        self.backends = BackendPool(config)
+        self.scheduler = GenerationScheduler(config.OLLAMA_MAX_PARALLEL, config.SCHEDULER_AGING_RATE)
+        self.cost_estimator = cost_estimator or CostEstimator()
+        self._usage_listeners: List[UsageListener] = []
+        if config.PROMPT_TEMPLATES_FILE:
+            try:
+                load_templates(config.PROMPT_TEMPLATES_FILE)
+            except (OSError, ValueError) as e:
+                logger.error(f"Error loading prompt templates, using the default: {e}")
+    
+    def add_usage_listener(self, listener: UsageListener):
+        """Register coroutine called with token/timing stats of every generation"""
+        self._usage_listeners.append(listener)
+    
+    @classmethod
+    def is_error_response(cls, text: str) -> bool:
+        """Check if text is an error message rather than a model answer"""
+        return text.startswith(cls.ERROR_PREFIXES)
+    
+    @staticmethod
+    def extract_stats(parsed: Dict[str, Any]) -> Dict[str, Any]:
+        """Extract token counts and durations (ns) from final Ollama response chunk"""
+        return {
+            'prompt_eval_count': parsed.get('prompt_eval_count', 0) or 0,
+            'eval_count': parsed.get('eval_count', 0) or 0,
+            'prompt_eval_duration': parsed.get('prompt_eval_duration', 0) or 0,
+            'eval_duration': parsed.get('eval_duration', 0) or 0,
+            'total_duration': parsed.get('total_duration', 0) or 0,
+        }
+    
+    async def _notify_usage(self, user_id: Optional[int], model: str, stats: Dict[str, Any]):
+        """Pass generation stats to registered listeners"""
+        for listener in self._usage_listeners:
+            try:
+                await listener(user_id, model, stats)
+            except Exception as e:
+                logger.error(f"Usage listener error: {e}", exc_info=True)
+    
+    @asynccontextmanager
+    async def generation_slot(
+        self,
+        model: str,
+        kind: str,
+        prompt: str,
+        priority: int = PRIORITY_INTERACTIVE,
+        extra_tokens: int = 0
+    ) -> AsyncIterator[CostEstimate]:
+        """
+        Hold a scheduler slot for one generation, queued by its estimated cost.
+        
+        Yields the estimate, to be passed to record_generation() once the
+        generation stats are known.
+        
+        Args:
+            extra_tokens: prompt tokens not present in the text (e.g. images)
+        """
+        estimate = self.cost_estimator.estimate(
+            model, kind, estimate_tokens(prompt) + extra_tokens
+        )
+        async with self.scheduler.slot(priority, estimate.seconds):
+            yield estimate
+    
+    async def record_generation(
+        self,
+        user_id: Optional[int],
+        estimate: CostEstimate,
+        stats: Dict[str, Any]
+    ):
+        """Recalibrate cost estimator and pass stats to usage listeners"""
+        self.cost_estimator.record(estimate, stats)
+        await self._notify_usage(user_id, estimate.model, stats)
+    
+    async def _run_curl(
+        self,
+        command: List[str],
+        timeout: float,
+        input_data: Optional[bytes] = None,
+        on_output: Optional[Callable[[bytes], None]] = None
+    ) -> Tuple[int, bytes, bytes]:
+        """
+        Run curl command and wait for it to finish.
+        
+        The curl process is killed when the asyncio timeout expires or the
+        awaiting task is cancelled, so an aborted request drops the HTTP
+        connection and Ollama stops generating right away.
+        
+        Args:
+            input_data: written to curl's stdin (for bodies passed as `-d @-`)
+            on_output: called once with the first line of stdout, as soon as
+                it is complete (or with all output, if it has no newline)
+        
+        Returns:
+            Tuple of (return code, stdout, stderr)
+        """
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.PIPE if input_data is not None else None,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        
+        async def communicate() -> Tuple[bytes, bytes]:
+            if on_output is None:
+                return await process.communicate(input_data)
+            if input_data is not None:
+                try:
+                    process.stdin.write(input_data)
+                    await process.stdin.drain()
+                    process.stdin.close()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+            stderr_task = asyncio.ensure_future(process.stderr.read())
+            chunks = []
+            reported = False
+            try:
+                while True:
+                    chunk = await process.stdout.read(65536)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                    if not reported and b'\n' in chunk:
+                        reported = True
+                        on_output(b''.join(chunks).split(b'\n', 1)[0])
+                if not reported and chunks:
+                    on_output(b''.join(chunks))
+                stderr = await stderr_task
+            finally:
+                stderr_task.cancel()
+            await process.wait()
+            return b''.join(chunks), stderr
+        
+        try:
+            stdout, stderr = await asyncio.wait_for(communicate(), timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            try:
+                process.kill()
+                await process.wait()
+            except ProcessLookupError:
+                pass
+            except Exception as kill_error:
+                logger.error(f'Error killing process: {kill_error}')
+            raise
+        
+        return process.returncode, stdout, stderr
+    
+    @staticmethod
+    def _curl_command(url: str, path: str, max_time: int) -> List[str]:
+        """curl POST with the JSON body on stdin and unbuffered output"""
+        return [
+            'curl', '-N', '-X', 'POST', f'{url}{path}',
+            '-d', '@-',
+            '-H', 'Content-Type: application/json',
+            '--max-time', str(max_time),
+            '--connect-timeout', '10'
+        ]
+    
+    @staticmethod
+    def _parse_lines(output: bytes) -> List[Dict[str, Any]]:
+        """Parse JSON lines of a streamed (or single-object) Ollama response"""
+        return [json.loads(line) for line in output.decode('utf-8').splitlines() if line.strip()]
+    
+    @staticmethod
+    def _is_answer(line: bytes) -> bool:
+        """Check if first line of output is an Ollama chunk rather than an error"""
+        try:
+            parsed = json.loads(line)
+        except ValueError:
+            return False
+        return isinstance(parsed, dict) and 'error' not in parsed
+    
+    async def _request(
+        self,
+        path: str,
+        payload: Dict[str, Any],
+        max_time: int,
+        model: str = '',
+        kind: str = JOB_PLAIN,
+        hedge: bool = False
+    ) -> Tuple[int, bytes, bytes]:
+        """
+        POST payload to the least busy Ollama backend through curl.
+        
+        With hedge=True (generations) and hedging enabled, the request is
+        streamed and also goes to a second backend when it has produced no
+        output within the pool's hedge delay or has failed without output.
+        The first attempt whose first line is an answer (not an Ollama
+        error or an HTTP error page) is used; the other one is cancelled,
+        which kills its curl and stops that generation. Without hedging
+        the payload is sent as given.
+        
+        Returns:
+            Tuple of (return code, stdout, stderr) of the used attempt
+        
+        Raises:
+            asyncio.TimeoutError: the used attempt took longer than max_time + 10 s
+        """
+        hedge = hedge and self.backends.hedge_enabled
+        if hedge:
+            # Time to first token is only observable on a stream
+            payload = {**payload, "stream": True}
+        body = json.dumps(payload).encode('utf-8')
+        loop = asyncio.get_running_loop()
+        winner: asyncio.Future = loop.create_future()
+        attempts: Dict[asyncio.Task, Tuple[Backend, float]] = {}
+        produced = set()
+        cancelled = set()
+        
+        def start(backend: Backend) -> asyncio.Task:
+            started = loop.time()
+            
+            def on_output(first_line: bytes):
+                if not self._is_answer(first_line):
+                    # A fast error must not beat a slow healthy backend
+                    logger.warning(f"⚠️ Ollama backend {backend.url} answered with an error")
+                    return
+                produced.add(task)
+                if hedge:
+                    self.backends.record_latency(model, kind, loop.time() - started)
+                if not winner.done():
+                    winner.set_result(task)
+            
+            def on_done(finished: asyncio.Task):
+                connected = (
+                    finished.cancelled() or finished.exception() is not None or
+                    finished.result()[0] != self.CURL_CONNECT_FAILED
+                )
+                self.backends.release(backend, connected)
+            
+            task = asyncio.create_task(self._run_curl(
+                self._curl_command(backend.url, path, max_time), max_time + 10, body,
+                on_output if hedge else None
+            ))
+            task.add_done_callback(on_done)
+            attempts[task] = (backend, started)
+            return task
+        
+        def cancel(keep: Optional[asyncio.Task] = None):
+            for task, (_, started) in attempts.items():
+                if task is keep or task.done() or task in cancelled:
+                    continue
+                cancelled.add(task)
+                task.cancel()
+                # The slow tail would vanish from the window if losers were not recorded
+                if hedge and task not in produced:
+                    self.backends.record_latency(model, kind, loop.time() - started)
+        
+        first = start(self.backends.acquire())
+        hedge_at = None
+        if hedge:
+            self.backends.earn()
+            hedge_at = loop.time() + self.backends.hedge_delay(model, kind)
+        
+        try:
+            while not winner.done():
+                running = [task for task in attempts if not task.done()]
+                if not running:
+                    break
+                timeout = None if hedge_at is None else max(0.0, hedge_at - loop.time())
+                done, _ = await asyncio.wait(
+                    [*running, winner], timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if winner.done() or hedge_at is None:
+                    continue
+                # No output yet: hedge once the delay has passed or an attempt failed
+                if done or loop.time() >= hedge_at:
+                    hedge_at = None
+                    if self.backends.try_hedge():
+                        backend = self.backends.acquire(exclude=[b for b, _ in attempts.values()])
+                        logger.info(
+                            f"🔀 No output from {attempts[first][0].url} after "
+                            f"{loop.time() - attempts[first][1]:.1f}s, hedging to {backend.url}"
+                        )
+                        start(backend)
+            
+            used = winner.result() if winner.done() else first
+            if used is not first:
+                metrics.inc('ollama_hedge_wins_total')
+                logger.info(f"🔀 Hedged request to {attempts[used][0].url} answered first")
+            # Free the other backend now, not when the winner's output is complete
+            cancel(keep=used)
+            return await used
+        finally:
+            # Error or cancellation of the caller: nothing may keep generating
+            cancel()
+            await asyncio.gather(*attempts, return_exceptions=True)
     
     async def get_response(
         self,
         user_input: str,
         messages: List[Dict[str, str]],
-        model: str
+        model: str,
+        user_id: Optional[int] = None,
+        options: Optional[Dict[str, Any]] = None,
+        details: Optional[Dict[str, Any]] = None
     ) -> str:
-        """Get response from Ollama model"""
+        """
+        Get response from Ollama model.
+        
+        Args:
+            options: extra Ollama options (e.g. num_ctx, num_predict)
+            details: filled on success with 'text' (the answer before the
+                MAX_MESSAGE_LENGTH cut) and 'context' (Ollama token context)
+        """
         # Build context from message history
         context = "\n".join(
             f"Пользователь: {msg['user']}\nБот: {msg['bot']}"
@@ -29,59 +347,47 @@ class OllamaService:
         
         full_prompt = f"{context}\nПользователь: {user_input}" if context else user_input
         
-        json_request = json.dumps({
+        # Streamed by _request() when hedging, to see the time to first token
+        payload = {
             "model": model,
             "prompt": full_prompt,
             "stream": False
-        })
-        
-        command = [
-            'curl', '-X', 'POST', f'{self.base_url}/api/generate',
-            '-d', json_request,
-            '-H', 'Content-Type: application/json',
-            '--max-time', str(self.config.REQUEST_TIMEOUT),
-            '--connect-timeout', '10'
-        ]
+        }
+        if options:
+            payload["options"] = options
         
         logger.info(f'Sending request to model {model}')
         
         try:
-            process = await asyncio.create_subprocess_exec(
-                *command,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
             try:
-                stdout, stderr = await asyncio.wait_for(
-                    process.communicate(),
-                    timeout=self.config.REQUEST_TIMEOUT + 10
-                )
+                async with self.generation_slot(model, JOB_PLAIN, full_prompt) as estimate:
+                    returncode, stdout, stderr = await self._request(
+                        '/api/generate', payload, self.config.REQUEST_TIMEOUT,
+                        model, JOB_PLAIN, hedge=True
+                    )
             except asyncio.TimeoutError:
-                logger.error('⏱️ Asyncio timeout - killing process')
-                try:
-                    process.kill()
-                    await process.wait()
-                except Exception as kill_error:
-                    logger.error(f'Error killing process: {kill_error}')
+                logger.error('⏱️ Asyncio timeout - process killed')
                 return "⏱️ Превышено время ожидания ответа от модели. Попробуйте сократить запрос или выбрать более быструю модель."
             
             response = stdout.decode('utf-8')
             
-            if process.returncode == 0:
+            if returncode == 0:
                 try:
-                    responses = response.strip().split('\n')
-                    full_response = ''.join([json.loads(r)['response'] for r in responses])
+                    responses = [json.loads(r) for r in response.strip().split('\n')]
+                    full_response = ''.join(r['response'] for r in responses)
+                    await self.record_generation(user_id, estimate, self.extract_stats(responses[-1]))
+                    if details is not None:
+                        details.update(text=full_response, context=responses[-1].get('context'))
                     return full_response[:self.config.MAX_MESSAGE_LENGTH]
                 except json.JSONDecodeError as e:
                     logger.error(f'JSON decode error: {e}')
                     return "Ошибка при разборе ответа от модели."
-            elif process.returncode == 28:  # Curl timeout
+            elif returncode == 28:  # Curl timeout
                 logger.error('cURL timeout (code 28)')
                 return "⏱️ Превышено время ожидания ответа от модели. Попробуйте сократить запрос."
             else:
                 error = stderr.decode('utf-8')
-                logger.error(f'Error from model (code {process.returncode}): {error}')
+                logger.error(f'Error from model (code {returncode}): {error}')
                 return "Ошибка при выполнении запроса к модели."
                 
         except Exception as e:
@@ -93,78 +399,70 @@ class OllamaService:
         user_input: str,
         search_context: str,
         messages: List[Dict[str, str]],
-        model: str
+        model: str,
+        user_id: Optional[int] = None,
+        options: Optional[Dict[str, Any]] = None,
+        details: Optional[Dict[str, Any]] = None
     ) -> str:
         """
         Get response from Ollama model with search context.
         Uses increased timeout for search-enhanced requests.
+        
+        Args:
+            options: Ollama options overriding the defaults (e.g. num_ctx, num_predict)
+            details: filled like in get_response()
         """
         logger.info(f"🤖 Preparing search-enhanced request for model: {model}")
         logger.info(f"📊 Search context length: {len(search_context)} chars")
         logger.info(f"💬 History messages: {len(messages)}")
         
         # Build context with search results (no history in search mode to reduce context)
-        # Create prompt with search context
-        prompt = f"""Ты — универсальный и всезнающий ассистент, обладающий полной и точной информацией во всех областях знаний. Используй {search_context} как дополнительный источник, чтобы ответить на {user_input}. 
-
-        Дай ясный, точный и максимально информативный ответ, включая даты, числа и факты. Не добавляй неподтверждённые сведения и не рассуждай предположительно."""
+        # Fixed instructions go to the system field so the prefix is cacheable
+        template = get_template(model)
+        prompt = template.build_search_prompt(user_input, search_context)
         
-        logger.info(f"📝 Full prompt length: {len(prompt)} chars")
+        logger.info(f"📝 Full prompt length: {len(prompt)} chars (template {template.version})")
         
         # Increased timeout for search requests
         search_timeout = min(self.config.REQUEST_TIMEOUT * 2, 300)  # Max 5 minutes
         
-        json_request = json.dumps({
+        payload = {
             "model": model,
+            "system": template.search_system,
             "prompt": prompt,
             "stream": False,
             "options": {
                 "temperature": 0.7,
                 "top_p": 0.9,
                 "top_k": 40,
-                "num_ctx": 4096  # Ensure enough context window
+                "num_ctx": 4096,  # Ensure enough context window
+                **(options or {})
             }
-        })
-        
-        command = [
-            'curl', '-X', 'POST', f'{self.base_url}/api/generate',
-            '-d', json_request,
-            '-H', 'Content-Type: application/json',
-            '--max-time', str(search_timeout),
-            '--connect-timeout', '10'
-        ]
+        }
         
         logger.info(f'🚀 Sending search-enhanced request (timeout: {search_timeout}s)')
         
         try:
-            process = await asyncio.create_subprocess_exec(
-                *command,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
             try:
-                stdout, stderr = await asyncio.wait_for(
-                    process.communicate(),
-                    timeout=search_timeout + 10
-                )
+                async with self.generation_slot(
+                    model, JOB_SEARCH, template.search_system + prompt
+                ) as estimate:
+                    returncode, stdout, stderr = await self._request(
+                        '/api/generate', payload, search_timeout,
+                        model, JOB_SEARCH, hedge=True
+                    )
             except asyncio.TimeoutError:
-                logger.error(f'⏱️ Asyncio timeout after {search_timeout}s - killing process')
-                try:
-                    process.kill()
-                    await process.wait()
-                except Exception as kill_error:
-                    logger.error(f'Error killing process: {kill_error}')
+                logger.error(f'⏱️ Asyncio timeout after {search_timeout}s - process killed')
                 return "⏱️ Модель не успела обработать результаты поиска. Попробуйте упростить запрос или выбрать более быструю модель."
             
-            logger.info(f"✅ Process completed with return code: {process.returncode}")
+            logger.info(f"✅ Process completed with return code: {returncode}")
             
             if stderr:
                 stderr_text = stderr.decode('utf-8')
                 if 'timed out' in stderr_text.lower():
                     logger.error(f"⚠️ Curl timeout detected in stderr")
             
-            if process.returncode == 0:
+            if returncode == 0:
                 response_text = stdout.decode('utf-8')
                 logger.info(f"📦 Raw response length: {len(response_text)} chars")
                 
@@ -173,6 +471,8 @@ class OllamaService:
                     logger.info(f"📄 Response has {len(responses)} line(s)")
                     
                     full_response = ''
+                    stats = None
+                    context = None
                     for idx, response_line in enumerate(responses):
                         if not response_line.strip():
                             continue
@@ -182,12 +482,19 @@ class OllamaService:
                                 full_response += parsed['response']
                             if parsed.get('done', False):
                                 logger.info(f"✅ Model marked response as complete")
+                                stats = self.extract_stats(parsed)
+                                context = parsed.get('context')
                         except json.JSONDecodeError as je:
                             logger.error(f"❌ JSON decode error on line {idx}: {je}")
                             continue
                     
+                    if stats:
+                        await self.record_generation(user_id, estimate, stats)
+                    
                     if full_response:
                         logger.info(f"✅ Successfully parsed response: {len(full_response)} chars")
+                        if details is not None:
+                            details.update(text=full_response, context=context)
                         return full_response[:self.config.MAX_MESSAGE_LENGTH]
                     else:
                         logger.error("❌ No response content found in parsed JSON")
@@ -197,19 +504,271 @@ class OllamaService:
                     logger.error(f'❌ Error parsing response: {e}', exc_info=True)
                     return "Ошибка при разборе ответа от модели."
                     
-            elif process.returncode == 28:  # Curl timeout
+            elif returncode == 28:  # Curl timeout
                 error = stderr.decode('utf-8')
                 logger.error(f'❌ cURL timeout (code 28): {error}')
                 return f"⏱️ Модель не успела обработать запрос за {search_timeout} секунд. Попробуйте:\n• Выбрать более быструю модель\n• Упростить запрос\n• Увеличить REQUEST_TIMEOUT в настройках"
             else:
                 error = stderr.decode('utf-8')
-                logger.error(f'❌ Error from curl/model (code {process.returncode}): {error}')
+                logger.error(f'❌ Error from curl/model (code {returncode}): {error}')
                 return "Ошибка при выполнении запроса к модели."
                 
         except Exception as e:
             logger.error(f'❌ Error during request to model: {e}', exc_info=True)
             return f"Ошибка при выполнении запроса к модели: {str(e)}"
     
+    async def continue_response(
+        self,
+        context: List[int],
+        model: str,
+        user_id: Optional[int] = None,
+        options: Optional[Dict[str, Any]] = None,
+        details: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Continue a previous answer from its Ollama token context.
+        
+        The context already holds the tokenized prompt (history or search
+        context) and the answer, so nothing is rebuilt; Ollama reuses the
+        cached prefix and only evaluates the short continue instruction.
+        
+        Args:
+            context: 'context' returned with the previous answer
+            details: filled like in get_response()
+        """
+        payload = {
+            "model": model,
+            "prompt": self.CONTINUE_PROMPT,
+            "context": list(context),
+            "stream": False,
+            "options": {"num_ctx": 4096, **(options or {})}
+        }
+        
+        logger.info(f'➡️ Continuing answer of model {model} ({len(context)} context tokens)')
+        
+        try:
+            # Context tokens are mostly cached, only the instruction is new prompt
+            async with self.generation_slot(model, JOB_PLAIN, self.CONTINUE_PROMPT) as estimate:
+                returncode, stdout, stderr = await self._request(
+                    '/api/generate', payload, self.config.REQUEST_TIMEOUT,
+                    model, JOB_PLAIN, hedge=True
+                )
+        except asyncio.TimeoutError:
+            logger.error('⏱️ Asyncio timeout - process killed')
+            return "⏱️ Превышено время ожидания ответа от модели. Попробуйте выбрать более быструю модель."
+        
+        if returncode != 0:
+            logger.error(f'Error from model (code {returncode}): {stderr.decode("utf-8")}')
+            return "Ошибка при выполнении запроса к модели."
+        
+        try:
+            chunks = self._parse_lines(stdout)
+        except json.JSONDecodeError as e:
+            logger.error(f'JSON decode error: {e}')
+            return "Ошибка при разборе ответа от модели."
+        
+        if not chunks or 'error' in chunks[-1]:
+            logger.error(f'Continuation failed: {chunks[-1]["error"] if chunks else "empty response"}')
+            return "Ошибка при выполнении запроса к модели."
+        
+        await self.record_generation(user_id, estimate, self.extract_stats(chunks[-1]))
+        text = ''.join(chunk.get('response', '') for chunk in chunks)
+        if not text:
+            return "Модель не вернула ответ. Попробуйте сгенерировать ответ заново."
+        if details is not None:
+            details.update(text=text, context=chunks[-1].get('context'))
+        return text[:self.config.MAX_MESSAGE_LENGTH]
+    
+    async def analyze_images(
+        self,
+        prompt: str,
+        images: List[bytes],
+        model: str,
+        user_id: Optional[int] = None
+    ) -> str:
+        """
+        Ask vision model about one or more images in a single chat request.
+        
+        The request body goes through curl's stdin: base64 images easily
+        exceed the command-line argument size limit.
+        """
+        payload = {
+            "model": model,
+            "messages": [{
+                "role": "user",
+                "content": prompt,
+                "images": [base64.b64encode(image).decode('ascii') for image in images]
+            }],
+            "stream": False
+        }
+        
+        logger.info(f'🖼 Sending {len(images)} image(s) to model {model}')
+        
+        try:
+            async with self.generation_slot(
+                model, JOB_PHOTO, prompt, extra_tokens=IMAGE_PROMPT_TOKENS * len(images)
+            ) as estimate:
+                returncode, stdout, stderr = await self._request(
+                    '/api/chat', payload, self.config.REQUEST_TIMEOUT,
+                    model, JOB_PHOTO, hedge=True
+                )
+        except asyncio.TimeoutError:
+            logger.error('⏱️ Asyncio timeout - process killed')
+            return "⏱️ Превышено время ожидания ответа от модели. Попробуйте отправить меньше изображений."
+        
+        if returncode != 0:
+            logger.error(f'Error from vision model (code {returncode}): {stderr.decode("utf-8")}')
+            return "Ошибка при выполнении запроса к модели."
+        
+        try:
+            chunks = self._parse_lines(stdout)
+        except json.JSONDecodeError as e:
+            logger.error(f'JSON decode error: {e}')
+            return "Ошибка при разборе ответа от модели."
+        
+        parsed = chunks[-1] if chunks else {'error': 'empty response'}
+        if 'error' in parsed:
+            logger.error(f'Vision model error: {parsed["error"]}')
+            return f"Ошибка при выполнении запроса к модели: {parsed['error']}"
+        
+        await self.record_generation(user_id, estimate, self.extract_stats(parsed))
+        content = ''.join(chunk.get('message', {}).get('content', '') for chunk in chunks)
+        return content[:self.config.MAX_MESSAGE_LENGTH]
+    
+    async def warm_model(self, model: str):
+        """
+        Load model into memory without generating anything.
+        
+        Used while a web search runs, so the model is ready when the
+        search context is. With several backends every one is warmed: the
+        request may go to any of them, and a hedge to a backend that still
+        has to load the model cannot win.
+        """
+        body = json.dumps({"model": model, "keep_alive": "10m"}).encode('utf-8')
+        
+        async def warm(url: str):
+            try:
+                returncode, _, stderr = await self._run_curl(
+                    self._curl_command(url, '/api/generate', self.config.REQUEST_TIMEOUT),
+                    self.config.REQUEST_TIMEOUT + 10,
+                    body
+                )
+                if returncode != 0:
+                    logger.warning(f'Model warm-up on {url} failed (code {returncode}): {stderr.decode("utf-8")}')
+            except asyncio.TimeoutError:
+                logger.warning(f'⏱️ Model warm-up on {url} timed out')
+        
+        await asyncio.gather(*(warm(backend.url) for backend in self.backends.backends))
+    
+    async def generate(
+        self,
+        prompt: str,
+        model: str,
+        system: Optional[str] = None,
+        user_id: Optional[int] = None,
+        kind: str = JOB_PLAIN,
+        priority: int = PRIORITY_INTERACTIVE,
+        options: Optional[Dict[str, Any]] = None
+    ) -> Optional[str]:
+        """
+        Run one-shot generation without history (document chunks, summaries).
+        
+        Returns:
+            Generated text, or None on error
+        """
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": False,
+            "options": {"num_ctx": 4096, **(options or {})}
+        }
+        if system:
+            payload["system"] = system
+        
+        try:
+            async with self.generation_slot(
+                model, kind, (system or '') + prompt, priority
+            ) as estimate:
+                # Nobody waits for background jobs, they are never hedged
+                returncode, stdout, stderr = await self._request(
+                    '/api/generate', payload, self.config.REQUEST_TIMEOUT,
+                    model, kind, hedge=priority < PRIORITY_BACKGROUND
+                )
+            if returncode != 0:
+                logger.error(f'Generation failed (code {returncode}): {stderr.decode("utf-8")}')
+                return None
+            
+            chunks = self._parse_lines(stdout)
+            if not chunks or 'error' in chunks[-1]:
+                logger.error(f'Generation failed: {chunks[-1]["error"] if chunks else "empty response"}')
+                return None
+            await self.record_generation(user_id, estimate, self.extract_stats(chunks[-1]))
+            return ''.join(chunk.get('response', '') for chunk in chunks) or None
+            
+        except asyncio.TimeoutError:
+            logger.error('⏱️ Generation timed out')
+            return None
+        except json.JSONDecodeError as e:
+            logger.error(f'Error parsing generation response: {e}')
+            return None
+    
+    async def generate_background(
+        self,
+        prompt: str,
+        model: str,
+        system: Optional[str] = None,
+        user_id: Optional[int] = None
+    ) -> Optional[str]:
+        """
+        Run low-priority generation (summaries and other background jobs).
+        
+        Waits for a free slot behind all interactive requests.
+        
+        Returns:
+            Generated text, or None on error
+        """
+        return await self.generate(
+            prompt, model, system, user_id, kind=JOB_BACKGROUND, priority=PRIORITY_BACKGROUND
+        )
+    
+    async def get_embeddings(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """
+        Get embeddings of texts from the configured embedding model.
+        
+        Returns:
+            One vector per text, or None on error
+        """
+        payload = {
+            "model": self.config.EMBEDDING_MODEL,
+            "input": texts
+        }
+        
+        try:
+            returncode, stdout, stderr = await self._request(
+                '/api/embed', payload, self.config.EMBEDDING_TIMEOUT
+            )
+            if returncode != 0:
+                logger.error(f'Embedding request failed (code {returncode}): {stderr.decode("utf-8")}')
+                return None
+            
+            embeddings = json.loads(stdout.decode('utf-8')).get('embeddings')
+            if not embeddings or len(embeddings) != len(texts):
+                logger.error('Embedding model returned no vectors')
+                return None
+            return embeddings
+            
+        except asyncio.TimeoutError:
+            logger.error('⏱️ Embedding request timed out')
+            return None
+        except (json.JSONDecodeError, AttributeError) as e:
+            logger.error(f'Error parsing embedding response: {e}')
+            return None
+    
+    async def get_embedding(self, text: str) -> Optional[List[float]]:
+        """Get embedding of a single text"""
+        embeddings = await self.get_embeddings([text])
+        return embeddings[0] if embeddings else None
+    
     @staticmethod
     def get_available_models() -> List[str]:
         """Get list of available Ollama models"""
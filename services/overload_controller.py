@@ -0,0 +1,159 @@
+"""Load-adaptive degradation of generation requests."""
+
+import logging
+from typing import Any, Dict, Optional
+
+from config import Config
+from services.scheduler import GenerationScheduler
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Degradation levels, each one includes all previous ones
+LEVEL_NORMAL = 0
+LEVEL_REDUCED_SEARCH = 1
+LEVEL_SMALL_CONTEXT = 2
+LEVEL_CAPPED_OUTPUT = 3
+LEVEL_FALLBACK_MODEL = 4
+LEVEL_SHEDDING = 5
+
+LEVEL_NAMES = (
+    'normal', 'reduced_search', 'small_context',
+    'capped_output', 'fallback_model', 'shedding'
+)
+
+
+class OverloadError(Exception):
+    """Raised instead of queueing a request while load is being shed"""
+
+    def __init__(self, eta: float):
+        super().__init__(f"Overloaded, estimated wait {eta:.0f}s")
+        self.eta = eta
+
+
+class Degradation:
+    """How one request should be served at the current load level"""
+
+    __slots__ = ('level', 'model', 'search_pages', 'options')
+
+    def __init__(self, level: int, model: str, search_pages: Optional[int], options: Dict[str, Any]):
+        self.level = level
+        self.model = model
+        # None means SEARCH_PAGES_TO_SCRAPE
+        self.search_pages = search_pages
+        # Extra Ollama options (num_ctx, num_predict)
+        self.options = options
+
+
+class OverloadController:
+    """
+    Chooses a degradation level from the expected wait of a new request.
+
+    Expected wait = (estimated cost of queued jobs + half of the running
+    ones) / parallel slots, multiplied by the slowdown of measured
+    tokens per second against the best rate seen for each model. The
+    slowdown term reacts to a saturated GPU faster than the cost
+    estimates, which are long-term averages.
+
+    The level rises as soon as the wait crosses a threshold and falls only
+    once the wait drops below OVERLOAD_RECOVERY_RATIO of the current
+    level's threshold, so it does not flap around a boundary.
+    """
+
+    # Weight of the newest observation in the throughput ratio
+    ALPHA = 0.5
+    MAX_SLOWDOWN = 4.0
+
+    def __init__(self, config: Config, scheduler: GenerationScheduler):
+        self.config = config
+        self.scheduler = scheduler
+        self.thresholds = sorted(config.OVERLOAD_WAIT_THRESHOLDS)[:LEVEL_SHEDDING]
+        self.level = LEVEL_NORMAL
+        self._peak_rates: Dict[str, float] = {}
+        self._throughput_ratio = 1.0
+        metrics.set('overload_level', self.level)
+
+    async def observe(self, user_id: Optional[int], model: str, stats: Dict[str, Any]):
+        """Usage listener: track tokens per second of finished generations"""
+        eval_count = stats.get('eval_count', 0)
+        eval_duration = stats.get('eval_duration', 0)
+        if not eval_count or not eval_duration:
+            return
+
+        rate = eval_count / (eval_duration / 1e9)
+        peak = max(self._peak_rates.get(model, 0.0), rate)
+        self._peak_rates[model] = peak
+        self._throughput_ratio += self.ALPHA * (rate / peak - self._throughput_ratio)
+
+        metrics.set('generation_tokens_per_second', rate)
+        metrics.set('generation_throughput_ratio', self._throughput_ratio)
+        self.evaluate()
+
+    @property
+    def estimated_wait(self) -> float:
+        """Seconds a new request would wait for a slot"""
+        if not self.scheduler.queue_depth and self.scheduler.running < self.scheduler.max_parallel:
+            return 0.0
+        pending = self.scheduler.queued_cost + self.scheduler.running_cost / 2
+        slowdown = min(self.MAX_SLOWDOWN, 1.0 / max(self._throughput_ratio, 1e-3))
+        return pending / self.scheduler.max_parallel * slowdown
+
+    def _target_level(self, wait: float) -> int:
+        return sum(1 for threshold in self.thresholds if wait >= threshold)
+
+    def evaluate(self) -> int:
+        """Recompute degradation level from the current load"""
+        if not self.config.OVERLOAD_ENABLED:
+            return LEVEL_NORMAL
+
+        wait = self.estimated_wait
+        target = self._target_level(wait)
+        level = self.level
+        if target > level:
+            level = target
+        elif target < level:
+            recovery = self.thresholds[level - 1] * self.config.OVERLOAD_RECOVERY_RATIO
+            if wait < recovery:
+                level = self._target_level(wait / self.config.OVERLOAD_RECOVERY_RATIO)
+
+        metrics.set('overload_estimated_wait_seconds', wait)
+        metrics.set('scheduler_queue_depth', self.scheduler.queue_depth)
+
+        if level != self.level:
+            log = logger.warning if level > self.level else logger.info
+            log(
+                f"🚦 Overload level {LEVEL_NAMES[self.level]} -> {LEVEL_NAMES[level]} "
+                f"(estimated wait {wait:.0f}s, queue {self.scheduler.queue_depth}, "
+                f"throughput {self._throughput_ratio:.0%})"
+            )
+            self.level = level
+            metrics.set('overload_level', level)
+            metrics.inc('overload_level_changes_total')
+        return level
+
+    def plan(self, model: str) -> Degradation:
+        """
+        Decide how to serve a new request.
+
+        Raises:
+            OverloadError: load is being shed; carries the estimated wait
+        """
+        level = self.evaluate()
+        if level >= LEVEL_SHEDDING:
+            metrics.inc('overload_shed_total')
+            raise OverloadError(self.estimated_wait)
+
+        search_pages = None
+        options: Dict[str, Any] = {}
+        if level >= LEVEL_REDUCED_SEARCH:
+            search_pages = min(self.config.OVERLOAD_SEARCH_PAGES, self.config.SEARCH_PAGES_TO_SCRAPE)
+        if level >= LEVEL_SMALL_CONTEXT:
+            options['num_ctx'] = self.config.OVERLOAD_NUM_CTX
+        if level >= LEVEL_CAPPED_OUTPUT:
+            options['num_predict'] = self.config.OVERLOAD_NUM_PREDICT
+        if level >= LEVEL_FALLBACK_MODEL and self.config.FALLBACK_MODEL:
+            model = self.config.FALLBACK_MODEL
+
+        if level:
+            metrics.inc('overload_degraded_requests_total')
+        return Degradation(level, model, search_pages, options)
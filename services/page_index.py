@@ -0,0 +1,143 @@
+"""Local full-text index (SQLite FTS5) of scraped pages."""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+def detect_language(text: str) -> str:
+    """Rough page language: 'ru' if Cyrillic letters dominate, else 'en'"""
+    sample = text[:2000]
+    cyrillic = len(re.findall(r'[а-яё]', sample, re.IGNORECASE))
+    latin = len(re.findall(r'[a-z]', sample, re.IGNORECASE))
+    return 'ru' if cyrillic >= latin else 'en'
+
+
+class PageIndex:
+    """
+    Stores extracted text of every scraped page for local retrieval.
+
+    The index is a separate SQLite file next to the bot database, so
+    writes from scraper threads never contend with the bot's own
+    connection. All access goes through one connection guarded by a lock;
+    methods are blocking and meant to run in an executor.
+    """
+
+    # Pages are pruned to the limit after this many inserts
+    PRUNE_EVERY = 100
+
+    def __init__(self, config: Config, path: Optional[str] = None):
+        self.path = path or f"{os.path.splitext(config.DATABASE_PATH)[0]}.pages.db"
+        self.max_pages = config.PAGE_INDEX_MAX_PAGES
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT UNIQUE NOT NULL,
+                title TEXT NOT NULL,
+                lang TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        # Raises sqlite3.OperationalError if SQLite is built without FTS5
+        self._connection.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+                title, body, tokenize='unicode61 remove_diacritics 2'
+            )
+        """)
+        self._connection.commit()
+        logger.info(f"📚 Page index: {self.path} ({self.size} pages)")
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def add(self, url: str, title: str, text: str):
+        """Store or replace extracted text of a page"""
+        if not text:
+            return
+        with self._lock:
+            self._connection.execute(
+                """
+                INSERT INTO pages (url, title, lang, fetched_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (url) DO UPDATE SET
+                    title = excluded.title,
+                    lang = excluded.lang,
+                    fetched_at = excluded.fetched_at
+                """,
+                (url, title, detect_language(text), time.time())
+            )
+            page_id = self._connection.execute(
+                "SELECT id FROM pages WHERE url = ?", (url,)
+            ).fetchone()[0]
+            self._connection.execute("DELETE FROM pages_fts WHERE rowid = ?", (page_id,))
+            self._connection.execute(
+                "INSERT INTO pages_fts (rowid, title, body) VALUES (?, ?, ?)",
+                (page_id, title, text)
+            )
+            self._inserts += 1
+            if self._inserts % self.PRUNE_EVERY == 0:
+                self._prune()
+            self._connection.commit()
+
+    def _prune(self):
+        """Delete oldest pages above max_pages (lock held)"""
+        rows = self._connection.execute(
+            "SELECT id FROM pages ORDER BY fetched_at DESC LIMIT -1 OFFSET ?",
+            (self.max_pages,)
+        ).fetchall()
+        if not rows:
+            return
+        ids = [(row[0],) for row in rows]
+        self._connection.executemany("DELETE FROM pages WHERE id = ?", ids)
+        self._connection.executemany("DELETE FROM pages_fts WHERE rowid = ?", ids)
+        logger.info(f"🧹 Pruned {len(ids)} page(s) from page index")
+
+    @staticmethod
+    def _match_expression(terms: Iterable[str]) -> str:
+        """FTS5 query matching any of the (stemmed) terms as a word prefix"""
+        parts = [f'"{term}"*' for term in sorted({t.replace('"', '') for t in terms}) if term]
+        return ' OR '.join(parts)
+
+    def search(self, terms: Iterable[str], limit: int, max_age: float) -> List[Dict[str, Any]]:
+        """
+        Find pages fetched within max_age seconds, best BM25 match first.
+
+        Args:
+            terms: Stemmed query words, matched as prefixes
+
+        Returns:
+            List of dicts with url, title, body, lang, fetched_at
+        """
+        expression = self._match_expression(terms)
+        if not expression:
+            return []
+        with self._lock:
+            rows = self._connection.execute(
+                """
+                SELECT p.url, p.title, p.lang, p.fetched_at, f.body
+                FROM pages_fts AS f JOIN pages AS p ON p.id = f.rowid
+                WHERE pages_fts MATCH ? AND p.fetched_at >= ?
+                ORDER BY bm25(pages_fts)
+                LIMIT ?
+                """,
+                (expression, time.time() - max_age, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,108 @@
+"""
+Prompt templates with a stable, cacheable prefix, versioned per model.
+
+Models use DEFAULT_TEMPLATE unless a template is registered for their
+name prefix, in code with register_template() or from the JSON file in
+PROMPT_TEMPLATES_FILE (load_templates()). No built-in overrides ship:
+wording is tuned per deployment. The version is logged with every
+search request, so a wording change can be told apart in the logs and
+benchmarks.
+"""
+
+import json
+import logging
+from dataclasses import dataclass
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """
+    Prompt layout for one model family.
+    
+    Ollama reuses the KV cache of a prompt prefix it has already
+    evaluated, so everything that is the same for every request goes into
+    the fixed `system` text and volatile parts (question, search results,
+    current date) go into the prompt, with the most volatile at the end.
+    """
+
+    version: str
+    search_system: str
+    search_prompt: str
+
+    def build_search_prompt(self, user_input: str, search_context: str) -> str:
+        return self.search_prompt.format(user_input=user_input, search_context=search_context)
+
+
+DEFAULT_TEMPLATE = PromptTemplate(
+    version='default-v2',
+    search_system=(
+        "Ты — универсальный и всезнающий ассистент, обладающий полной и точной "
+        "информацией во всех областях знаний. Используй результаты веб-поиска из "
+        "запроса как дополнительный источник, чтобы ответить на вопрос пользователя.\n\n"
+        "Дай ясный, точный и максимально информативный ответ, включая даты, числа "
+        "и факты. Не добавляй неподтверждённые сведения и не рассуждай предположительно. "
+        "Используй текущую дату, указанную в конце запроса, для формирования "
+        "актуального ответа."
+    ),
+    search_prompt="Вопрос: {user_input}\n\n{search_context}",
+)
+
+# Overrides by model name prefix, e.g. {'qwen3': PromptTemplate(...)}
+TEMPLATES: Dict[str, PromptTemplate] = {}
+
+
+def register_template(model_prefix: str, template: PromptTemplate):
+    """Use template for models whose name starts with model_prefix"""
+    TEMPLATES[model_prefix] = template
+
+
+def load_templates(path: str) -> int:
+    """
+    Register templates from a JSON file.
+
+    The file maps model name prefixes to a version and the fields that
+    differ from DEFAULT_TEMPLATE:
+        {"qwen3": {"version": "qwen3-v1", "search_system": "..."}}
+
+    Returns:
+        Number of templates registered
+
+    Raises:
+        ValueError: entry without a version or with an invalid search_prompt
+    """
+    with open(path, encoding='utf-8') as file:
+        entries = json.load(file)
+    if not isinstance(entries, dict):
+        raise ValueError("Prompt templates file must contain an object")
+
+    # Validate everything first: a broken file registers nothing
+    templates = {}
+    for prefix, fields in entries.items():
+        if not isinstance(fields, dict) or not fields.get('version'):
+            raise ValueError(f"Template for '{prefix}' has no version")
+        template = PromptTemplate(
+            version=fields['version'],
+            search_system=fields.get('search_system', DEFAULT_TEMPLATE.search_system),
+            search_prompt=fields.get('search_prompt', DEFAULT_TEMPLATE.search_prompt),
+        )
+        try:
+            template.build_search_prompt('', '')
+        except (KeyError, IndexError) as e:
+            raise ValueError(f"Template for '{prefix}': unknown placeholder {e} in search_prompt")
+        templates[prefix] = template
+
+    for prefix, template in templates.items():
+        register_template(prefix, template)
+        logger.info(f"📝 Prompt template {template.version} for models '{prefix}*'")
+    return len(templates)
+
+
+def get_template(model: str) -> PromptTemplate:
+    """Get template for model (longest matching prefix wins)"""
+    matches = [prefix for prefix in TEMPLATES if model.startswith(prefix)]
+    if not matches:
+        return DEFAULT_TEMPLATE
+    return TEMPLATES[max(matches, key=len)]
@@ -0,0 +1,193 @@
+"""Per-user rate limits (token buckets) and daily quotas."""
+
+import logging
+import time
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+from database.db_manager import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+TIER_DEFAULT = 'default'
+TIER_PREMIUM = 'premium'
+TIER_ADMIN = 'admin'
+
+
+def get_user_tier(config: Config, user_id: int) -> str:
+    """Resolve user tier from configured ID lists"""
+    if user_id in config.ADMIN_USER_IDS:
+        return TIER_ADMIN
+    if user_id in config.PREMIUM_USER_IDS:
+        return TIER_PREMIUM
+    return TIER_DEFAULT
+
+
+class TokenBucket:
+    """Classic token bucket: `capacity` burst, refilled at `rate` tokens per second"""
+
+    __slots__ = ('capacity', 'rate', 'tokens', 'updated')
+
+    def __init__(self, capacity: float, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+
+    def consume(self, now: float, amount: float = 1.0) -> float:
+        """
+        Try to take tokens from the bucket.
+        
+        Returns:
+            0 if allowed, otherwise seconds until enough tokens are available
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def is_full(self, now: float) -> bool:
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class RateLimiter:
+    """In-memory token buckets per (user, action type)"""
+
+    # Buckets are pruned once there are more than this many
+    MAX_BUCKETS = 10000
+
+    def __init__(self, config: Config):
+        self.config = config
+        self._per_minute = {
+            'text': config.RATE_LIMIT_TEXT_PER_MIN,
+            'search': config.RATE_LIMIT_SEARCH_PER_MIN,
+            'photo': config.RATE_LIMIT_PHOTO_PER_MIN,
+            'document': config.RATE_LIMIT_DOCUMENT_PER_MIN,
+        }
+        self._buckets: Dict[Tuple[int, str], TokenBucket] = {}
+
+    def _limit(self, action: str, tier: str) -> float:
+        limit = self._per_minute.get(action, 0)
+        if tier == TIER_PREMIUM:
+            limit *= self.config.PREMIUM_LIMIT_MULTIPLIER
+        return limit
+
+    def check(self, user_id: int, action: str) -> float:
+        """
+        Consume one request of the given action type.
+        
+        Returns:
+            0 if allowed, otherwise seconds until retry
+        """
+        tier = get_user_tier(self.config, user_id)
+        limit = self._limit(action, tier)
+        if tier == TIER_ADMIN or limit <= 0:
+            return 0.0
+
+        now = time.monotonic()
+        key = (user_id, action)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.MAX_BUCKETS:
+                self._prune(now)
+            bucket = self._buckets[key] = TokenBucket(limit, limit / 60, now)
+        return bucket.consume(now)
+
+    def _prune(self, now: float):
+        """Drop buckets that refilled completely (equivalent to a fresh bucket)"""
+        for key in [k for k, b in self._buckets.items() if b.is_full(now)]:
+            del self._buckets[key]
+
+    @property
+    def size(self) -> int:
+        return len(self._buckets)
+
+
+class QuotaManager:
+    """
+    Daily token and GPU-time quotas.
+    
+    Today's usage is kept in memory so checks never touch the database.
+    Recorded generations are summed per (user, day) until flush() adds
+    them to the daily_usage table (periodically and on shutdown); the
+    table is read back on startup.
+    """
+
+    def __init__(self, db: DatabaseManager, config: Config):
+        self.db = db
+        self.config = config
+        self._day = date.today().isoformat()
+        self._usage: Dict[int, Dict[str, float]] = {}
+        # (user_id, day) -> [tokens, gpu_seconds, requests] not yet written
+        self._pending: Dict[Tuple[int, str], List[float]] = {}
+
+    async def load(self):
+        """Load today's usage from database"""
+        self._day = date.today().isoformat()
+        self._usage = await self.db.get_daily_usage(self._day)
+        logger.info(f"📊 Loaded today's usage for {len(self._usage)} user(s)")
+
+    def _rollover(self):
+        today = date.today().isoformat()
+        if today != self._day:
+            self._day = today
+            self._usage = {}
+
+    def _limits(self, user_id: int) -> Tuple[float, float]:
+        tier = get_user_tier(self.config, user_id)
+        tokens = self.config.DAILY_TOKEN_QUOTA
+        gpu_seconds = self.config.DAILY_GPU_SECONDS_QUOTA
+        if tier == TIER_ADMIN:
+            return 0, 0
+        if tier == TIER_PREMIUM:
+            tokens *= self.config.PREMIUM_LIMIT_MULTIPLIER
+            gpu_seconds *= self.config.PREMIUM_LIMIT_MULTIPLIER
+        return tokens, gpu_seconds
+
+    def is_exceeded(self, user_id: int) -> bool:
+        """Check if user has used up today's quota (0 limit means unlimited)"""
+        self._rollover()
+        usage = self._usage.get(user_id)
+        if not usage:
+            return False
+        token_limit, gpu_limit = self._limits(user_id)
+        return (
+            (token_limit > 0 and usage['tokens'] >= token_limit) or
+            (gpu_limit > 0 and usage['gpu_seconds'] >= gpu_limit)
+        )
+
+    async def record_usage(self, user_id: Optional[int], model: str, stats: Dict[str, Any]):
+        """Add generation stats to user's daily usage (usage listener)"""
+        if user_id is None:
+            return
+        self._rollover()
+        tokens = stats.get('prompt_eval_count', 0) + stats.get('eval_count', 0)
+        gpu_seconds = stats.get('total_duration', 0) / 1e9
+
+        usage = self._usage.setdefault(user_id, {'tokens': 0, 'gpu_seconds': 0.0})
+        usage['tokens'] += tokens
+        usage['gpu_seconds'] += gpu_seconds
+
+        pending = self._pending.setdefault((user_id, self._day), [0, 0.0, 0])
+        pending[0] += tokens
+        pending[1] += gpu_seconds
+        pending[2] += 1
+
+    async def flush(self):
+        """Add usage recorded since the last flush to the database"""
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            await self.db.add_daily_usage([key + tuple(values) for key, values in pending.items()])
+        except Exception:
+            # Keep the totals, including anything recorded while writing
+            for key, values in pending.items():
+                merged = self._pending.setdefault(key, [0, 0.0, 0])
+                for i, value in enumerate(values):
+                    merged[i] += value
+            raise
+        logger.debug(f"Flushed daily usage of {len(pending)} user(s)")
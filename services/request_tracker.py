@@ -0,0 +1,94 @@
+"""Per-user tracking and cancellation of in-flight generations."""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class RequestRejectedError(Exception):
+    """Raised when a user already has a request in flight and the policy is 'reject'."""
+
+
+class RequestCancelledError(Exception):
+    """Raised when a tracked request was stopped by the user or superseded."""
+
+
+class RequestTracker:
+    """
+    Keeps track of the generation currently running for every user.
+
+    Policies for a new request while another one is still running:
+    - supersede: cancel the running request and start the new one
+    - queue: wait until the running request finishes
+    - reject: refuse the new request
+    """
+
+    POLICIES = ('supersede', 'queue', 'reject')
+
+    def __init__(self, policy: str = 'supersede'):
+        if policy not in self.POLICIES:
+            logger.warning(f"Unknown in-flight policy '{policy}', using 'supersede'")
+            policy = 'supersede'
+        self.policy = policy
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+
+    def is_busy(self, user_id: int) -> bool:
+        """Check if user has a running request"""
+        task = self._tasks.get(user_id)
+        return task is not None and not task.done()
+
+    @property
+    def active_count(self) -> int:
+        """Number of requests currently running for all users"""
+        return sum(1 for task in self._tasks.values() if not task.done())
+
+    def cancel(self, user_id: int) -> bool:
+        """
+        Cancel running request of the user.
+
+        Returns:
+            True if there was something to cancel
+        """
+        task = self._tasks.get(user_id)
+        if task is None or task.done():
+            return False
+        logger.info(f"⏹ Cancelling in-flight request of user {user_id}")
+        task.cancel()
+        return True
+
+    async def run(self, user_id: int, coro: Awaitable[Any]) -> Any:
+        """
+        Run coroutine as the tracked request of the user.
+
+        Raises:
+            RequestRejectedError: user is busy and policy is 'reject'
+            RequestCancelledError: request was cancelled via cancel()
+        """
+        if self.is_busy(user_id):
+            if self.policy == 'reject':
+                coro.close()
+                raise RequestRejectedError()
+            if self.policy == 'supersede':
+                self.cancel(user_id)
+
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            task = asyncio.ensure_future(coro)
+            self._tasks[user_id] = task
+            try:
+                # asyncio.wait() does not raise when the inner task is cancelled,
+                # which lets us tell cancel() apart from cancellation of the caller
+                await asyncio.wait({task})
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+            finally:
+                if self._tasks.get(user_id) is task:
+                    del self._tasks[user_id]
+
+            if task.cancelled():
+                raise RequestCancelledError()
+            return task.result()
@@ -0,0 +1,102 @@
+"""Priority scheduling of generation requests over limited model slots."""
+
+import asyncio
+import heapq
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Priorities are penalties in seconds added to the estimated job cost;
+# lower score runs first
+PRIORITY_INTERACTIVE = 0
+# Chunks of uploaded documents: a user is waiting, but one upload is many jobs
+PRIORITY_DOCUMENT = 15
+PRIORITY_BACKGROUND = 60
+
+
+class GenerationScheduler:
+    """
+    Limits concurrent Ollama generations to `max_parallel` slots.
+    
+    Requests that cannot get a slot wait in a queue ordered by score:
+    
+        priority + estimated cost - aging_rate * seconds waited
+    
+    so short jobs go first (shortest job first), background jobs (e.g.
+    history compaction) yield to interactive ones, and every waiting job
+    eventually reaches the head of the queue. Aging is the same for all
+    waiting jobs, so the score can be stored as a static heap key:
+    priority + cost + aging_rate * enqueue time.
+    """
+
+    def __init__(self, max_parallel: int, aging_rate: float = 1.0):
+        self.max_parallel = max(1, max_parallel)
+        self.aging_rate = max(0.0, aging_rate)
+        self._running = 0
+        self._running_cost = 0.0
+        self._queue: List[Tuple[float, int, asyncio.Future, float]] = []
+        self._counter = itertools.count()
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, future, _ in self._queue if not future.done())
+
+    @property
+    def queued_cost(self) -> float:
+        """Sum of estimated seconds of all waiting jobs"""
+        return sum(cost for _, _, future, cost in self._queue if not future.done())
+
+    @property
+    def running_cost(self) -> float:
+        """Sum of estimated seconds of all running jobs"""
+        return self._running_cost
+
+    async def _acquire(self, priority: int, cost: float):
+        if self._running < self.max_parallel and not self.queue_depth:
+            self._running += 1
+            return
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        score = priority + cost + self.aging_rate * loop.time()
+        heapq.heappush(self._queue, (score, next(self._counter), future, cost))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Slot may have been granted right before cancellation
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    def _release(self):
+        self._running -= 1
+        while self._queue:
+            _, _, future, _ = heapq.heappop(self._queue)
+            if not future.done():
+                self._running += 1
+                future.set_result(None)
+                break
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_INTERACTIVE, cost: float = 0.0):
+        """
+        Hold one generation slot for the duration of the block.
+        
+        Args:
+            priority: PRIORITY_* penalty
+            cost: estimated duration of the job in seconds
+        """
+        await self._acquire(priority, cost)
+        self._running_cost += cost
+        try:
+            yield
+        finally:
+            self._running_cost -= cost
+            self._release()
@@ -1,21 +1,28 @@
 """Search service using DuckDuckGo (optimized for speed)."""
 
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Optional, Tuple
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future, ThreadPoolExecutor
 import urllib.parse
 import random
 import re
+import time
 
 try:
     import requests
-    from bs4 import BeautifulSoup
+    from utils.html_extract import extract_page_text, iter_ddg_results, parse_ddg_results
     REQUESTS_AVAILABLE = True
 except ImportError:
     REQUESTS_AVAILABLE = False
 
 from config import Config
+from services.cpu_pool import CpuPool
+from services.domain_health import DomainHealth
+from services.page_index import PageIndex
+from utils.dedup import NearDuplicateIndex
+from utils.helpers import estimate_tokens, stem_word
+from utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -23,8 +30,33 @@ logger = logging.getLogger(__name__)
 class SearchService:
     """Service for web search and content scraping using DuckDuckGo."""
 
-    def __init__(self, config: Config):
-        """Initialize search service."""
+    # Characters of page text extracted before passage ranking
+    PAGE_TEXT_CHARS = 6000
+    # Characters of ranked passages kept per page for the LLM
+    PAGE_CONTEXT_CHARS = 1500
+    # Approximate passage length used for ranking
+    PASSAGE_CHARS = 300
+    # Passage is "good" evidence if it covers this share of query terms
+    GOOD_PASSAGE_SCORE = 0.5
+    # BeautifulSoup tree builder for result pages and scraped pages
+    HTML_PARSER = 'html.parser'
+
+    def __init__(
+        self,
+        config: Config,
+        domain_health: Optional[DomainHealth] = None,
+        page_index: Optional[PageIndex] = None,
+        http: Any = None,
+        cpu_pool: Optional[CpuPool] = None
+    ):
+        """
+        Initialize search service.
+        
+        Args:
+            http: Client with requests-compatible get() and post()
+                (requests module by default; benchmarks pass a replay client)
+            cpu_pool: Worker processes for HTML parsing (in-thread without it)
+        """
         if not REQUESTS_AVAILABLE:
             raise ImportError(
                 "Required libraries not available. "
@@ -35,6 +67,21 @@ class SearchService:
         self.max_results = config.SEARCH_MAX_RESULTS
         self.region = config.SEARCH_REGION
         self.pages_to_scrape = config.SEARCH_PAGES_TO_SCRAPE
+        self.min_passages = config.SEARCH_MIN_PASSAGES
+        self.scrape_deadline = config.SEARCH_SCRAPE_DEADLINE
+        self.dedup_threshold = config.SEARCH_DEDUP_THRESHOLD
+        self.page_index = page_index
+        self.http = http or requests
+        self.html_parser = self.HTML_PARSER
+        self.cpu_pool = cpu_pool
+        self.page_index_max_age = config.PAGE_INDEX_MAX_AGE
+        self.domain_health = domain_health or DomainHealth(
+            config.SCRAPE_CIRCUIT_FAILURES,
+            config.SCRAPE_CIRCUIT_COOLDOWN,
+            self.PAGE_CONTEXT_CHARS
+        )
+        # Blocking results page and page index calls of all searches; every
+        # search scrapes in its own pool so users never queue behind each other
         self._executor = ThreadPoolExecutor(max_workers=5)
         
         self.user_agents = [
@@ -52,16 +99,21 @@ class SearchService:
         """Get random user agent."""
         return random.choice(self.user_agents)
 
-    def _scrape_page_content(self, url: str) -> str:
+    def _scrape_page_content(self, url: str, title: str = '') -> str:
         """
         Scrape text content from a web page (optimized).
         
+        Extracted text is also stored in the local page index.
+        
         Args:
             url: URL to scrape
+            title: Result title stored with the page
             
         Returns:
             Extracted text
         """
+        started = time.perf_counter()
+        text = ""
         try:
             logger.debug(f"   📄 Scraping: {url[:80]}...")
             
@@ -71,48 +123,61 @@ class SearchService:
                 'Accept-Language': 'ru,en;q=0.9',
             }
             
-            # Shorter timeout for faster response
-            response = requests.get(url, headers=headers, timeout=5, allow_redirects=True)
+            # Timeout follows the domain's measured p95 (at most 5 s)
+            response = self.http.get(
+                url,
+                headers=headers,
+                timeout=self.domain_health.timeout_for(url),
+                allow_redirects=True
+            )
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Remove unwanted elements
-            for element in soup(['script', 'style', 'nav', 'footer', 'header', 'aside', 'iframe']):
-                element.decompose()
-            
-            # Find main content
-            main_content = None
-            for selector in ['article', 'main', '[role="main"]', '.content', '.post-content', '#content']:
-                main_content = soup.select_one(selector)
-                if main_content:
-                    break
-            
-            if not main_content:
-                main_content = soup.body if soup.body else soup
-            
-            # Extract text
-            text = main_content.get_text(separator=' ', strip=True)
-            text = re.sub(r'\s+', ' ', text).strip()
-            
-            # Reduced limit for faster processing
-            max_length = 1500
-            if len(text) > max_length:
-                text = text[:max_length] + "..."
+            text = self._extract_text(response.content)
             
             logger.debug(f"      ✅ Scraped {len(text)} chars")
+            
+            if self.page_index is not None:
+                try:
+                    self.page_index.add(url, title, text)
+                except Exception as e:
+                    logger.warning(f"      ⚠️ Page index write failed: {e}")
             return text
             
         except Exception as e:
             logger.warning(f"      ⚠️ Failed to scrape {url[:40]}: {str(e)[:50]}")
             return ""
+        finally:
+            self.domain_health.record(url, time.perf_counter() - started, len(text))
+
+    def _parse(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run a parser from utils.html_extract, in the CPU pool if there is one"""
+        if self.cpu_pool is not None:
+            return self.cpu_pool.run(fn, *args)
+        return fn(*args)
 
-    def _search_duckduckgo(self, query: str) -> List[Dict[str, Any]]:
+    def _extract_text(self, content: bytes) -> str:
+        """
+        Extract main text of an HTML page.
+        
+        Returns:
+            Whitespace-normalized text, at most PAGE_TEXT_CHARS
+        """
+        # Passages are ranked and trimmed to PAGE_CONTEXT_CHARS later
+        return self._parse(extract_page_text, content, self.html_parser, self.PAGE_TEXT_CHARS)
+
+    def _search_duckduckgo(
+        self,
+        query: str,
+        on_result: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> List[Dict[str, Any]]:
         """
         Search using DuckDuckGo HTML interface.
         
         Args:
             query: Search query
+            on_result: Called with every result, in page order, as soon as it
+                is parsed (with the CPU pool: once the whole page is parsed,
+                as only finished results come back from the worker)
             
         Returns:
             List of search results
@@ -131,7 +196,7 @@ class SearchService:
                 'Accept-Language': 'ru,en;q=0.9',
             }
             
-            response = requests.post(
+            response = self.http.post(
                 'https://html.duckduckgo.com/html/',
                 data=params,
                 headers=headers,
@@ -139,47 +204,20 @@ class SearchService:
             )
             response.raise_for_status()
             
-            logger.info(f"✅ Response: {response.status_code}, {len(response.text)} bytes")
-            
-            # Parse results
-            soup = BeautifulSoup(response.text, 'html.parser')
-            results = []
+            logger.info(f"✅ Response: {response.status_code}, {len(response.content)} bytes")
             
-            result_divs = soup.find_all('div', class_='result')
-            logger.info(f"   Found {len(result_divs)} result divs")
+            args = (response.content, self.html_parser, self.max_results, response.encoding)
+            if self.cpu_pool is not None and self.cpu_pool.enabled:
+                parsed = self.cpu_pool.run(parse_ddg_results, *args)
+            else:
+                parsed = iter_ddg_results(*args)
             
-            for idx, result_div in enumerate(result_divs, 1):
-                try:
-                    link_elem = result_div.find('a', class_='result__a')
-                    if not link_elem:
-                        continue
-                    
-                    url = link_elem.get('href', '')
-                    if not url or not url.startswith('http'):
-                        continue
-                    
-                    title = link_elem.get_text(strip=True)
-                    if not title:
-                        title = f"Result {idx}"
-                    
-                    snippet_elem = result_div.find('a', class_='result__snippet')
-                    snippet = snippet_elem.get_text(strip=True) if snippet_elem else ""
-                    
-                    results.append({
-                        'number': len(results) + 1,
-                        'title': title[:200],
-                        'link': url,
-                        'body': snippet
-                    })
-                    
-                    logger.debug(f"   ✅ [{len(results)}] {title[:50]}...")
-                    
-                    if len(results) >= self.max_results:
-                        break
-                        
-                except Exception as e:
-                    logger.debug(f"   ⚠️ Error parsing result {idx}: {e}")
-                    continue
+            results = []
+            for result in parsed:
+                results.append(result)
+                if on_result is not None:
+                    on_result(result)
+            logger.info(f"   Parsed {len(results)} results")
             
             return results
             
@@ -187,73 +225,281 @@ class SearchService:
             logger.error(f"❌ DuckDuckGo search error: {e}")
             return []
 
-    def _perform_search_sync(self, query: str) -> List[Dict[str, Any]]:
+    def _search_and_dispatch(
+        self, query: str, pages: int, scraper: ThreadPoolExecutor
+    ) -> Tuple[List[Dict[str, Any]], Dict[int, Future]]:
         """
-        Synchronous search with optimized content scraping.
+        Search and scrape up to `pages` results, chosen by domain health.
+        
+        Results from domains with an open circuit are skipped, so the next
+        result takes their place. Healthy and unknown domains are scraped
+        the moment they are parsed (with the CPU pool, once the results
+        page is parsed); degraded ones wait for the whole results page and
+        fill the remaining slots best score first.
         
         Args:
-            query: Search query
-            
+            scraper: Executor of this search that runs the scrapes
+        
+        Returns:
+            Tuple of (results, scrape futures by result index)
+        """
+        jobs: Dict[int, Future] = {}
+        deferred: List[int] = []
+        health = self.domain_health
+        
+        def submit(idx: int, url: str):
+            jobs[idx] = scraper.submit(
+                self._scrape_page_content, url, results_by_idx[idx]['title']
+            )
+        
+        results_by_idx: Dict[int, Dict[str, Any]] = {}
+        
+        def dispatch(result: Dict[str, Any]):
+            idx = result['number'] - 1
+            results_by_idx[idx] = result
+            url = result['link']
+            if len(jobs) >= pages or health.is_open(url):
+                return
+            if health.is_degraded(url):
+                deferred.append(idx)
+            elif health.acquire(url):
+                submit(idx, url)
+        
+        results = self._search_duckduckgo(query, on_result=dispatch)
+        
+        deferred.sort(key=lambda idx: health.score(results[idx]['link']), reverse=True)
+        for idx in deferred:
+            if len(jobs) >= pages:
+                break
+            # A half-open domain gets one trial scrape, not one per result
+            if health.acquire(results[idx]['link']):
+                submit(idx, results[idx]['link'])
+        
+        skipped = sum(1 for r in results if health.is_open(r['link']))
+        if skipped:
+            logger.info(f"🚫 Skipped {skipped} result(s) from domains with open circuit")
+        return results, jobs
+
+    @staticmethod
+    def _query_terms(query: str) -> set:
+        """Get stemmed query words used for passage ranking"""
+        return {stem_word(w) for w in re.findall(r'\w+', query.lower()) if len(w) > 2}
+
+    def _score_passage(self, passage: str, terms: set) -> float:
+        """Share of query terms present in passage"""
+        if not terms:
+            return 0.0
+        words = {stem_word(w) for w in re.findall(r'\w+', passage.lower())}
+        return len(terms & words) / len(terms)
+
+    def _rank_passages(self, text: str, terms: set) -> Tuple[List[str], float]:
+        """
+        Keep the most relevant passages of page text.
+        
         Returns:
-            List of results with scraped content
+            Tuple of (selected passages in page order, best passage score)
+        """
+        sentences = re.split(r'(?<=[.!?])\s+', text)
+        passages, current = [], ''
+        for sentence in sentences:
+            if current and len(current) + len(sentence) > self.PASSAGE_CHARS:
+                passages.append(current)
+                current = ''
+            current = f"{current} {sentence}".strip()
+        if current:
+            passages.append(current)
+        
+        scored = sorted(
+            ((self._score_passage(p, terms), idx) for idx, p in enumerate(passages)),
+            reverse=True
+        )
+        selected, length = [], 0
+        for score, idx in scored:
+            if length + len(passages[idx]) > self.PAGE_CONTEXT_CHARS and selected:
+                break
+            selected.append(idx)
+            length += len(passages[idx])
+        
+        return [passages[idx] for idx in sorted(selected)], (scored[0][0] if scored else 0.0)
+
+    async def _collect_scrapes(
+        self,
+        query: str,
+        results: List[Dict[str, Any]],
+        jobs: Dict[int, Future],
+        deadline: float
+    ) -> int:
         """
+        Merge scraped pages into results as they arrive.
+        
+        Stops as soon as min_passages pages with good evidence are in, or
+        at the deadline; scrapes still pending are cancelled.
+        
+        Returns:
+            Number of scrapes that finished
+        """
+        loop = asyncio.get_running_loop()
+        terms = self._query_terms(query)
+        futures = {asyncio.wrap_future(job): idx for idx, job in jobs.items()}
+        pending = set(futures)
+        good = 0
+        
         try:
-            # Perform search
-            results = self._search_duckduckgo(query)
-            
-            logger.info(f"✅ Found {len(results)} search results")
-            
-            # Scrape content from top N pages (in parallel for speed)
-            if results and self.pages_to_scrape > 0:
-                pages_to_scrape = min(len(results), self.pages_to_scrape)
-                logger.info(f"🌐 Scraping top {pages_to_scrape} pages (parallel)...")
-                
-                # Use ThreadPoolExecutor for parallel scraping
-                urls_to_scrape = [r['link'] for r in results[:pages_to_scrape]]
-                
-                with ThreadPoolExecutor(max_workers=pages_to_scrape) as executor:
-                    scraped_contents = list(executor.map(self._scrape_page_content, urls_to_scrape))
-                
-                # Update results with scraped content
-                for idx, content in enumerate(scraped_contents):
-                    if content:
-                        results[idx]['body'] = content
-                
-                logger.info(f"✅ Scraped {pages_to_scrape} pages")
-            
-            return results
-            
+            while pending and good < self.min_passages:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    logger.info("⏰ Scrape deadline reached")
+                    break
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for future in done:
+                    content = future.result()
+                    if not content:
+                        continue
+                    result = results[futures[future]]
+                    result['passages'], result['score'] = self._rank_passages(content, terms)
+                    result['body'] = ' '.join(result['passages'])[:self.PAGE_CONTEXT_CHARS]
+                    if result['score'] >= self.GOOD_PASSAGE_SCORE:
+                        good += 1
+        finally:
+            for future in pending:
+                future.cancel()
+        
+        logger.info(
+            f"✅ Scraped {len(jobs) - len(pending)}/{len(jobs)} pages, "
+            f"{good} with good evidence"
+        )
+        return len(jobs) - len(pending)
+
+    @staticmethod
+    def _renumber(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        for number, result in enumerate(results, 1):
+            result['number'] = number
+        return results
+
+    async def _search_local(self, terms: set, limit: int) -> List[Dict[str, Any]]:
+        """Find fresh pages in the local index, ranked like scraped pages"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            pages = await loop.run_in_executor(
+                self._executor,
+                self.page_index.search,
+                terms,
+                limit,
+                self.page_index_max_age
+            )
         except Exception as e:
-            logger.error(f"❌ Search error: {e}")
+            logger.warning(f"⚠️ Page index search failed: {e}")
             return []
+        
+        results = []
+        for page in pages:
+            passages, score = self._rank_passages(page['body'], terms)
+            results.append({
+                'number': len(results) + 1,
+                'title': page['title'] or page['url'],
+                'link': page['url'],
+                'body': ' '.join(passages)[:self.PAGE_CONTEXT_CHARS],
+                'passages': passages,
+                'score': score,
+                'local': True
+            })
+        logger.info(
+            f"📚 Page index: {len(results)} hit(s) in {(loop.time() - started) * 1000:.1f} ms"
+        )
+        return results
 
-    async def search(self, query: str) -> List[Dict[str, Any]]:
+    async def search(
+        self,
+        query: str,
+        pages: Optional[int] = None,
+        details: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
         """
-        Async search with content scraping.
+        Async search with pipelined content scraping.
+        
+        The local page index is queried first: if it has SEARCH_MIN_PASSAGES
+        fresh pages with good evidence, they are returned without touching
+        the network. Otherwise good local pages are merged into the web
+        results, or used alone when the web search fails.
+        
+        Each top result is scraped the moment it is parsed from the results
+        page. Search returns once SEARCH_MIN_PASSAGES pages with relevant
+        passages are in or SEARCH_SCRAPE_DEADLINE seconds have passed, so
+        one slow site no longer delays the answer. Cancelling the calling
+        task drops all scrapes that have not started yet.
         
         Args:
             query: Search query
+            pages: Pages to scrape (default SEARCH_PAGES_TO_SCRAPE)
+            details: filled with 'pages_fetched' (scrapes that finished)
             
         Returns:
-            List of results with content
+            List of results with content and relevance score
         """
         logger.info(f"🚀 Async search starting: '{query}'")
         
-        loop = asyncio.get_event_loop()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.scrape_deadline
+        pages = self.pages_to_scrape if pages is None else pages
+        terms = self._query_terms(query)
+        if details is not None:
+            details['pages_fetched'] = 0
+        
+        local_results = []
+        if self.page_index is not None:
+            local_results = await self._search_local(terms, max(pages, self.min_passages) * 2)
+            good_local = [r for r in local_results if r['score'] >= self.GOOD_PASSAGE_SCORE]
+            if len(good_local) >= self.min_passages:
+                logger.info(f"✅ Answering from page index: {len(good_local)} results")
+                return self._renumber(good_local)
         
+        scraper = ThreadPoolExecutor(max_workers=max(1, pages))
         try:
-            results = await loop.run_in_executor(
+            results, jobs = await loop.run_in_executor(
                 self._executor,
-                self._perform_search_sync,
-                query
+                self._search_and_dispatch,
+                query,
+                pages,
+                scraper
             )
             
-            logger.info(f"✅ Search complete: {len(results)} results")
-            return results
+            logger.info(f"✅ Found {len(results)} search results")
+            
+            for result in results:
+                result['score'] = self._score_passage(result['body'], terms)
             
+            if jobs:
+                logger.info(f"🌐 Scraping {len(jobs)} pages (pipelined)...")
+                fetched = await self._collect_scrapes(query, results, jobs, deadline)
+                if details is not None:
+                    details['pages_fetched'] = fetched
+            
+        except asyncio.CancelledError:
+            logger.info(f"⏹ Search cancelled: '{query}'")
+            raise
         except Exception as e:
             logger.error(f"❌ Async search error: {e}")
-            return []
+            results = []
+        finally:
+            # Scrapes still running finish in the background, queued ones are dropped
+            scraper.shutdown(wait=False, cancel_futures=True)
+        
+        if not results and local_results:
+            logger.info("📚 Web search gave nothing, using page index results")
+            results = local_results
+        elif local_results:
+            links = {r['link'] for r in results}
+            results += [
+                r for r in local_results
+                if r['score'] >= self.GOOD_PASSAGE_SCORE and r['link'] not in links
+            ]
+        results = self._renumber(results)
+        
+        logger.info(f"✅ Search complete: {len(results)} results")
+        return results
 
     def format_search_results(self, results: List[Dict[str, Any]]) -> str:
         """Format results for display."""
@@ -267,8 +513,56 @@ class SearchService:
         
         return formatted
 
+    def _dedup_passages(self, ranked: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+        """
+        Drop passages that repeat a passage of a more relevant source.
+        
+        Args:
+            ranked: Results, most relevant first
+            
+        Returns:
+            Per result number: 'body' without repeated passages, 'repeats'
+            (sources whose text it repeated) and 'also_in' (sources that
+            repeated its text)
+        """
+        index: NearDuplicateIndex[int] = NearDuplicateIndex(self.dedup_threshold)
+        entries = {r['number']: {'body': '', 'repeats': set(), 'also_in': set()} for r in ranked}
+        tokens_before = tokens_after = dropped = 0
+        
+        for result in ranked:
+            number = result['number']
+            passages = result.get('passages') or ([result['body']] if result.get('body') else [])
+            kept = []
+            for passage in passages:
+                tokens_before += estimate_tokens(passage)
+                owner = index.check(passage)
+                if owner is not None and owner != number:
+                    entries[number]['repeats'].add(owner)
+                    entries[owner]['also_in'].add(number)
+                    dropped += 1
+                    continue
+                index.add(passage, number)
+                kept.append(passage)
+                tokens_after += estimate_tokens(passage)
+            entries[number]['body'] = ' '.join(kept)[:self.PAGE_CONTEXT_CHARS]
+        
+        saved = tokens_before - tokens_after
+        metrics.inc('search_context_tokens_total', tokens_before)
+        metrics.inc('search_dedup_tokens_saved_total', saved)
+        if dropped:
+            logger.info(
+                f"🧹 Dropped {dropped} duplicate passage(s): "
+                f"~{saved} of {tokens_before} tokens ({saved / tokens_before:.0%})"
+            )
+        return entries
+
     def format_search_context_for_llm(self, query: str, results: List[Dict[str, Any]]) -> str:
-        """Format results with content for LLM (with current date)."""
+        """
+        Format results with content for LLM (with current date).
+        
+        The current date and time go last: they change every minute and
+        would otherwise invalidate the cached prompt prefix.
+        """
         if not results:
             return f"Поиск по запросу '{query}' не дал результатов."
         
@@ -276,25 +570,37 @@ class SearchService:
         
         logger.info(f"📋 Formatting {len(results)} results for LLM")
         
-        # Add current date/time to context
-        current_date = datetime.now().strftime("%d.%m.%Y")
-        current_time = datetime.now().strftime("%H:%M")
+        context = f"=== РЕЗУЛЬТАТЫ ПОИСКА: '{query}' ===\n\n"
         
-        context = f"=== ТЕКУЩАЯ ДАТА И ВРЕМЯ ===\n"
-        context += f"Сегодня: {current_date}, время: {current_time} (московское время)\n\n"
-        context += f"=== РЕЗУЛЬТАТЫ ПОИСКА: '{query}' ===\n\n"
-        
-        for result in results:
+        # Most relevant sources first
+        ranked = sorted(results, key=lambda r: r.get('score', 0), reverse=True)
+        entries = self._dedup_passages(ranked) if self.dedup_threshold > 0 else {}
+        for result in ranked:
+            entry = entries.get(result['number'])
+            body = entry['body'] if entry else result.get('body')
+            
             context += f"[Источник {result['number']}] {result['title']}\n"
             context += f"URL: {result['link']}\n"
             
-            if result.get('body'):
-                context += f"СОДЕРЖИМОЕ:\n{result['body']}\n"
+            if body:
+                context += f"СОДЕРЖИМОЕ:\n{body}\n"
+            
+            # Keep attribution of passages dropped as duplicates
+            if entry and entry['repeats']:
+                sources = ', '.join(str(n) for n in sorted(entry['repeats']))
+                context += f"ПОВТОРЯЕТ ИСТОЧНИКИ: {sources}\n"
+            if entry and entry['also_in']:
+                sources = ', '.join(str(n) for n in sorted(entry['also_in']))
+                context += f"ТАКЖЕ В ИСТОЧНИКАХ: {sources}\n"
             
             context += "-" * 80 + "\n\n"
         
-        context += "=== КОНЕЦ РЕЗУЛЬТАТОВ ===\n"
-        context += "ВАЖНО: Используй ТЕКУЩУЮ ДАТУ из контекста для формирования актуального ответа.\n"
+        context += "=== КОНЕЦ РЕЗУЛЬТАТОВ ===\n\n"
+        
+        # Add current date/time to context
+        now = datetime.now()
+        context += f"=== ТЕКУЩАЯ ДАТА И ВРЕМЯ ===\n"
+        context += f"Сегодня: {now.strftime('%d.%m.%Y')}, время: {now.strftime('%H:%M')} (московское время)\n"
         
         logger.info(f"✅ Context: {len(context)} chars")
         return context
@@ -0,0 +1,165 @@
+"""Semantic answer cache based on question embeddings."""
+
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+from config import Config
+from database.db_manager import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """
+    Cache of answers keyed by question embedding.
+    
+    Normalized question vectors live in a fixed-size float32 matrix that is
+    memory-mapped from a .npy file next to the database, so lookups are a
+    single matrix-vector product (cosine similarity) over all entries.
+    Questions and answers are stored in the semantic_cache table, keyed by
+    the matrix row (slot). When the cache is full, the oldest entry is
+    overwritten.
+    """
+
+    def __init__(self, config: Config, path: Optional[str] = None):
+        if not NUMPY_AVAILABLE:
+            raise ImportError(
+                "numpy is required for semantic cache. "
+                "Install with: pip install numpy"
+            )
+
+        self.threshold = config.SEMANTIC_CACHE_THRESHOLD
+        self.ttl = config.SEMANTIC_CACHE_TTL
+        self.capacity = config.SEMANTIC_CACHE_MAX_ENTRIES
+        self.path = path or f"{os.path.splitext(config.DATABASE_PATH)[0]}.semcache.npy"
+
+        self.db: Optional[DatabaseManager] = None
+        self._vectors = None  # np.memmap of shape (capacity, dim)
+        self._created = np.zeros(self.capacity, dtype=np.float64)
+        self._model_ids = np.full(self.capacity, -1, dtype=np.int32)
+        self._models: Dict[str, int] = {}
+        self._size = 0  # number of slots in use (entries are never removed)
+
+    async def load(self, db: DatabaseManager):
+        """Open vector file and load entry metadata from database"""
+        self.db = db
+
+        if os.path.exists(self.path):
+            try:
+                vectors = np.load(self.path, mmap_mode='r+')
+                if vectors.shape[0] == self.capacity and vectors.dtype == np.float32:
+                    self._vectors = vectors
+                else:
+                    logger.warning("Semantic cache size changed, starting with empty cache")
+            except Exception as e:
+                logger.error(f"Error opening semantic cache file: {e}")
+
+        if self._vectors is None:
+            await self.db.clear_semantic_cache()
+            logger.info("🧠 Semantic cache is empty")
+            return
+
+        for slot, model, created_at in await self.db.get_semantic_cache_entries():
+            if slot >= self.capacity:
+                continue
+            self._created[slot] = created_at
+            self._model_ids[slot] = self._model_id(model)
+            self._size = max(self._size, slot + 1)
+
+        logger.info(f"🧠 Semantic cache loaded: {self._size} entries")
+
+    def _model_id(self, model: str) -> int:
+        return self._models.setdefault(model, len(self._models))
+
+    def _normalize(self, vector: List[float]):
+        q = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        return q / norm if norm > 0 else q
+
+    def _open(self, dim: int):
+        """Create new empty vector file"""
+        self._vectors = np.lib.format.open_memmap(
+            self.path, mode='w+', dtype=np.float32, shape=(self.capacity, dim)
+        )
+        self._created[:] = 0
+        self._model_ids[:] = -1
+        self._size = 0
+
+    def _search(self, query, model: str) -> Tuple[int, float]:
+        """
+        Find most similar live entry of the model.
+        
+        Returns:
+            Tuple of (slot, cosine similarity), slot is -1 if nothing found
+        """
+        model_id = self._models.get(model)
+        if self._vectors is None or self._size == 0 or model_id is None:
+            return -1, 0.0
+        if query.shape[0] != self._vectors.shape[1]:
+            return -1, 0.0
+
+        size = self._size
+        scores = self._vectors[:size] @ query
+        live = (
+            (self._model_ids[:size] == model_id) &
+            (self._created[:size] >= time.time() - self.ttl)
+        )
+        scores = np.where(live, scores, -1.0)
+        slot = int(np.argmax(scores))
+        return slot, float(scores[slot])
+
+    async def lookup(self, vector: List[float], model: str) -> Optional[str]:
+        """Get cached answer for question similar enough to the given one"""
+        if self.db is None:
+            return None
+        slot, score = self._search(self._normalize(vector), model)
+        if slot < 0 or score < self.threshold:
+            return None
+
+        answer = await self.db.get_semantic_cache_answer(slot)
+        if answer is not None:
+            logger.info(f"🧠 Semantic cache hit (slot {slot}, similarity {score:.3f})")
+        return answer
+
+    async def add(self, question: str, vector: List[float], answer: str, model: str):
+        """Store answer to question"""
+        if self.db is None:
+            return
+        query = self._normalize(vector)
+
+        if self._vectors is None or self._vectors.shape[1] != query.shape[0]:
+            if self._vectors is not None:
+                logger.warning("Embedding dimension changed, resetting semantic cache")
+            self._open(query.shape[0])
+            await self.db.clear_semantic_cache()
+
+        if self._size < self.capacity:
+            slot = self._size
+            self._size += 1
+        else:
+            # Evict oldest entry (expired entries are always the oldest)
+            slot = int(np.argmin(self._created))
+
+        now = time.time()
+        self._vectors[slot] = query
+        self._created[slot] = now
+        self._model_ids[slot] = self._model_id(model)
+
+        await self.db.put_semantic_cache_entry(slot, question, answer, model, now)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def flush(self):
+        """Write vector changes to disk"""
+        if self._vectors is not None:
+            self._vectors.flush()
@@ -0,0 +1,186 @@
+"""Per-request usage ledger with hourly rollups."""
+
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import Config
+from database.db_manager import DatabaseManager
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Search pages and cache outcome of the request running in the current task,
+# picked up by the next generation recorded from it
+_request_usage: ContextVar[Optional[Dict[str, Any]]] = ContextVar('request_usage', default=None)
+
+
+def hour_of(timestamp: float) -> str:
+    """Local hour bucket of a timestamp, as in usage_hourly.hour"""
+    return time.strftime('%Y-%m-%d %H:00', time.localtime(timestamp))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+class UsageLedger:
+    """
+    Who uses the GPUs and how much.
+
+    Every generation (usage listener) becomes one ledger row: model, prompt
+    and eval tokens, prompt eval / eval / total duration, search pages
+    fetched and semantic cache outcome. Generations without a user
+    (background jobs) are booked to user 0.
+
+    record() only appends to a buffer; flush() runs periodically and on
+    shutdown and writes the buffered rows and their hourly rollups in one
+    transaction, so requests never wait for a commit. Raw rows are kept
+    `retention_days` (latency percentiles), rollups are kept for good.
+    """
+
+    # Rows kept in memory while the database is unavailable
+    MAX_BUFFER = 50000
+
+    def __init__(self, config: Config):
+        self.retention_days = config.USAGE_LEDGER_RETENTION_DAYS
+        self._buffer: List[tuple] = []
+
+    @staticmethod
+    def note(**fields: Any):
+        """
+        Attach request fields (search_pages, cache_hit) to the next
+        generation recorded from the current task.
+        """
+        usage = _request_usage.get()
+        if usage is None:
+            usage = {}
+            _request_usage.set(usage)
+        usage.update(fields)
+
+    def record(
+        self,
+        user_id: Optional[int],
+        model: str,
+        stats: Optional[Dict[str, Any]] = None,
+        search_pages: int = 0,
+        cache_hit: Optional[bool] = None
+    ):
+        """Buffer one request row (stats=None for answers served without a generation)"""
+        stats = stats or {}
+        self._buffer.append((
+            time.time(), user_id or 0, model,
+            stats.get('prompt_eval_count', 0), stats.get('eval_count', 0),
+            stats.get('prompt_eval_duration', 0) / 1e9, stats.get('eval_duration', 0) / 1e9,
+            stats.get('total_duration', 0) / 1e9,
+            search_pages, None if cache_hit is None else int(cache_hit)
+        ))
+        if len(self._buffer) > self.MAX_BUFFER:
+            del self._buffer[:len(self._buffer) - self.MAX_BUFFER]
+            metrics.inc('usage_ledger_dropped_total')
+
+    async def record_usage(self, user_id: Optional[int], model: str, stats: Dict[str, Any]):
+        """Record a generation with the fields noted for its request (usage listener)"""
+        usage = _request_usage.get() or {}
+        # Fields belong to the request's first generation only
+        _request_usage.set(None)
+        self.record(
+            user_id, model, stats,
+            usage.get('search_pages', 0), usage.get('cache_hit')
+        )
+
+    @staticmethod
+    def _rollup(rows: List[tuple]) -> List[tuple]:
+        """Sum rows per (hour, user, model) in usage_hourly column order"""
+        buckets: Dict[Tuple[str, int, str], List[float]] = {}
+        for (created_at, user_id, model, prompt_tokens, eval_tokens,
+             _, eval_seconds, total_seconds, search_pages, cache_hit) in rows:
+            bucket = buckets.setdefault((hour_of(created_at), user_id, model), [0] * 8)
+            bucket[0] += 1
+            bucket[1] += prompt_tokens
+            bucket[2] += eval_tokens
+            bucket[3] += eval_seconds
+            bucket[4] += total_seconds
+            bucket[5] += search_pages
+            bucket[6] += cache_hit == 1
+            bucket[7] += cache_hit == 0
+        return [key + tuple(values) for key, values in buckets.items()]
+
+    async def flush(self, db: DatabaseManager):
+        """Write buffered rows and their hourly rollups"""
+        rows, self._buffer = self._buffer, []
+        if not rows:
+            return
+        try:
+            await db.add_usage_rows(
+                rows, self._rollup(rows),
+                time.time() - self.retention_days * 86400 if self.retention_days > 0 else 0
+            )
+        except Exception:
+            self._buffer[:0] = rows
+            raise
+        metrics.inc('usage_ledger_rows_total', len(rows))
+        logger.debug(f"Flushed {len(rows)} usage row(s)")
+
+    async def report(self, db: DatabaseManager, hours: int, top: int = 10) -> str:
+        """Usage of the last `hours`: totals, top users and per-model throughput and latency"""
+        await self.flush(db)
+        now = time.time()
+        since = now - hours * 3600
+        hourly = await db.get_usage_hourly(hour_of(since))
+        latencies = await db.get_usage_latencies(since)
+
+        if not hourly:
+            return f"📊 За последние {hours} ч запросов не было."
+
+        users: Dict[int, Dict[str, float]] = {}
+        models: Dict[str, Dict[str, float]] = {}
+        totals = {'requests': 0, 'prompt_tokens': 0, 'eval_tokens': 0, 'total_seconds': 0.0,
+                  'search_pages': 0, 'cache_hits': 0, 'cache_misses': 0}
+        for row in hourly:
+            for name in totals:
+                totals[name] += row[name]
+            user = users.setdefault(row['user_id'], {'requests': 0, 'tokens': 0, 'total_seconds': 0.0})
+            user['requests'] += row['requests']
+            user['tokens'] += row['prompt_tokens'] + row['eval_tokens']
+            user['total_seconds'] += row['total_seconds']
+            model = models.setdefault(row['model'], {'requests': 0, 'eval_tokens': 0, 'eval_seconds': 0.0})
+            model['requests'] += row['requests']
+            model['eval_tokens'] += row['eval_tokens']
+            model['eval_seconds'] += row['eval_seconds']
+
+        lookups = totals['cache_hits'] + totals['cache_misses']
+        lines = [
+            f"📊 Использование за {hours} ч",
+            f"Запросов: {totals['requests']}, токенов: {totals['prompt_tokens']} запрос / "
+            f"{totals['eval_tokens']} ответ",
+            f"GPU: {totals['total_seconds'] / 60:.1f} мин, страниц поиска: {totals['search_pages']}",
+        ]
+        if lookups:
+            lines.append(f"Семантический кэш: {totals['cache_hits']}/{lookups} попаданий "
+                         f"({totals['cache_hits'] / lookups:.0%})")
+
+        lines += ["", "👤 Топ пользователей по GPU:"]
+        ranked = sorted(users.items(), key=lambda item: item[1]['total_seconds'], reverse=True)
+        for place, (user_id, user) in enumerate(ranked[:top], 1):
+            name = str(user_id) if user_id else "фоновые задачи"
+            lines.append(
+                f"{place}. {name}: {user['requests']} запр., {user['tokens']} ток., "
+                f"GPU {user['total_seconds'] / 60:.1f} мин"
+            )
+
+        lines += ["", "🤖 Модели:"]
+        for name, model in sorted(models.items(), key=lambda item: item[1]['requests'], reverse=True):
+            line = f"{name}: {model['requests']} запр."
+            if model['eval_seconds'] > 0:
+                line += f", {model['eval_tokens'] / model['eval_seconds']:.1f} ток/с"
+            values = sorted(latencies.get(name, []))
+            if values:
+                line += (
+                    f", время p50 {percentile(values, 50):.1f} с, "
+                    f"p95 {percentile(values, 95):.1f} с, p99 {percentile(values, 99):.1f} с"
+                )
+            lines.append(line)
+        return "\n".join(lines)
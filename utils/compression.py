@@ -0,0 +1,138 @@
+"""Compression of stored message bodies."""
+
+import logging
+import struct
+import zlib
+from typing import Dict, List, Optional, Union
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# First byte of a compressed body
+_ZLIB = 1
+_ZLIB_DICT = 2
+_ZSTD = 3
+_ZSTD_DICT = 4
+
+# zlib only looks back 32 KiB, a larger preset dictionary is useless
+ZLIB_DICT_SIZE = 32 * 1024
+# Dictionary IDs are stored as 2 bytes in the blob header
+MAX_DICT_ID = 0xFFFF
+
+
+class TextCompressor:
+    """
+    Compresses text into self-describing blobs.
+    
+    Short texts stay plain strings, so old uncompressed rows and new
+    compressed ones can live in the same column: str values are returned
+    as is, bytes values are decoded by their header. A shared dictionary
+    trained on stored messages makes compression of short chat messages
+    worthwhile; every blob records the dictionary ID it was made with.
+    """
+
+    CODECS = ('none', 'zlib', 'zstd')
+
+    def __init__(self, codec: str = 'none', min_size: int = 128, level: int = 6):
+        if codec == 'zstd' and not ZSTD_AVAILABLE:
+            logger.warning("zstandard is not installed, using zlib for history compression")
+            codec = 'zlib'
+        if codec not in self.CODECS:
+            logger.warning(f"Unknown compression codec '{codec}', compression disabled")
+            codec = 'none'
+        self.codec = codec
+        self.min_size = min_size
+        self.level = level
+        self._dictionaries: Dict[int, bytes] = {}
+        self._dict_id: Optional[int] = None
+        self._zstd_compressor = None
+        self._zstd_decompressors: Dict[int, object] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.codec != 'none'
+
+    @property
+    def has_dictionary(self) -> bool:
+        """A dictionary for the current codec is in use"""
+        return self._dict_id is not None
+
+    def add_dictionary(self, dict_id: int, data: bytes, current: bool = False):
+        """Register dictionary for decompression (and compression if current)"""
+        if dict_id > MAX_DICT_ID:
+            logger.warning(f"Compression dictionary #{dict_id} does not fit the blob header, ignored")
+            return
+        self._dictionaries[dict_id] = data
+        if current:
+            self._dict_id = dict_id
+            self._zstd_compressor = None
+
+    @classmethod
+    def train_dictionary(cls, codec: str, samples: List[str], size: int = 64 * 1024) -> bytes:
+        """Build shared dictionary from sample texts"""
+        encoded = [s.encode('utf-8') for s in samples if s]
+        if codec == 'zstd' and ZSTD_AVAILABLE:
+            return zstandard.train_dictionary(size, encoded).as_bytes()
+        # zlib: most recent samples at the end, where matches are cheapest
+        return b''.join(encoded)[-ZLIB_DICT_SIZE:]
+
+    def compress(self, text: str) -> Union[str, bytes]:
+        if not self.enabled or len(text) < self.min_size:
+            return text
+
+        raw = text.encode('utf-8')
+        dictionary = self._dictionaries.get(self._dict_id) if self._dict_id is not None else None
+
+        if self.codec == 'zstd':
+            if self._zstd_compressor is None:
+                zdict = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+                self._zstd_compressor = zstandard.ZstdCompressor(level=self.level, dict_data=zdict)
+            payload = self._zstd_compressor.compress(raw)
+            header = bytes([_ZSTD_DICT]) + struct.pack('>H', self._dict_id) if dictionary else bytes([_ZSTD])
+        else:
+            if dictionary:
+                compressor = zlib.compressobj(self.level, zdict=dictionary)
+                header = bytes([_ZLIB_DICT]) + struct.pack('>H', self._dict_id)
+            else:
+                compressor = zlib.compressobj(self.level)
+                header = bytes([_ZLIB])
+            payload = compressor.compress(raw) + compressor.flush()
+
+        blob = header + payload
+        # Not worth it (already compact or incompressible text)
+        return blob if len(blob) < len(raw) else text
+
+    def decompress(self, value: Union[str, bytes, None]) -> Optional[str]:
+        if value is None or isinstance(value, str):
+            return value
+
+        kind = value[0]
+        if kind in (_ZLIB_DICT, _ZSTD_DICT):
+            dict_id = struct.unpack('>H', value[1:3])[0]
+            dictionary = self._dictionaries[dict_id]
+            payload = value[3:]
+        else:
+            dictionary = None
+            payload = value[1:]
+
+        if kind in (_ZLIB, _ZLIB_DICT):
+            decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+            raw = decompressor.decompress(payload) + decompressor.flush()
+        elif kind in (_ZSTD, _ZSTD_DICT):
+            if not ZSTD_AVAILABLE:
+                raise RuntimeError("zstandard is required to read zstd-compressed history")
+            key = dict_id if dictionary else -1
+            decompressor = self._zstd_decompressors.get(key)
+            if decompressor is None:
+                zdict = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+                decompressor = self._zstd_decompressors[key] = zstandard.ZstdDecompressor(dict_data=zdict)
+            raw = decompressor.decompress(payload)
+        else:
+            raise ValueError(f"Unknown compressed body type: {kind}")
+
+        return raw.decode('utf-8')
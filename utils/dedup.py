@@ -0,0 +1,49 @@
+"""Near-duplicate text detection by word shingling."""
+
+import re
+from collections import Counter
+from typing import Dict, Generic, Hashable, Optional, Set, TypeVar
+
+Source = TypeVar('Source', bound=Hashable)
+
+
+def shingles(text: str, size: int = 4) -> Set[int]:
+    """Hashes of all `size`-word windows of normalized text"""
+    words = re.findall(r'\w+', text.lower())
+    if len(words) <= size:
+        return {hash(tuple(words))} if words else set()
+    return {hash(tuple(words[i:i + size])) for i in range(len(words) - size + 1)}
+
+
+class NearDuplicateIndex(Generic[Source]):
+    """
+    Finds passages already seen, word for word or nearly so.
+
+    A passage is a near-duplicate when at least `threshold` of its
+    shingles already belong to kept passages. Containment against all
+    kept shingles (rather than comparing passage pairs) also catches
+    syndicated copies whose passage boundaries are shifted, e.g. because
+    one site adds a lead sentence.
+    """
+
+    def __init__(self, threshold: float = 0.8, shingle_size: int = 4):
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self._owners: Dict[int, Source] = {}
+
+    def check(self, text: str) -> Optional[Source]:
+        """Return source that already contains the text, or None"""
+        text_shingles = shingles(text, self.shingle_size)
+        if not text_shingles:
+            return None
+        owners = Counter(
+            self._owners[s] for s in text_shingles if s in self._owners
+        )
+        if sum(owners.values()) / len(text_shingles) >= self.threshold:
+            return owners.most_common(1)[0][0]
+        return None
+
+    def add(self, text: str, source: Source):
+        """Register text as kept passage of source"""
+        for s in shingles(text, self.shingle_size):
+            self._owners.setdefault(s, source)
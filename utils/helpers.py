@@ -13,6 +13,35 @@ async def send_long_message(bot, chat_id: int, text: str, max_length: int = 4000
         await bot.send_message(chat_id, part)
 
 
+def estimate_tokens(text: str) -> int:
+    """Rough token count estimate (~4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+# Russian inflection endings, longest first
+_ENDINGS = tuple(sorted((
+    'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ых', 'их',
+    'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ой', 'ей', 'ом', 'ем', 'ах', 'ях',
+    'ов', 'ев', 'ую', 'юю', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'й', 'ь'
+), key=len, reverse=True))
+
+
+def stem_word(word: str) -> str:
+    """Crude stemmer: strip one Russian inflection ending, keeping at least 4 letters"""
+    word = word.lower()
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 4:
+            return word[:-len(ending)]
+    return word
+
+
+def format_eta(seconds: float) -> str:
+    """Human-readable wait time in Russian (e.g. '~3 мин')"""
+    if seconds < 60:
+        return f"~{max(1, round(seconds))} сек"
+    return f"~{round(seconds / 60)} мин"
+
+
 def format_messages_for_context(messages: List[dict]) -> str:
     """Format message history for context"""
     return "\n".join(
@@ -0,0 +1,105 @@
+"""
+HTML parsing used by the search service.
+
+Plain module-level functions of bytes in, small results out, so they can
+run in worker processes (see services/cpu_pool.py). The module imports
+only bs4, keeping worker start-up cheap.
+"""
+
+import re
+from typing import Any, Dict, Iterator, List, Optional
+
+from bs4 import BeautifulSoup
+
+# Removed before the main content is looked up
+NOISE_TAGS = ['script', 'style', 'nav', 'footer', 'header', 'aside', 'iframe']
+# First match is taken as the main content, <body> otherwise
+MAIN_CONTENT_SELECTORS = ['article', 'main', '[role="main"]', '.content', '.post-content', '#content']
+
+
+def extract_page_text(content: bytes, parser: str, max_chars: int) -> str:
+    """
+    Extract main text of an HTML page.
+
+    Returns:
+        Whitespace-normalized text, at most max_chars
+    """
+    soup = BeautifulSoup(content, parser)
+
+    # Remove unwanted elements
+    for element in soup(NOISE_TAGS):
+        element.decompose()
+
+    # Find main content
+    main_content = None
+    for selector in MAIN_CONTENT_SELECTORS:
+        main_content = soup.select_one(selector)
+        if main_content:
+            break
+
+    if not main_content:
+        main_content = soup.body if soup.body else soup
+
+    # Extract text
+    text = main_content.get_text(separator=' ', strip=True)
+    text = re.sub(r'\s+', ' ', text).strip()
+
+    return text[:max_chars]
+
+
+def iter_ddg_results(
+    content: bytes,
+    parser: str,
+    max_results: int,
+    encoding: Optional[str] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Parse results of a DuckDuckGo HTML results page, yielding each one
+    as soon as it is read.
+
+    Yields:
+        Results with number, title, link and body (snippet)
+    """
+    soup = BeautifulSoup(content, parser, from_encoding=encoding)
+    count = 0
+
+    for idx, result_div in enumerate(soup.find_all('div', class_='result'), 1):
+        try:
+            link_elem = result_div.find('a', class_='result__a')
+            if not link_elem:
+                continue
+
+            url = link_elem.get('href', '')
+            if not url or not url.startswith('http'):
+                continue
+
+            title = link_elem.get_text(strip=True)
+            if not title:
+                title = f"Result {idx}"
+
+            snippet_elem = result_div.find('a', class_='result__snippet')
+            snippet = snippet_elem.get_text(strip=True) if snippet_elem else ""
+        except Exception:
+            # One malformed result must not lose the whole page
+            continue
+
+        count += 1
+        yield {
+            'number': count,
+            'title': title[:200],
+            'link': url,
+            'body': snippet
+        }
+
+        if count >= max_results:
+            break
+
+
+def parse_ddg_results(
+    content: bytes,
+    parser: str,
+    max_results: int,
+    encoding: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """All results of iter_ddg_results() at once (for worker processes)"""
+    return list(iter_ddg_results(content, parser, max_results, encoding))
@@ -0,0 +1,46 @@
+"""In-process counters and gauges."""
+
+import threading
+from typing import Dict
+
+
+class Metrics:
+    """Named counters (monotonic) and gauges (last value)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+
+    def inc(self, name: str, value: float = 1):
+        """Increase counter"""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def set(self, name: str, value: float):
+        """Set gauge value"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def get(self, name: str, default: float = 0) -> float:
+        with self._lock:
+            return self._gauges.get(name, self._counters.get(name, default))
+
+    def snapshot(self) -> Dict[str, float]:
+        """All counters and gauges"""
+        with self._lock:
+            return {**self._counters, **self._gauges}
+
+    def format(self) -> str:
+        """One `name value` line per metric, sorted by name"""
+        lines = []
+        for name, value in sorted(self.snapshot().items()):
+            if isinstance(value, float) and not value.is_integer():
+                lines.append(f"{name} {value:.3f}")
+            else:
+                lines.append(f"{name} {int(value)}")
+        return "\n".join(lines)
+
+
+# Shared registry of the bot process
+metrics = Metrics()
@@ -0,0 +1,40 @@
+"""Startup timing of imports and initialization steps."""
+
+import importlib
+import logging
+import time
+from contextlib import contextmanager
+from typing import List, Tuple
+
+
+class StartupProfile:
+    """Records how long each import and initialization step takes"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.steps: List[Tuple[str, float]] = []
+
+    @contextmanager
+    def measure(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - start))
+
+    def import_module(self, name: str):
+        """Import module and record import time"""
+        with self.measure(f"import {name}"):
+            return importlib.import_module(name)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def report(self, logger: logging.Logger, detailed: bool = False):
+        """Log total startup time (and every step if detailed)"""
+        logger.info(f"🚀 Startup: {self.elapsed * 1000:.0f} ms to polling")
+        if not detailed:
+            return
+        for name, duration in sorted(self.steps, key=lambda step: step[1], reverse=True):
+            logger.info(f"   {duration * 1000:8.1f} ms  {name}")